@@ -1,8 +1,361 @@
+import os
 import re
+import sys
+import csv
+import glob
+import gzip
+import json
+import math
+import time
+import argparse
+from array import array
 from collections import defaultdict
 import statistics
 from datetime import datetime
 
+import numpy as np
+
+# Every analysis is done in a single pass over the logs. A line only goes through a
+# regex once a cheap substring test says it can match, and the regex is then matched
+# at the service name right before the label instead of searched through the line.
+log_line_pattern = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})")
+metric_pattern = re.compile(r"(\w+#\d+)\s+(TTFB|processing time):\s+([\d.-]+)")
+usage_pattern = re.compile(
+    r"(\w+#\d+) usage: prompt tokens: (\d+), cached tokens: (\d+), "
+    r"completion tokens: (\d+)"
+)
+link_pattern = re.compile(r"Linking (\w+#\d+)(?:::\w+)? -> (\w+#\d+)")
+call_pattern = re.compile(r"Call ([0-9a-f]+) (started|ended)(?: after ([\d.]+)s)?")
+runner_pattern = re.compile(r"Runner \S+ (started|finished) running (PipelineTask#\d+)")
+# The loggers of the lines about the calls and their pipelines, right after the
+# timestamp and the level: "2025-10-15 17:59:48.987 | DEBUG    | <logger>".
+LOGGER_COLUMN = 37
+SESSION_LOGGERS = (
+    "sessions:session:",
+    "pipecat.pipeline.runner:run:",
+    "pipecat.processors.frame_processor:link:",
+)
+START_BLOCK = "End of Turn result: EndOfTurnState.COMPLETE"
+END_BLOCK = "Bot started speaking"
+
+
+def open_log(path):
+    """Opens a log file for reading, decompressing it if it's gzipped."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", errors="replace")
+    return open(path, "r", errors="replace")
+
+
+def iter_log_files(paths):
+    """
+    Expands files, globs and directories (their `*.log*` files) into the log
+    files to read, oldest first so rotated logs are read in order.
+
+    Args:
+        paths (list): Paths, glob patterns or directories.
+
+    Returns:
+        list: The log file paths.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, "*.log*"))
+        elif glob.has_magic(path):
+            files += glob.glob(path)
+        else:
+            files.append(path)
+    existing = [f for f in dict.fromkeys(files) if os.path.isfile(f)]
+    for path in files:
+        if path not in existing:
+            print(f"Error: Log file not found at '{path}'")
+    return sorted(existing, key=lambda f: (os.path.getmtime(f), f))
+
+
+def log_time(line):
+    """Returns the timestamp at the start of a log line (epoch seconds), or NaN."""
+    try:
+        return datetime.fromisoformat(line[:23]).timestamp()
+    except ValueError:
+        return math.nan
+
+
+class MetricSeries:
+    """
+    The samples of one metric of one service and the time they were logged,
+    stored as packed doubles so millions of them stay small and turn into NumPy
+    arrays without a copy per sample.
+    """
+
+    def __init__(self):
+        self._values = array("d")
+        self._times = array("d")
+
+    def add(self, value, at=math.nan):
+        self._values.append(value)
+        self._times.append(at)
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def values(self):
+        return np.frombuffer(self._values, dtype=np.float64).copy()
+
+    @property
+    def times(self):
+        return np.frombuffer(self._times, dtype=np.float64).copy()
+
+
+class LogAnalyzer:
+    """
+    Collects the service metrics, the token usage, the blocks from 'End of Turn'
+    to 'Bot started speaking' and the calls in a single pass over the logs.
+
+    Lines logged during a call are tagged with its id (`sessions.tag_log_lines`),
+    which splits a log shared by concurrent calls. Older logs without the tags
+    have a session per PipelineTask instead, and their metrics go to the task
+    their service was linked to.
+
+    Args:
+        details (bool): Also keep the metrics of each block and the ones logged
+            between blocks, for the block-by-block analysis.
+    """
+
+    def __init__(self, details=False):
+        self.details = details
+        self.lines = 0
+        self.metrics = defaultdict(lambda: defaultdict(MetricSeries))
+        self.generations = []
+        self.blocks = []
+        self.sessions = []
+        self.outside = []  # Metrics logged since the last block ended
+        self._last_ttfb = {}
+        self._open_blocks = {}  # By call id, None outside of calls
+        self._open_sessions = {}
+        self._waiting_for_task = []  # Calls whose PipelineTask hasn't started
+        self._turn_analyzer = set()  # Calls whose turns end with the turn analyzer
+        self._links = {}  # Union-find of the linked processors and their call
+
+    def feed(self, lines):
+        """Analyzes an iterable of log lines."""
+        for line in lines:
+            self.lines += 1
+            if "TTFB:" in line:
+                self._metric(line, line.find("TTFB:"))
+            elif "processing time:" in line:
+                self._metric(line, line.find("processing time:"))
+            elif " usage: " in line:
+                self._usage(line, line.find(" usage: "))
+            elif "End of Turn result" in line:
+                self._end_of_turn(line)
+            elif "User stopped speaking" in line:
+                self._user_stopped(line)
+            elif END_BLOCK in line:
+                self._bot_started(line)
+            elif line.startswith(SESSION_LOGGERS, LOGGER_COLUMN):
+                if "Linking " in line:
+                    self._link(line)
+                else:
+                    self._session_event(line)
+
+    def feed_file(self, path):
+        with open_log(path) as f:
+            self.feed(f)
+
+    def feed_paths(self, paths):
+        """Analyzes every log file in `paths` (see iter_log_files)."""
+        for path in iter_log_files(paths):
+            self.feed_file(path)
+        return self
+
+    def _find(self, node):
+        root = node
+        while self._links.get(root, root) != root:
+            root = self._links[root]
+        while node != root:
+            node, self._links[node] = self._links[node], root
+        return root
+
+    def _union(self, a, b):
+        self._links[self._find(a)] = self._find(b)
+
+    def _tag(self, line):
+        """The call a line is tagged with, if it's in progress."""
+        start = line.find(" - [")
+        if start >= 0:
+            call_id = line[start + 4 : line.find("] ", start)]
+            if call_id in self._open_sessions:
+                return call_id
+        return None
+
+    def _call_id(self, line, service=None):
+        """The call a line belongs to: its tag, its service's call or the only one."""
+        if not self._open_sessions:
+            return None
+        call_id = self._tag(line)
+        if call_id is not None:
+            return call_id
+        if service is not None and service in self._links:
+            root = self._find(service)
+            for call_id in self._open_sessions:
+                if self._find(call_id) == root:
+                    return call_id
+        if len(self._open_sessions) == 1:
+            return next(iter(self._open_sessions))
+        return None
+
+    def _metric(self, line, label):
+        match = metric_pattern.match(line, line.rfind(" ", 0, label - 1) + 1)
+        if not match:
+            return
+        service, name, raw = match.groups()
+        value = float(raw)
+        metric = "TTFB" if name == "TTFB" else "processing_time"
+        # Negative values (timing artifacts) are kept, metric_stats counts them apart.
+        self.metrics[service][metric].add(value, log_time(line))
+        if metric == "TTFB" and "LLMService#" in service:
+            self._last_ttfb[service] = value
+        if not self.details:
+            return
+        block = self._open_blocks.get(self._call_id(line, service))
+        if block is not None:
+            block["metrics"].append((metric, service, value))
+        else:
+            self.outside.append((name, service, raw))
+
+    def _usage(self, line, label):
+        match = usage_pattern.match(line, line.rfind(" ", 0, label) + 1)
+        if not match:
+            return
+        service, prompt, cached, completion = match.groups()
+        self.generations.append(
+            {
+                "service": service,
+                "prompt_tokens": int(prompt),
+                "cached_tokens": int(cached),
+                "completion_tokens": int(completion),
+                "ttfb": self._last_ttfb.pop(service, None),
+            }
+        )
+
+    def _end_of_turn(self, line):
+        call_id = self._call_id(line)
+        self._turn_analyzer.add(call_id)
+        if START_BLOCK in line:
+            self._start_block(line, call_id)
+
+    def _user_stopped(self, line):
+        # Without a turn analyzer (e.g. on Twilio) the turn ends with the VAD.
+        call_id = self._call_id(line)
+        if call_id not in self._turn_analyzer:
+            self._start_block(line, call_id)
+
+    def _start_block(self, line, call_id):
+        time_match = log_line_pattern.match(line)
+        if call_id in self._open_blocks or not time_match:
+            return
+        block = {
+            "call_id": call_id,
+            "start_time": datetime.fromisoformat(time_match.group(1)),
+        }
+        if self.details:
+            block["metrics"] = []
+            block["before"] = self.outside
+            self.outside = []
+        self._open_blocks[call_id] = block
+
+    def _bot_started(self, line):
+        call_id = self._call_id(line)
+        time_match = log_line_pattern.match(line)
+        if not time_match:
+            return
+        timestamp = datetime.fromisoformat(time_match.group(1))
+        session = self._open_sessions.get(call_id)
+        if session is not None and session["greeting"] is None:
+            session["greeting"] = (timestamp - session["start_time"]).total_seconds()
+
+        block = self._open_blocks.pop(call_id, None)
+        if block is None:
+            return
+        block["end_time"] = timestamp
+        block["duration"] = (timestamp - block["start_time"]).total_seconds()
+        self.blocks.append(block)
+        if session is not None:
+            session["block_times"].append(block["duration"])
+            block["turn"] = len(session["block_times"])
+
+    def _link(self, line):
+        match = link_pattern.search(line)
+        if not match:
+            return
+        call_id = self._tag(line)
+        for processor in match.groups():
+            self._union(processor, call_id or match.group(1))
+
+    def _session_event(self, line):
+        time_match = log_line_pattern.match(line)
+        match = call_pattern.search(line)
+        if match:
+            call_id, event, duration = match.groups()
+        elif (match := runner_pattern.search(line)) and self._tag(line) is None:
+            event, call_id = match.groups()
+            duration = None
+            # Untagged calls get the next task that starts, and its services.
+            if event == "started" and self._waiting_for_task:
+                self._union(call_id, self._waiting_for_task.pop(0))
+                return
+        else:
+            return
+        if not time_match:
+            return
+        timestamp = datetime.fromisoformat(time_match.group(1))
+
+        if event == "started":
+            session = {
+                "call_id": call_id,
+                "start_time": timestamp,
+                "end_time": None,
+                "duration": None,
+                "greeting": None,
+                "block_times": [],
+            }
+            self.sessions.append(session)
+            self._open_sessions[call_id] = session
+            if match.re is call_pattern:
+                self._waiting_for_task.append(call_id)
+            return
+
+        session = self._open_sessions.pop(call_id, None)
+        if session is None:
+            return
+        if call_id in self._waiting_for_task:
+            self._waiting_for_task.remove(call_id)
+        self._open_blocks.pop(call_id, None)
+        self._turn_analyzer.discard(call_id)
+        session["end_time"] = timestamp
+        session["duration"] = (
+            float(duration)
+            if duration
+            else (timestamp - session["start_time"]).total_seconds()
+        )
+
+
+def analyze_logs(paths, details=False):
+    """
+    Analyzes log files, globs or directories (plain or gzipped) in a single pass.
+
+    Args:
+        paths (str or list): The log paths.
+        details (bool): Keep the metrics of each block, see LogAnalyzer.
+
+    Returns:
+        LogAnalyzer: The collected metrics, generations and blocks.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    return LogAnalyzer(details).feed_paths(paths)
+
 
 def parse_log_metrics(log_file_path="logs.log"):
     """
@@ -12,39 +365,81 @@ def parse_log_metrics(log_file_path="logs.log"):
         log_file_path (str): The path to the log file.
 
     Returns:
-        dict: A dictionary containing the parsed metrics.
+        dict: A MetricSeries per service and metric.
     """
-    # Regex to capture service name and metric value from log lines
-    ttfb_pattern = re.compile(r"(\w+#\d+)\s+TTFB:\s+([\d.]+)")
-    processing_time_pattern = re.compile(r"(\w+#\d+)\s+processing time:\s+([\d.]+)")
+    if not iter_log_files([log_file_path]):
+        return None
+    return analyze_logs(log_file_path).metrics
 
-    metrics = defaultdict(lambda: defaultdict(list))
 
-    try:
-        with open(log_file_path, "r") as f:
-            for line in f:
-                ttfb_match = ttfb_pattern.search(line)
-                if ttfb_match:
-                    service, value = ttfb_match.groups()
-                    metrics[service]["TTFB"].append(float(value))
-
-                processing_time_match = processing_time_pattern.search(line)
-                if processing_time_match:
-                    service, value = processing_time_match.groups()
-                    metrics[service]["processing_time"].append(float(value))
-    except FileNotFoundError:
-        print(f"Error: Log file not found at '{log_file_path}'")
-        return None
+def metric_stats(values):
+    """
+    Summarizes the samples of a metric. Negative values are timing artifacts: they
+    are counted apart and left out of the statistics.
 
-    return metrics
+    Args:
+        values (array-like): The samples, in seconds.
+
+    Returns:
+        dict: The count, negative count, total, avg, min, p50, p90, p95, p99 and max.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = values[values >= 0]
+    stats = {"count": len(valid), "negative": len(values) - len(valid)}
+    if len(valid):
+        p50, p90, p95, p99 = np.percentile(valid, [50, 90, 95, 99])
+        stats.update(
+            total=float(valid.sum()),
+            avg=float(valid.mean()),
+            min=float(valid.min()),
+            p50=p50,
+            p90=p90,
+            p95=p95,
+            p99=p99,
+            max=float(valid.max()),
+        )
+    return stats
+
+
+def metric_outliers(series, limit=10):
+    """
+    Finds the samples far above the rest, beyond the 3 IQR fence over the 75th
+    percentile.
 
+    Args:
+        series (MetricSeries): The samples of a metric.
+        limit (int): The maximum number of outliers returned.
 
-def print_metrics_summary(metrics):
+    Returns:
+        list: (time, value) of the largest outliers, largest first.
+    """
+    values, times = series.values, series.times
+    valid = values >= 0
+    if not valid.any():
+        return []
+    q1, q3 = np.percentile(values[valid], [25, 75])
+    outliers = np.flatnonzero(values > q3 + 3 * (q3 - q1))
+    largest = outliers[np.argsort(values[outliers])[::-1][:limit]]
+    return [(times[i], values[i]) for i in largest]
+
+
+def print_histogram(values, bins=10, width=40):
+    """Prints a text histogram of the non-negative samples."""
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values[values >= 0], bins=bins)
+    for count, low, high in zip(counts, edges, edges[1:]):
+        bar = "#" * int(round(width * count / max(counts.max(), 1)))
+        print(f"    {low:8.4f}-{high:8.4f}s {count:>8} {bar}".rstrip())
+
+
+def print_metrics_summary(metrics, histograms=False, outliers=0):
     """
     Prints a formatted summary of the collected metrics.
 
     Args:
         metrics (dict): The metrics dictionary from parse_log_metrics.
+        histograms (bool): Also print a histogram of every metric.
+        outliers (int): List up to this many outliers of every metric.
     """
     if not metrics:
         print("No metrics found in the log file.")
@@ -56,17 +451,309 @@ def print_metrics_summary(metrics):
     for service, service_metrics in sorted(metrics.items()):
         print(f"\nService: {service}")
         print("-" * 30)
-        for metric_name, values in sorted(service_metrics.items()):
-            if values:
-                print(f"  Metric: {metric_name}")
-                print(f"    Count: {len(values)}")
-                print(f"    Total: {sum(values):.4f}s")
-                print(f"    Avg:   {statistics.mean(values):.4f}s")
-                print(f"    Min:   {min(values):.4f}s")
-                print(f"    Max:   {max(values):.4f}s")
+        for metric_name, series in sorted(service_metrics.items()):
+            stats = metric_stats(series.values)
+            print(f"  Metric: {metric_name}")
+            if stats["negative"]:
+                print(f"    Negative: {stats['negative']} (timing artifacts, ignored)")
+            if not stats["count"]:
+                continue
+            print(f"    Count: {stats['count']}")
+            print(f"    Total: {stats['total']:.4f}s")
+            print(f"    Avg:   {stats['avg']:.4f}s")
+            print(f"    Min:   {stats['min']:.4f}s")
+            for p in ("p50", "p90", "p95", "p99"):
+                print(f"    {p}:   {stats[p]:.4f}s")
+            print(f"    Max:   {stats['max']:.4f}s")
+            if histograms:
+                print_histogram(series.values)
+            for at, value in metric_outliers(series, outliers) if outliers else []:
+                when = "unknown time" if math.isnan(at) else datetime.fromtimestamp(at)
+                print(f"    Outlier: {value:.4f}s at {when}")
+    print("\n" + "=" * 50)
+
+
+def export_metrics(metrics, path):
+    """
+    Writes every sample (service, metric, time, value) to a CSV or, for a
+    `.parquet` path, a Parquet file (which needs pyarrow). The time is in epoch
+    seconds and negative values are kept, for the dashboards to filter.
+
+    Args:
+        metrics (dict): The metrics dictionary from parse_log_metrics.
+        path (str): The output path.
+    """
+    series = [
+        (service, metric_name, samples)
+        for service, service_metrics in sorted(metrics.items())
+        for metric_name, samples in sorted(service_metrics.items())
+    ]
+
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {
+            "service": [s for s, _, samples in series for _ in range(len(samples))],
+            "metric": [m for _, m, samples in series for _ in range(len(samples))],
+            "time": np.concatenate([np.empty(0)] + [s.times for *_, s in series]),
+            "value": np.concatenate([np.empty(0)] + [s.values for *_, s in series]),
+        }
+        pq.write_table(pa.table(columns), path)
+        return
+
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerow(["service", "metric", "time", "value"])
+        # Service and metric names never need quoting, so the rows are formatted
+        # directly (the logs have ms timestamps and µs values), several times
+        # faster than csv.writer on millions of samples.
+        for service, metric_name, samples in series:
+            prefix = f"{service},{metric_name},"
+            f.writelines(
+                f"{prefix}{t:.3f},{v:.6f}\n"
+                for t, v in zip(samples.times.tolist(), samples.values.tolist())
+            )
+
+
+def parse_token_usage(log_file_path="logs.log"):
+    """
+    Parses the LLM token usage lines logged by `observers.UsageObserver`,
+    pairing each generation with the LLM TTFB logged before it.
+
+    Args:
+        log_file_path (str): The path to the log file.
+
+    Returns:
+        list: One dict per generation with the service, prompt, cached and
+        completion tokens and the TTFB (None if it wasn't logged).
+    """
+    if not iter_log_files([log_file_path]):
+        return None
+    return analyze_logs(log_file_path).generations
+
+
+def print_token_usage_summary(generations):
+    """
+    Prints how much of the prompt was served from the provider's cache,
+    and the LLM TTFB with and without a cache hit.
+
+    Args:
+        generations (list): The list returned by parse_token_usage.
+    """
+    if not generations:
+        print("No token usage found in the log file.")
+        return
+
+    prompt_tokens = sum(g["prompt_tokens"] for g in generations)
+    cached_tokens = sum(g["cached_tokens"] for g in generations)
+
+    print("\n💾 Prompt Caching Summary 💾")
+    print("=" * 50)
+    print(f"  Generations:    {len(generations)}")
+    print(f"  Prompt tokens:  {prompt_tokens}")
+    print(f"  Cached tokens:  {cached_tokens} ({cached_tokens / prompt_tokens:.1%})")
+
+    for label, cached in (("cache hit", True), ("cache miss", False)):
+        ttfbs = [
+            g["ttfb"]
+            for g in generations
+            if g["ttfb"] is not None
+            and g["ttfb"] > 0
+            and (g["cached_tokens"] > 0) == cached
+        ]
+        if ttfbs:
+            print(
+                f"  Avg TTFB ({label}): {statistics.mean(ttfbs):.4f}s over {len(ttfbs)}"
+            )
+    print("=" * 50)
+
+
+def parse_log_blocks(log_file_path="logs.log"):
+    """
+    Parses the blocks from 'End of Turn' to 'Bot started speaking', the same
+    blocks printed by analyze_log_blocks.
+
+    Args:
+        log_file_path (str): The path to the log file.
+
+    Returns:
+        list: One dict per block with its start and end time and its duration.
+    """
+    if not iter_log_files([log_file_path]):
+        return None
+    return analyze_logs(log_file_path).blocks
+
+
+def print_block_summary(blocks):
+    """
+    Prints the distribution of the block times.
+
+    Args:
+        blocks (list): The blocks from parse_log_blocks or LogAnalyzer.
+    """
+    if not blocks:
+        print("No blocks found in the log file.")
+        return
+
+    stats = metric_stats([b["duration"] for b in blocks])
+    print("\n⏱️ Block Time Summary ⏱️")
+    print("=" * 50)
+    print(f"  Blocks: {stats['count']}")
+    print(f"  Avg:    {stats['avg']:.4f}s")
+    print(f"  Min:    {stats['min']:.4f}s")
+    for p in ("p50", "p90", "p95", "p99"):
+        print(f"  {p}:    {stats[p]:.4f}s")
+    print(f"  Max:    {stats['max']:.4f}s")
+    print("=" * 50)
+
+
+def _short_id(call_id):
+    # PipelineTask#N for the logs from before the calls had ids.
+    return call_id if "#" in call_id else call_id[:12]
+
+
+def print_log_blocks(analyzer):
+    """
+    Prints detailed metrics for each block, and the metrics logged between them.
+
+    Args:
+        analyzer (LogAnalyzer): An analyzer run with `details=True`.
+    """
+    print("\n🔎 Block-by-Block Analysis 🔎")
+    print("=" * 50)
+
+    for block_count, block in enumerate(analyzer.blocks, 1):
+        for name, service, value in block["before"]:
+            print(f"    - {service:<22} {name}: {value}s")
+
+        call = ""
+        if block.get("turn"):
+            call = f" (call {_short_id(block['call_id'])}, turn {block['turn']})"
+        print(f"\n--- Block #{block_count}{call} ---")
+
+        sum_ttfb = sum(v for m, s, v in block["metrics"] if m == "TTFB" and v > 0)
+        sum_processing = sum(
+            v for m, s, v in block["metrics"] if m == "processing_time" and v > 0
+        )
+
+        print(f"  Total Block Time: {block['duration']:.4f}s")
+        print(f"  Sum of TTFB:      {sum_ttfb:.4f}s")
+        print(f"  Sum of Proc Time: {sum_processing:.4f}s")
+        print("  Individual Metrics:")
+
+        if not block["metrics"]:
+            print("    No metrics found in this block.")
+        else:
+            for metric_name, service, value in block["metrics"]:
+                # Ignore negative TTFB values which can appear due to timing artifacts
+                if metric_name == "TTFB" and value < 0:
+                    continue
+                print(f"    - {service:<22} {metric_name:<15}: {value:.4f}s")
+        print()
+
+    for name, service, value in analyzer.outside:
+        print(f"    - {service:<22} {name}: {value}s")
+
     print("\n" + "=" * 50)
 
 
+def _stats_line(values):
+    stats = metric_stats(values)
+    if not stats["count"]:
+        return "-"
+    return (
+        f"avg {stats['avg']:.3f}s, p50 {stats['p50']:.3f}s, p90 {stats['p90']:.3f}s, "
+        f"p99 {stats['p99']:.3f}s, max {stats['max']:.3f}s"
+    )
+
+
+def print_call_summary(sessions, per_call=False):
+    """
+    Prints the statistics of every call and their aggregate: duration, turns,
+    time to the first greeting and block times.
+
+    Args:
+        sessions (list): The calls found by LogAnalyzer.
+        per_call (bool): Also print a line per call.
+    """
+    if not sessions:
+        print("No calls found in the log file.")
+        return
+
+    print("\n📞 Call Summary 📞")
+    print("=" * 50)
+    if per_call:
+        for session in sessions:
+            duration, greeting = session["duration"], session["greeting"]
+            line = (
+                f"  {_short_id(session['call_id']):<14} "
+                f"{session['start_time']:%Y-%m-%d %H:%M:%S}  "
+                f"{'in progress' if duration is None else f'{duration:.1f}s':>11}, "
+                f"{len(session['block_times'])} turns, greeting "
+                f"{'-' if greeting is None else f'{greeting:.3f}s'}"
+            )
+            if session["block_times"]:
+                stats = metric_stats(session["block_times"])
+                line += (
+                    f", block p50 {stats['p50']:.3f}s, p90 {stats['p90']:.3f}s, "
+                    f"max {stats['max']:.3f}s"
+                )
+            print(line)
+        print("-" * 50)
+
+    ended = [s["duration"] for s in sessions if s["duration"] is not None]
+    turns = [len(s["block_times"]) for s in sessions]
+    greetings = [s["greeting"] for s in sessions if s["greeting"] is not None]
+    block_times = [t for s in sessions for t in s["block_times"]]
+    # The typical block time of each call, to tell a few slow calls from slow turns.
+    call_medians = [
+        statistics.median(s["block_times"]) for s in sessions if s["block_times"]
+    ]
+    print(
+        f"  Calls:          {len(sessions)} ({len(sessions) - len(ended)} in progress)"
+    )
+    print(f"  Duration:       {_stats_line(ended)}")
+    print(
+        f"  Turns per call: avg {statistics.mean(turns):.1f}, "
+        f"median {statistics.median(turns):g}, max {max(turns)}"
+    )
+    print(f"  First greeting: {_stats_line(greetings)}")
+    print(f"  Block time:     {_stats_line(block_times)} ({len(block_times)} turns)")
+    print(f"  Call medians:   {_stats_line(call_medians)}")
+    print("=" * 50)
+
+
+def export_calls(sessions, path):
+    """
+    Writes a CSV row per call, to compare days and deployments.
+
+    Args:
+        sessions (list): The calls found by LogAnalyzer.
+        path (str): The output path.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["call_id", "start_time", "duration", "turns", "greeting"]
+            + ["block_avg", "block_p50", "block_p90", "block_max"]
+        )
+        for session in sessions:
+            stats = metric_stats(session["block_times"])
+            writer.writerow(
+                [
+                    session["call_id"],
+                    session["start_time"].isoformat(),
+                    session["duration"],
+                    len(session["block_times"]),
+                    session["greeting"],
+                ]
+                + [
+                    round(stats[k], 4) if k in stats else None
+                    for k in ("avg", "p50", "p90", "max")
+                ]
+            )
+
+
 def analyze_log_blocks(log_file_path="logs.log"):
     """
     Analyzes log blocks from 'End of Turn' to 'Bot started speaking'
@@ -75,115 +762,191 @@ def analyze_log_blocks(log_file_path="logs.log"):
     Args:
         log_file_path (str): The path to the log file.
     """
-    # Regex to capture timestamps and specific log events
-    log_line_pattern = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})")
-    start_block_pattern = re.compile(r"End of Turn result: EndOfTurnState\.COMPLETE")
-    end_block_pattern = re.compile(r"Bot started speaking")
-    ttfb_pattern = re.compile(r"(\w+#\d+)\s+TTFB:\s+([\d.-]+)")
-    processing_time_pattern = re.compile(r"(\w+#\d+)\s+processing time:\s+([\d.-]+)")
+    if not iter_log_files([log_file_path]):
+        return
+    print_log_blocks(analyze_logs(log_file_path, details=True))
 
-    in_block = False
-    block_count = 0
-    current_block = {}
 
-    print("\n🔎 Block-by-Block Analysis 🔎")
-    print("=" * 50)
+def parse_timeline(timeline_path="timeline.jsonl"):
+    """
+    Reads the per-turn timelines written by `observers.TurnTimelineObserver`.
 
+    Args:
+        timeline_path (str): The path to the JSON Lines file.
+
+    Returns:
+        list: One dict per turn, with its call id, turn number and events.
+    """
+    turns = []
     try:
-        with open(log_file_path, "r") as f:
+        with open(timeline_path, "r") as f:
             for line in f:
-                time_match = log_line_pattern.match(line)
-                if not time_match:
-                    continue
+                try:
+                    turns.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+    except FileNotFoundError:
+        print(f"Error: Timeline file not found at '{timeline_path}'")
+        return None
 
-                timestamp_str = time_match.group(1)
-                timestamp = datetime.fromisoformat(timestamp_str)
-
-                # --- Start of a new block ---
-                if start_block_pattern.search(line) and not in_block:
-                    in_block = True
-                    block_count += 1
-                    current_block = {
-                        "start_time": timestamp,
-                        "metrics": [],
-                    }
-
-                # --- Inside a block, collect metrics ---
-                if in_block:
-                    ttfb_match = ttfb_pattern.search(line)
-                    if ttfb_match:
-                        service, value = ttfb_match.groups()
-                        current_block["metrics"].append(("TTFB", service, float(value)))
-
-                    processing_time_match = processing_time_pattern.search(line)
-                    if processing_time_match:
-                        service, value = processing_time_match.groups()
-                        current_block["metrics"].append(
-                            ("processing_time", service, float(value))
-                        )
-                else:
-                    ttfb_match = ttfb_pattern.search(line)
-                    if ttfb_match:
-                        service, value = ttfb_match.groups()
-                        print(f"    - {service:<22} TTFB: {value}s")
-
-                    processing_time_match = processing_time_pattern.search(line)
-                    if processing_time_match:
-                        service, value = processing_time_match.groups()
-                        print(f"    - {service:<22} processing time: {value}s")
-
-                # --- End of the block ---
-                if end_block_pattern.search(line) and in_block:
-                    in_block = False
-                    current_block["end_time"] = timestamp
-
-                    # --- Print summary for the completed block ---
-                    print(f"\n--- Block #{block_count} ---")
-
-                    # Calculate total time and sums
-                    total_duration = (
-                        current_block["end_time"] - current_block["start_time"]
-                    ).total_seconds()
-                    sum_ttfb = sum(
-                        v
-                        for m, s, v in current_block["metrics"]
-                        if m == "TTFB" and v > 0
-                    )
-                    sum_processing = sum(
-                        v
-                        for m, s, v in current_block["metrics"]
-                        if m == "processing_time" and v > 0
-                    )
-
-                    print(f"  Total Block Time: {total_duration:.4f}s")
-                    print(f"  Sum of TTFB:      {sum_ttfb:.4f}s")
-                    print(f"  Sum of Proc Time: {sum_processing:.4f}s")
-                    print("  Individual Metrics:")
-
-                    if not current_block["metrics"]:
-                        print("    No metrics found in this block.")
-                    else:
-                        for metric_name, service, value in current_block["metrics"]:
-                            # Ignore negative TTFB values which can appear due to timing artifacts
-                            if metric_name == "TTFB" and value < 0:
-                                continue
-                            print(
-                                f"    - {service:<22} {metric_name:<15}: {value:.4f}s"
-                            )
-
-                    current_block = {}  # Reset for next block
-                    print()
+    return turns
 
-    except FileNotFoundError:
-        print(f"Error: Log file not found at '{log_file_path}'")
+
+def timeline_metrics(turns):
+    """
+    Collects the TTFB and processing time of every service from the timelines,
+    in the same shape as parse_log_metrics.
+
+    Args:
+        turns (list): The list returned by parse_timeline.
+
+    Returns:
+        dict: A dictionary containing the metrics.
+    """
+    names = {"ttfb": "TTFB", "processing_time": "processing_time"}
+    metrics = defaultdict(lambda: defaultdict(MetricSeries))
+    for turn in turns:
+        for event in turn["events"]:
+            if event["name"] in names:
+                metrics[event["processor"]][names[event["name"]]].add(
+                    event["value"], turn["call_started_at"] + event["t"]
+                )
+    return metrics
+
+
+def timeline_blocks(turns):
+    """
+    Finds the block of every turn in the timelines: from the end of turn to the
+    bot starting to speak, the same blocks as parse_log_blocks.
+
+    Args:
+        turns (list): The list returned by parse_timeline.
+
+    Returns:
+        list: One dict per block with its call id, turn, start and end time,
+        duration, time since the VAD stop, metrics and tool calls.
+    """
+    blocks = []
+    for turn in turns:
+        events = turn["events"]
+        bot_started = next((e["t"] for e in events if e["name"] == "bot_started"), None)
+        if bot_started is None:
+            continue
+        before = [e for e in events if e["t"] <= bot_started]
+        end_of_turn = [e["t"] for e in before if e["name"] == "end_of_turn"]
+        if not end_of_turn:
+            continue  # The greeting
+        vad_stopped = [e["t"] for e in before if e["name"] == "vad_stopped"]
+        start = turn["call_started_at"] + end_of_turn[-1]
+        end = turn["call_started_at"] + bot_started
+        blocks.append(
+            {
+                "call_id": turn["call_id"],
+                "turn": turn["turn"],
+                "start_time": datetime.fromtimestamp(start),
+                "end_time": datetime.fromtimestamp(end),
+                "duration": bot_started - end_of_turn[-1],
+                "from_vad": bot_started - vad_stopped[-1] if vad_stopped else None,
+                "metrics": [
+                    (e["name"], e["processor"], e["value"])
+                    for e in events
+                    if e["name"] in ("ttfb", "processing_time")
+                ],
+                "tool_calls": [
+                    e["function"] for e in events if e["name"] == "tool_call"
+                ],
+            }
+        )
+    return blocks
+
+
+def analyze_timeline(timeline_path="timeline.jsonl"):
+    """
+    Prints the block-by-block analysis of analyze_log_blocks from the timelines.
+
+    Args:
+        timeline_path (str): The path to the JSON Lines file.
+    """
+    turns = parse_timeline(timeline_path)
+    if turns is None:
         return
 
+    print("\n🔎 Block-by-Block Analysis 🔎")
+    print("=" * 50)
+    for block in timeline_blocks(turns):
+        print(f"\n--- Call {block['call_id']}, turn #{block['turn']} ---")
+        ttfbs = [v for m, s, v in block["metrics"] if m == "ttfb" and v > 0]
+        processing = [v for m, s, v in block["metrics"] if m == "processing_time"]
+        print(f"  Total Block Time: {block['duration']:.4f}s")
+        if block["from_vad"] is not None:
+            print(f"  From VAD stop:    {block['from_vad']:.4f}s")
+        print(f"  Sum of TTFB:      {sum(ttfbs):.4f}s")
+        print(f"  Sum of Proc Time: {sum(processing):.4f}s")
+        if block["tool_calls"]:
+            print(f"  Tool calls:       {', '.join(block['tool_calls'])}")
+        print("  Individual Metrics:")
+        for metric_name, service, value in block["metrics"]:
+            if metric_name == "ttfb" and value < 0:
+                continue
+            print(f"    - {service:<22} {metric_name:<15}: {value:.4f}s")
     print("\n" + "=" * 50)
 
 
 if __name__ == "__main__":
-    log_metrics = parse_log_metrics()
-    if log_metrics:
-        print_metrics_summary(log_metrics)
-
-    analyze_log_blocks()
+    parser = argparse.ArgumentParser(
+        description="Latency metrics, token usage and block times from bot logs."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["logs.log"],
+        help="Log files (plain or .gz), globs or directories, or a timeline .jsonl",
+    )
+    parser.add_argument(
+        "--blocks", action="store_true", help="Print the block-by-block analysis"
+    )
+    parser.add_argument(
+        "--histograms", action="store_true", help="Print a histogram of every metric"
+    )
+    parser.add_argument(
+        "--outliers", type=int, default=0, help="List up to N outliers per metric"
+    )
+    parser.add_argument(
+        "--export", help="Write every sample to a .csv or .parquet file"
+    )
+    parser.add_argument(
+        "--calls", action="store_true", help="Print the statistics of every call"
+    )
+    parser.add_argument("--export-calls", help="Write a row per call to a .csv file")
+    args = parser.parse_args()
+
+    # The timelines written by TurnTimelineObserver (TIMELINE_FILE).
+    if args.paths[0].endswith(".jsonl"):
+        turns = parse_timeline(args.paths[0])
+        if turns:
+            metrics = timeline_metrics(turns)
+            print_metrics_summary(metrics, args.histograms, args.outliers)
+            if args.export:
+                export_metrics(metrics, args.export)
+            analyze_timeline(args.paths[0])
+        sys.exit()
+
+    start = time.perf_counter()
+    analyzer = analyze_logs(args.paths, details=args.blocks)
+    elapsed = time.perf_counter() - start
+
+    print_metrics_summary(analyzer.metrics, args.histograms, args.outliers)
+    if args.export:
+        export_metrics(analyzer.metrics, args.export)
+    print_token_usage_summary(analyzer.generations)
+    print_block_summary(analyzer.blocks)
+    print_call_summary(analyzer.sessions, args.calls)
+    if args.export_calls:
+        export_calls(analyzer.sessions, args.export_calls)
+    if args.blocks:
+        print_log_blocks(analyzer)
+
+    print(
+        f"\n{analyzer.lines} lines in {elapsed:.2f}s "
+        f"({analyzer.lines / max(elapsed, 1e-9):,.0f} lines/sec)"
+    )
@@ -0,0 +1,448 @@
+import argparse
+import asyncio
+import gzip
+import os
+import random
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import yaml
+
+import analyze_logs
+import sessions
+import utils
+from notifications import NotificationOutbox, SMTPConnectionPool, build_email
+
+
+def print_latencies(name, latencies):
+    """Prints a latency summary (in milliseconds) for a list of durations in seconds."""
+    latencies = sorted(latencies)
+
+    def p(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    print(f"{name}")
+    print(f"    Count: {len(latencies)}")
+    print(f"    Avg:   {statistics.mean(latencies) * 1000:.3f}ms")
+    print(f"    p50:   {p(0.50):.3f}ms")
+    print(f"    p99:   {p(0.99):.3f}ms")
+    print(f"    Max:   {latencies[-1] * 1000:.3f}ms")
+
+
+######## Register answer ########
+
+
+async def _fake_call(directory, call_id, answers_per_call, latencies):
+    state = utils.ClaimState(os.path.join(directory, f"claim_{call_id}.yaml"))
+    handler = utils.register_answer_func(state)
+    keys = [q["key"] for q in utils.get_questions()]
+
+    async def result_callback(result):
+        pass
+
+    for i in range(answers_per_call):
+        params = SimpleNamespace(
+            arguments={"key": keys[i % len(keys)], "answer": f"answer {i}"},
+            result_callback=result_callback,
+        )
+        start = time.perf_counter()
+        await handler(params)
+        latencies.append(time.perf_counter() - start)
+        # Leave room for the other calls, like a real conversation would.
+        await asyncio.sleep(0)
+    await state.finalize()
+
+
+async def bench_register_answer(calls, answers_per_call):
+    """Measures the `register_answer` handler latency with many concurrent calls."""
+    latencies = []
+    with tempfile.TemporaryDirectory() as directory:
+        # Notifications are queued as usual but never leave the process.
+        outbox = NotificationOutbox(os.path.join(directory, "outbox"), notifiers={})
+        utils.get_outbox = lambda: outbox
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _fake_call(directory, i, answers_per_call, latencies)
+                for i in range(calls)
+            )
+        )
+        total = time.perf_counter() - start
+        await outbox.stop()
+    print_latencies(f"register_answer handler ({calls} concurrent calls)", latencies)
+    print(f"    Total: {total:.3f}s (including final compaction)")
+
+
+######## SMTP ########
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept logins and messages, with a simulated handshake cost."""
+
+    handshake_delay = 0.05
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        # Stand-in for the TLS handshake of a real server.
+        time.sleep(self.handshake_delay)
+        self.reply("220 fake SMTP ready")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-fake")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command.startswith("AUTH"):
+                self.reply("235 Authentication successful")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.reply("250 OK")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+def bench_smtp(messages, handshake_delay):
+    """Compares a new SMTP connection per claim (the old behaviour) with the pool."""
+    FakeSMTPHandler.handshake_delay = handshake_delay
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeSMTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    os.environ.setdefault("SENDER_EMAIL", "bot@example.com")
+    os.environ.setdefault("RECIPIENT_EMAIL", "claims@example.com")
+    message = build_email([{"status": "open"}])
+
+    def new_pool():
+        return SMTPConnectionPool(host, port, "user", "password", use_ssl=False)
+
+    # One connection (handshake + login) per claim.
+    start = time.perf_counter()
+    handshakes = 0
+    for _ in range(messages):
+        pool = new_pool()
+        pool.send_message(message)
+        handshakes += pool.handshakes
+        pool.close()
+    elapsed = time.perf_counter() - start
+    print("SMTP, connection per claim")
+    print(f"    Messages/sec: {messages / elapsed:.1f}")
+    print(f"    Handshakes:   {handshakes}")
+
+    pool = new_pool()
+    start = time.perf_counter()
+    for _ in range(messages):
+        pool.send_message(message)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    print("SMTP, pooled connection")
+    print(f"    Messages/sec: {messages / elapsed:.1f}")
+    print(f"    Handshakes:   {pool.handshakes}")
+
+    server.shutdown()
+
+
+######## Model pool ########
+
+
+async def bench_model_pool(calls):
+    """Compares call setup (VAD + turn analyzer) with and without the warm pools."""
+    # Imported here so the other benchmarks don't pay for loading pipecat's models.
+    import pools
+
+    vad_pool, turn_pool = pools.get_vad_pool(), pools.get_turn_pool()
+
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        vad_pool.factory()
+        turn_pool.factory()
+        latencies.append(time.perf_counter() - start)
+    print_latencies("Call setup, loading the models per call", latencies)
+
+    vad_pool.warm()
+    turn_pool.warm()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        async with vad_pool.checkout(), turn_pool.checkout():
+            latencies.append(time.perf_counter() - start)
+    print_latencies("Call setup, warm pools", latencies)
+    print(f"    VAD pool:  {vad_pool.metrics()}")
+    print(f"    Turn pool: {turn_pool.metrics()}")
+
+
+######## Context ########
+
+HOLD_TRANSCRIPT = (
+    "Thank you for calling. All of our representatives are currently assisting "
+    "other customers. Your call is important to us, please stay on the line and "
+    "your call will be answered in the order it was received."
+)
+
+
+async def _llm_ttfb(client, model, messages):
+    start = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model=model, messages=messages, stream=True, max_tokens=16
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            break
+    ttfb = time.perf_counter() - start
+    await stream.close()
+    return ttfb
+
+
+async def bench_context(turns, max_tokens, keep_turns, model):
+    """Compares the LLM TTFB of a long call (e.g. on hold) with a growing and a bounded context."""
+    # Imported here so the other benchmarks don't need pipecat or an OpenAI key.
+    from openai import AsyncOpenAI
+    from pipecat.processors.aggregators.llm_context import LLMContext
+    from compaction import ContextCompactor, estimate_tokens
+
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    system = {"role": "system", "content": utils.get_system_prompt()}
+    full = [system]
+    context = LLMContext([system])
+
+    with tempfile.TemporaryDirectory() as directory:
+        state = utils.ClaimState(os.path.join(directory, "claim.yaml"))
+        compactor = ContextCompactor(context, state, max_tokens, keep_turns)
+        full_ttfbs, bounded_ttfbs = [], []
+        print("Turn  Full tokens  Full TTFB  Bounded tokens  Bounded TTFB")
+        for turn in range(1, turns + 1):
+            user = {"role": "user", "content": HOLD_TRANSCRIPT}
+            full.append(user)
+            context.add_message(user)
+            # In a call the compaction runs while the user is still speaking.
+            if task := compactor.maybe_compact():
+                await task
+
+            full_ttfbs.append(await _llm_ttfb(client, model, full))
+            bounded = context.get_messages()
+            bounded_ttfbs.append(await _llm_ttfb(client, model, bounded))
+            print(
+                f"{turn:4d}  {estimate_tokens(full):11d}  {full_ttfbs[-1]:8.3f}s"
+                f"  {estimate_tokens(bounded):14d}  {bounded_ttfbs[-1]:11.3f}s"
+            )
+
+            assistant = {"role": "assistant", "content": "Sure, I'll wait."}
+            full.append(assistant)
+            context.add_message(assistant)
+        await state.finalize()
+
+    half = turns // 2
+    print_latencies("LLM TTFB, full context (first half)", full_ttfbs[:half])
+    print_latencies("LLM TTFB, full context (second half)", full_ttfbs[half:])
+    print_latencies("LLM TTFB, bounded context (first half)", bounded_ttfbs[:half])
+    print_latencies("LLM TTFB, bounded context (second half)", bounded_ttfbs[half:])
+    print(f"    Compactions: {compactor.compactions}")
+
+
+######## Concurrent calls ########
+
+
+async def _session_call(manager, answers_per_call, per_call, rejected):
+    try:
+        async with manager.session() as session:
+            handler = utils.register_answer_func(session.state)
+            keys = [q["key"] for q in utils.get_questions()]
+
+            @session.dispatcher.event_handler("call_ended")
+            async def on_call_ended(context):
+                await session.state.finalize()
+
+            async def result_callback(result):
+                pass
+
+            latencies = []
+            for i in range(answers_per_call):
+                # Every answer carries the call id, to spot answers in the wrong register.
+                params = SimpleNamespace(
+                    arguments={
+                        "key": keys[i % len(keys)],
+                        "answer": f"{session.call_id} answer {i}",
+                    },
+                    result_callback=result_callback,
+                )
+                start = time.perf_counter()
+                await handler(params)
+                latencies.append(time.perf_counter() - start)
+                # The other side of the call talking.
+                await asyncio.sleep(random.uniform(0, 0.01))
+            await session.dispatcher.dispatch("call_ended", session.context)
+            per_call[session.call_id] = (session.state.filename, latencies)
+    except sessions.CallLimitReached:
+        rejected.append(1)
+
+
+async def bench_calls(calls, max_calls, answers_per_call):
+    """Runs many fake calls in parallel through the session manager."""
+    per_call, rejected = {}, []
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = NotificationOutbox(os.path.join(directory, "outbox"), notifiers={})
+        utils.get_outbox = lambda: outbox
+        registers = os.path.join(directory, "registers")
+        sessions.create_claim_state = lambda call_id: utils.create_claim_state(
+            call_id, registers
+        )
+        manager = sessions.SessionManager(max_calls=max_calls)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _session_call(manager, answers_per_call, per_call, rejected)
+                for _ in range(calls)
+            )
+        )
+        total = time.perf_counter() - start
+        await outbox.stop()
+
+        # Each register must only hold answers of its own call.
+        cross_talk = 0
+        for call_id, (filename, _) in per_call.items():
+            with open(filename) as f:
+                answers = yaml.safe_load(f) or {}
+            cross_talk += sum(not str(a).startswith(call_id) for a in answers.values())
+        files = len(os.listdir(registers))
+
+    print(f"Concurrent calls ({calls} calls, limit {max_calls})")
+    print(f"    Admitted:   {len(per_call)}")
+    print(f"    Rejected:   {len(rejected)}")
+    print(f"    Registers:  {files}")
+    print(f"    Cross-talk: {cross_talk} answers in the wrong register")
+    print(f"    Total:      {total:.3f}s")
+    latencies = [l for _, call_latencies in per_call.values() for l in call_latencies]
+    print_latencies("register_answer handler, all calls", latencies)
+    p50s = [statistics.median(l) for _, l in per_call.values()]
+    print_latencies("register_answer handler, per-call median", p50s)
+
+
+######## Log analysis ########
+
+
+def _old_log_analysis(path):
+    """The analysis before the single pass: every regex on every line, read twice."""
+    import re
+
+    ttfb = re.compile(r"(\w+#\d+)\s+TTFB:\s+([\d.-]+)")
+    processing_time = re.compile(r"(\w+#\d+)\s+processing time:\s+([\d.-]+)")
+    usage = re.compile(r"(\w+#\d+) usage: prompt tokens: (\d+)")
+    timestamp = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})")
+    start_block = re.compile(r"End of Turn result: EndOfTurnState\.COMPLETE")
+    end_block = re.compile(r"Bot started speaking")
+
+    found = 0
+    with analyze_logs.open_log(path) as f:
+        for line in f:
+            for pattern in (ttfb, processing_time, usage):
+                found += pattern.search(line) is not None
+    with analyze_logs.open_log(path) as f:
+        for line in f:
+            if timestamp.match(line):
+                for pattern in (start_block, end_block, ttfb, processing_time):
+                    found += pattern.search(line) is not None
+    return found
+
+
+def _write_synthetic_log(path, size_mb, example="data/example.log"):
+    with open(example, "rb") as f:
+        chunk = f.read()
+    copies = max(1, size_mb * 1024 * 1024 // len(chunk))
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as f:
+        for _ in range(copies):
+            f.write(chunk)
+
+
+def bench_logs(size_mb, skip_old):
+    """Lines/sec of the log analysis on a synthetic log made of copies of example.log."""
+    with tempfile.TemporaryDirectory() as directory:
+        plain = os.path.join(directory, "synthetic.log")
+        zipped = plain + ".gz"
+        _write_synthetic_log(plain, size_mb)
+        _write_synthetic_log(zipped, size_mb)
+        print(f"Synthetic log: {os.path.getsize(plain) / 1024 ** 2:.0f} MB")
+
+        runs = [("single pass", plain), ("single pass, gzipped", zipped)]
+        for name, path in runs:
+            start = time.perf_counter()
+            analyzer = analyze_logs.analyze_logs(path)
+            elapsed = time.perf_counter() - start
+            print(f"Log analysis, {name}")
+            print(f"    Lines/sec: {analyzer.lines / elapsed:,.0f}")
+            print(f"    Blocks:    {len(analyzer.blocks)}")
+
+        series = [s for m in analyzer.metrics.values() for s in m.values()]
+        start = time.perf_counter()
+        for samples in series:
+            analyze_logs.metric_stats(samples.values)
+            analyze_logs.metric_outliers(samples)
+        elapsed = time.perf_counter() - start
+        print("Metric percentiles and outliers")
+        print(f"    Samples:   {sum(len(s) for s in series):,}")
+        print(f"    Time:      {elapsed * 1000:.1f}ms")
+
+        if not skip_old:
+            start = time.perf_counter()
+            _old_log_analysis(plain)
+            elapsed = time.perf_counter() - start
+            print("Log analysis, two passes with every regex on every line")
+            print(f"    Lines/sec: {analyzer.lines / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the bot.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    register_parser = subparsers.add_parser("register_answer")
+    register_parser.add_argument("--calls", type=int, default=100)
+    register_parser.add_argument("--answers", type=int, default=10)
+
+    smtp_parser = subparsers.add_parser("smtp")
+    smtp_parser.add_argument("--messages", type=int, default=50)
+    smtp_parser.add_argument("--handshake-delay", type=float, default=0.05)
+
+    model_pool_parser = subparsers.add_parser("model_pool")
+    model_pool_parser.add_argument("--calls", type=int, default=20)
+
+    context_parser = subparsers.add_parser("context")
+    context_parser.add_argument("--turns", type=int, default=40)
+    context_parser.add_argument("--max-tokens", type=int, default=1500)
+    context_parser.add_argument("--keep-turns", type=int, default=4)
+    context_parser.add_argument("--model", default="gpt-4.1")
+
+    calls_parser = subparsers.add_parser("calls")
+    calls_parser.add_argument("--calls", type=int, default=200)
+    calls_parser.add_argument("--max-calls", type=int, default=150)
+    calls_parser.add_argument("--answers", type=int, default=10)
+
+    logs_parser = subparsers.add_parser("logs")
+    logs_parser.add_argument("--size-mb", type=int, default=2048)
+    logs_parser.add_argument("--skip-old", action="store_true")
+
+    args = parser.parse_args()
+    if args.benchmark == "register_answer":
+        asyncio.run(bench_register_answer(args.calls, args.answers))
+    elif args.benchmark == "smtp":
+        bench_smtp(args.messages, args.handshake_delay)
+    elif args.benchmark == "model_pool":
+        asyncio.run(bench_model_pool(args.calls))
+    elif args.benchmark == "context":
+        asyncio.run(
+            bench_context(args.turns, args.max_tokens, args.keep_turns, args.model)
+        )
+    elif args.benchmark == "calls":
+        asyncio.run(bench_calls(args.calls, args.max_calls, args.answers))
+    elif args.benchmark == "logs":
+        bench_logs(args.size_mb, args.skip_old)
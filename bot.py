@@ -1,30 +1,45 @@
+import argparse
 import os
-
-from pipecat.audio.vad.vad_analyzer import VADParams
-
-from utils import EventDispatcher, get_system_prompt, get_tools
-from pipecat.processors.aggregators.llm_context import LLMContext
+import sys
+from contextlib import AsyncExitStack
+
+from compaction import get_context_compactor
+from dialog import get_scripted_dialog
+from notifications import get_outbox, release_outbox_claims
+from observers import FirstAudioObserver, UsageObserver, get_turn_timeline
+from pools import get_turn_pool, get_vad_pool
+from recording import get_call_recorder
+from speculation import SpeculationTrigger, SpeculativeOpenAILLMService
+from tts import CachedCartesiaTTSService, get_phrase_cache, get_text_aggregator
+from sessions import (
+    CallLimitReached,
+    CallSession,
+    get_session_manager,
+    tag_log_lines,
+)
+from utils import get_answer_listener, get_tools, recover_claim_journals
 from pipecat.adapters.schemas.tools_schema import ToolsSchema
 from pipecat.processors.aggregators.llm_response_universal import (
     LLMContextAggregatorPair,
 )
 from pipecat.runner.utils import create_transport
-from pipecat.audio.turn.smart_turn.local_smart_turn_v3 import LocalSmartTurnAnalyzerV3
 from pipecat.transports.base_transport import TransportParams
 
 from dotenv import load_dotenv
 from loguru import logger
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.frames.frames import EndFrame, LLMRunFrame
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.processors.frameworks.rtvi import RTVIConfig, RTVIObserver, RTVIProcessor
-from pipecat.runner.types import RunnerArguments
+from pipecat.runner.types import (
+    RunnerArguments,
+    SmallWebRTCRunnerArguments,
+    WebSocketRunnerArguments,
+)
 from pipecat.runner.utils import parse_telephony_websocket
 from pipecat.serializers.twilio import TwilioFrameSerializer
-from pipecat.services.cartesia.tts import CartesiaTTSService
 from pipecat.services.deepgram.stt import DeepgramSTTService
 from pipecat.services.openai.llm import OpenAILLMService
 from pipecat.transports.base_transport import BaseTransport
@@ -34,51 +49,94 @@ from pipecat.transports.websocket.fastapi import (
 )
 
 load_dotenv(override=True)
+# Log lines carry the id of their call, see analyze_logs.py.
+tag_log_lines()
+# Point every provider at the local fakes in `fakes.py`, e.g. for benchmarks.
+if os.getenv("FAKE_PROVIDERS_URL"):
+    from fakes import FakeProviders
+
+    os.environ.update(FakeProviders.env(os.environ["FAKE_PROVIDERS_URL"]))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-async def run_bot(transport: BaseTransport):
-    logger.info(f"Starting bot")
+async def run_bot(transport: BaseTransport, session: CallSession):
+    logger.info(f"Starting bot for call {session.call_id}")
 
     # Initialize the STT, TTS, LLM, and RTVI services.
-    stt = DeepgramSTTService(api_key=os.getenv("DEEPGRAM_API_KEY"))
-    tts = CartesiaTTSService(
+    # The provider URLs can be overridden (OPENAI_BASE_URL is read by the OpenAI
+    # client itself), FAKE_PROVIDERS_URL sets all of them.
+    stt = DeepgramSTTService(
+        api_key=os.getenv("DEEPGRAM_API_KEY"), base_url=os.getenv("DEEPGRAM_URL", "")
+    )
+    tts = CachedCartesiaTTSService(
+        phrase_cache=get_phrase_cache(),
         api_key=os.getenv("CARTESIA_API_KEY"),
+        url=os.getenv("CARTESIA_URL", "wss://api.cartesia.ai/tts/websocket"),
         voice_id="e07c00bc-4134-4eae-9ea4-1a55fb45746b",
+        # Start speaking as soon as the first clause of the LLM response is ready.
+        text_aggregator=get_text_aggregator(),
     )
     # stt = OpenAISTTService(api_key=OPENAI_API_KEY)
     # tts = OpenAITTSService(api_key=OPENAI_API_KEY)
-    llm = OpenAILLMService(api_key=OPENAI_API_KEY, model="gpt-4.1")
+    # With LLM_SPECULATION=true the LLM starts generating on the user's transcript
+    # before the turn analyzer has decided that the turn is over.
+    speculative = os.getenv("LLM_SPECULATION", "false").lower() == "true"
+    llm_class = SpeculativeOpenAILLMService if speculative else OpenAILLMService
+    llm = llm_class(api_key=OPENAI_API_KEY, model="gpt-4.1")
     rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
 
-    # Set up the initial LLM context with a system prompt and tools.
-    dispatcher = EventDispatcher()
-    system_prompt = get_system_prompt()
-    messages = [{"role": "system", "content": system_prompt}]
-    tools = ToolsSchema(standard_tools=get_tools(llm, dispatcher))
-    context = LLMContext(messages, tools)
+    # The call's own context (with the system prompt), register and dispatcher.
+    dispatcher, state, context = session.dispatcher, session.state, session.context
+    claim_number = session.claim_number
+    context.set_tools(ToolsSchema(standard_tools=get_tools(llm, dispatcher, state)))
     context_aggregator = LLMContextAggregatorPair(context)
 
+    # Optional side-channel that extracts answers from the user transcriptions.
+    answer_listener = get_answer_listener(context, state, dispatcher)
+    speculation_trigger = SpeculationTrigger(llm, context) if speculative else None
+    # Summarizes the oldest turns of long calls, see CONTEXT_MAX_TOKENS.
+    context_compactor = get_context_compactor(context, state)
+    # With DIALOG_MODE=scripted the scripted steps are spoken without the LLM.
+    scripted_dialog = get_scripted_dialog(context, state, dispatcher, claim_number)
+    # With RECORD_CALLS=true both sides of the call are recorded, time-aligned.
+    recorder = get_call_recorder(session.call_id)
+
     pipeline = Pipeline(
         [
             transport.input(),  # Transport user input
+            *([recorder.input_tap()] if recorder else []),  # Caller recording
             rtvi,  # RTVI processor
             stt,
+            *([answer_listener] if answer_listener else []),  # Answer extraction
+            *([speculation_trigger] if speculation_trigger else []),  # Speculation
             context_aggregator.user(),  # User responses
+            *([context_compactor] if context_compactor else []),  # Bounded context
+            *([scripted_dialog] if scripted_dialog else []),  # Scripted steps
             llm,  # LLM
             tts,  # TTS
             transport.output(),  # Transport bot output
+            *([recorder.output_tap()] if recorder else []),  # Bot recording
             context_aggregator.assistant(),  # Assistant spoken responses
         ]
     )
 
+    first_audio = FirstAudioObserver(
+        turn_kind=(lambda: scripted_dialog.turn_kind) if scripted_dialog else None
+    )
+    # Structured per-turn timeline, written to TIMELINE_FILE.
+    timeline = get_turn_timeline(session.call_id)
     task = PipelineTask(
         pipeline,
         params=PipelineParams(
             enable_metrics=True,
             enable_usage_metrics=True,
         ),
-        observers=[RTVIObserver(rtvi)],
+        observers=[
+            RTVIObserver(rtvi),
+            *([timeline] if timeline else []),
+            UsageObserver(),
+            first_audio,
+        ],
     )
 
     @dispatcher.event_handler("hang_up")
@@ -99,34 +157,89 @@ async def run_bot(transport: BaseTransport):
 
     runner = PipelineRunner(handle_sigint=False)
 
-    await runner.run(task)
+    try:
+        await runner.run(task)
+    finally:
+        # Even if the pipeline failed: the register is compacted (or extracted)
+        # now rather than at the next start.
+        if timeline:
+            timeline.finish()
+        await dispatcher.dispatch("call_ended", context)
+    if recorder:
+        logger.info(f"Call recorded to {await recorder.save()}")
+    logger.info(first_audio.report())
+    logger.info(f"TTS phrase cache: {get_phrase_cache().metrics()}")
+    if speculative:
+        logger.info(llm.report())
+    logger.info(f"Event listener latencies:\n{dispatcher.latency_report()}")
 
 
 async def bot(runner_args: RunnerArguments):
     """Main bot entry point for the bot starter."""
 
-    common_transport_params = {
-        "audio_in_enabled": True,
-        "audio_out_enabled": True,
-        "vad_analyzer": SileroVADAnalyzer(
-            params=VADParams(stop_secs=0.3, start_secs=0.0)
-        ),
-    }
-    transport_params = {
-        "webrtc": lambda: TransportParams(
-            **common_transport_params,
-            turn_analyzer=LocalSmartTurnAnalyzerV3(),
-        ),
-        "twilio": lambda: FastAPIWebsocketParams(
-            **common_transport_params,
-        ),
-    }
-    transport = await create_transport(runner_args, transport_params)
-
-    await run_bot(transport)
+    # The development runner has no startup hook: on the first call, deliver what
+    # previous runs left in the outbox (starting it again does nothing).
+    await get_outbox().start()
+
+    async with AsyncExitStack() as stack:
+        # Every call gets its own session, over MAX_CONCURRENT_CALLS it's refused.
+        try:
+            session = await stack.enter_async_context(get_session_manager().session())
+        except CallLimitReached as e:
+            logger.warning(f"Rejecting call: {e}")
+            if isinstance(runner_args, WebSocketRunnerArguments):
+                await runner_args.websocket.close()
+            return
+
+        # The VAD and turn analyzers are checked out of warm pools instead of loading
+        # their models on every call, and returned when the call ends.
+        vad_analyzer = await stack.enter_async_context(get_vad_pool().checkout())
+        turn_analyzer = None
+        if isinstance(runner_args, SmallWebRTCRunnerArguments):
+            turn_analyzer = await stack.enter_async_context(get_turn_pool().checkout())
+
+        common_transport_params = {
+            "audio_in_enabled": True,
+            "audio_out_enabled": True,
+            "vad_analyzer": vad_analyzer,
+        }
+        transport_params = {
+            "webrtc": lambda: TransportParams(
+                **common_transport_params,
+                turn_analyzer=turn_analyzer,
+            ),
+            "twilio": lambda: FastAPIWebsocketParams(
+                **common_transport_params,
+            ),
+        }
+        transport = await create_transport(runner_args, transport_params)
+
+        await run_bot(transport, session)
+
+    logger.info(f"VAD pool: {get_vad_pool().metrics()}")
+    logger.info(f"Turn analyzer pool: {get_turn_pool().metrics()}")
+    logger.info(f"Call sessions: {get_session_manager().metrics()}")
+
+
+def serves_webrtc(argv: list[str]) -> bool:
+    """Whether the development runner will serve WebRTC calls (its default transport).
+
+    Only WebRTC calls use the turn analyzer, so it's the only case where warming
+    the Smart Turn models at startup pays off.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-t", "--transport", default="webrtc")
+    parser.add_argument("-d", "--direct", action="store_true")
+    args, _ = parser.parse_known_args(argv)
+    return args.transport == "webrtc" and not args.direct
 
 
 if __name__ == "__main__":
     from pipecat.runner.run import main
 
+    recover_claim_journals()
+    release_outbox_claims()
+    get_vad_pool().warm()
+    if serves_webrtc(sys.argv[1:]):
+        get_turn_pool().warm()
     main()
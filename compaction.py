@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import asyncio
+from loguru import logger
+from openai import AsyncOpenAI
+
+from pipecat.frames.frames import Frame, LLMContextFrame
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from utils import ClaimState, format_transcript, get_extraction_mode
+
+######## Context Compaction ########
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough token count of a list of messages (~4 characters per token)."""
+    return len(json.dumps(messages, default=str)) // 4
+
+
+class ContextCompactor(FrameProcessor):
+    """Keeps the LLM context of long calls within a token budget.
+
+    It sits between the user context aggregator and the LLM and passes every frame
+    through. When the context goes over `max_tokens`, the turns older than the last
+    `keep_turns` are summarized by `model` in the background, and replaced by one
+    message with the summary and the answers registered so far. The system prompt
+    stays first and untouched, so it's still a cacheable prefix.
+    """
+
+    def __init__(
+        self,
+        context: LLMContext,
+        state: ClaimState,
+        max_tokens: int = 3000,
+        keep_turns: int = 4,
+        model: str = "gpt-4.1-mini",
+    ):
+        super().__init__()
+        self._context = context
+        self._state = state
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.model = model
+        self.compactions = 0
+        self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._task = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMContextFrame):
+            self.maybe_compact()
+
+        await self.push_frame(frame, direction)
+
+    def maybe_compact(self) -> asyncio.Task | None:
+        """Starts a compaction in the background if the context is over budget."""
+        if self._task is not None and not self._task.done():
+            return None
+        messages = self._context.get_messages()
+        if estimate_tokens(messages) <= self.max_tokens:
+            return None
+
+        # Only cut right before a user message, so tool calls stay with their results.
+        user_turns = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        if len(user_turns) <= self.keep_turns:
+            return None
+        cut = user_turns[-self.keep_turns]
+        self._task = asyncio.create_task(self._compact(messages[:cut], cut))
+        return self._task
+
+    async def _compact(self, head: list[dict], cut: int):
+        start = time.perf_counter()
+        previous = None
+        if len(head) > 1 and str(head[1].get("content", "")).startswith(SUMMARY_PREFIX):
+            previous = head[1]["content"]
+            head = head[:1] + head[2:]
+        try:
+            summary = await self.summarize(previous, format_transcript(head[1:]))
+        except Exception as e:
+            logger.error(f"{self}: failed to compact the context: {e}")
+            return
+
+        messages = self._context.get_messages()
+        content = (
+            f"{SUMMARY_PREFIX}\n{summary}\n\n"
+            f"Answers registered so far: {json.dumps(self._state.answers)}"
+        )
+        compacted = [messages[0], {"role": "system", "content": content}]
+        compacted += messages[cut:]
+        self._context.set_messages(compacted)
+        self.compactions += 1
+        logger.info(
+            f"Compacted {cut - 1} messages in {time.perf_counter() - start:.4f}s, "
+            f"context ~{estimate_tokens(messages)} -> ~{estimate_tokens(compacted)} tokens"
+        )
+
+    async def summarize(self, previous: str | None, transcript: str) -> str:
+        """Returns a short summary of the transcript, continuing the previous one."""
+        if previous:
+            transcript = f"{previous}\n\n{transcript}"
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You summarize the beginning of a call between an insurance "
+                        "agent and a service center, so the agent can carry on the "
+                        "call. In a few sentences, keep what was asked, what was "
+                        "answered, and anything the agent was told to wait for or do."
+                    ),
+                },
+                {"role": "user", "content": transcript},
+            ],
+        )
+        return response.choices[0].message.content or ""
+
+
+def get_context_compactor(
+    context: LLMContext, state: ClaimState
+) -> ContextCompactor | None:
+    """Returns the context compactor, None if CONTEXT_MAX_TOKENS is 0 (the default).
+
+    With deferred extraction the answers are taken from the context once the call is
+    over, so it must keep the whole conversation: there's no compaction then.
+    """
+    max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", 0))
+    if max_tokens <= 0:
+        return None
+    if get_extraction_mode() == "deferred":
+        logger.warning("CONTEXT_MAX_TOKENS is ignored with ANSWER_EXTRACTION=deferred")
+        return None
+    return ContextCompactor(
+        context,
+        state,
+        max_tokens=max_tokens,
+        keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", 4)),
+        model=os.getenv("COMPACTION_MODEL", "gpt-4.1-mini"),
+    )
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+from functools import lru_cache
+from loguru import logger
+
+from pipecat.frames.frames import (
+    Frame,
+    LLMContextFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+)
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from utils import (
+    AnswerExtractor,
+    ClaimState,
+    EventDispatcher,
+    format_transcript,
+    get_answer_extractor,
+    get_questions,
+    notify_if_complete,
+    register_answers,
+)
+
+######## Scripted Dialog ########
+
+
+def get_dialog_mode() -> str:
+    """Returns who drives the conversation, from DIALOG_MODE: 'llm' (the LLM speaks
+    every turn) or 'scripted' (a state machine speaks the scripted steps).
+    """
+    return os.getenv("DIALOG_MODE", "llm")
+
+
+@lru_cache
+def get_script() -> dict:
+    """Loads the scripted utterances of the conversation flow."""
+    with open("data/dialog_script.json", "r") as f:
+        return json.load(f)
+
+
+class ScriptedDialog(FrameProcessor):
+    """State machine that speaks the scripted steps of the call without the LLM.
+
+    It sits between the user context aggregator and the LLM, and follows the flow
+    of the system prompt: greeting, claim number, one question at a time, goodbye.
+    Scripted steps are pushed downstream as a regular LLM response, so the TTS and
+    the assistant context aggregator handle them like any other. The LLM is only
+    used to interpret the answers (one extraction call) and, when the answer isn't
+    clear the first time, to reply to the user off-script.
+    """
+
+    def __init__(
+        self,
+        context: LLMContext,
+        state: ClaimState,
+        dispatcher: EventDispatcher,
+        extractor: AnswerExtractor,
+        claim_number: str,
+        history: int = 4,
+    ):
+        super().__init__()
+        self._context = context
+        self._state = state
+        self._dispatcher = dispatcher
+        self._extractor = extractor
+        self._claim_number = claim_number
+        self._history = history
+        self._script = get_script()
+        self._questions = get_questions()
+        self._step = "greeting"
+        self._current = None  # Index of the question being asked
+        self._attempts = 0
+        # How the latest turn was produced: 'scripted', 'interpreted' or 'llm'.
+        self.turn_kind = "llm"
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if not isinstance(frame, LLMContextFrame):
+            await self.push_frame(frame, direction)
+            return
+
+        if self._step == "done":
+            # The user has answered our goodbye.
+            self.turn_kind = "scripted"
+            await self._dispatcher.dispatch("hang_up")
+            return
+
+        text = await self._next_utterance()
+        if text is None:
+            self.turn_kind = "llm"
+            await self.push_frame(frame, direction)
+            return
+
+        logger.debug(f"{self}: scripted {self._step} turn [{text}]")
+        await self.push_frame(LLMFullResponseStartFrame())
+        await self.push_frame(LLMTextFrame(text))
+        await self.push_frame(LLMFullResponseEndFrame())
+
+    async def _next_utterance(self) -> str | None:
+        """Advances the state machine, returns None if the LLM has to reply."""
+        self.turn_kind = "scripted"
+        if self._step == "greeting":
+            self._step = "claim_number"
+            return self._script["greeting"]
+
+        if self._step == "claim_number":
+            self._step = "questions"
+            # Spaced out, so it's read character by character.
+            return self._script["claim_number"].format(
+                claim_number=" ".join(self._claim_number)
+            )
+
+        if self._current is None:
+            return self._advance()
+
+        self.turn_kind = "interpreted"
+        if await self._interpret():
+            return self._advance(self._script["acknowledge"])
+        self._attempts += 1
+        if self._attempts < 2:
+            # Unclear or off-script: the LLM replies (and asks again if needed).
+            return None
+        return self._advance(self._script["move_on"])
+
+    def _advance(self, prefix: str | None = None) -> str:
+        """Moves to the next unanswered question, or to the goodbye."""
+        start = 0 if self._current is None else self._current + 1
+        for i in range(start, len(self._questions)):
+            if self._questions[i]["key"] not in self._state.answers:
+                self._current, self._attempts = i, 0
+                text = self._questions[i]["question"]
+                break
+        else:
+            self._step = "done"
+            text = self._script["goodbye"]
+        return f"{prefix} {text}" if prefix else text
+
+    async def _interpret(self) -> bool:
+        """Extracts the answers of the latest turns, True if the question was answered."""
+        messages = self._context.get_messages()[-self._history :]
+        start = time.perf_counter()
+        try:
+            answers = await self._extractor.extract(format_transcript(messages))
+        except Exception as e:
+            logger.error(f"{self}: failed to interpret the answer: {e}")
+            answers = {}
+        logger.info(f"Interpreted the answer in {time.perf_counter() - start:.4f}s")
+
+        if answers:
+            register_answers(self._state, answers)
+            await notify_if_complete(self._state)
+        return self._questions[self._current]["key"] in self._state.answers
+
+
+def get_scripted_dialog(
+    context: LLMContext,
+    state: ClaimState,
+    dispatcher: EventDispatcher,
+    claim_number: str,
+) -> ScriptedDialog | None:
+    """Returns the scripted dialog in 'scripted' mode, None otherwise."""
+    if get_dialog_mode() != "scripted":
+        return None
+    return ScriptedDialog(
+        context, state, dispatcher, get_answer_extractor(), claim_number
+    )
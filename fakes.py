@@ -0,0 +1,463 @@
+import json
+import math
+import time
+import uuid
+import base64
+import random
+import asyncio
+import argparse
+from array import array
+from aiohttp import web
+from loguru import logger
+
+######## Fake Providers ########
+
+
+def load_script(path: str = "data/fake_providers.json") -> dict:
+    """Loads what the fake providers say.
+
+    - `caller`: the transcripts of the caller's turns, in order.
+    - `agent`: the LLM responses of each turn. A turn is a response or a list of
+      responses (one per LLM request of the turn, e.g. a tool call and then the
+      reply); a response is a string or `{"content": ..., "tool_calls": [...]}`.
+    - `answers`: what the answer extraction finds when it's in the transcript.
+    """
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def tone(duration: float, sample_rate: int, frequency: float = 220.0) -> bytes:
+    """A 16-bit PCM tone, standing in for synthesized speech."""
+    samples = array(
+        "h",
+        (
+            int(4000 * math.sin(2 * math.pi * frequency * i / sample_rate))
+            for i in range(int(duration * sample_rate))
+        ),
+    )
+    return samples.tobytes()
+
+
+def rms(pcm: bytes) -> float:
+    samples = array("h", pcm[: len(pcm) - len(pcm) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class Distribution:
+    """A latency or throughput, fixed or drawn at random for every request.
+
+    Written as `0.4`, `uniform:0.2,0.6`, `normal:0.4,0.1` (mean, deviation),
+    `lognormal:0.4,0.5` (median, sigma) or `exponential:0.4` (mean). Samples are
+    never negative, and with the same seed the same requests get the same values.
+    """
+
+    def __init__(self, spec, rng: random.Random):
+        self.spec = str(spec)
+        self.rng = rng
+        kind, _, params = self.spec.rpartition(":")
+        self.kind = kind or "fixed"
+        self.params = [float(p) for p in params.split(",")]
+        samplers = {
+            "fixed": lambda value: value,
+            "uniform": rng.uniform,
+            "normal": rng.gauss,
+            "lognormal": lambda median, sigma: rng.lognormvariate(
+                math.log(median), sigma
+            ),
+            "exponential": lambda mean: rng.expovariate(1 / mean),
+        }
+        if self.kind not in samplers:
+            raise ValueError(f"Unknown distribution '{self.kind}' in '{self.spec}'")
+        self._sample = samplers[self.kind]
+
+    def sample(self) -> float:
+        return max(0.0, self._sample(*self.params))
+
+    def __repr__(self):
+        return self.spec
+
+
+class FakeProviders:
+    """Local stand-ins for Deepgram, OpenAI and Cartesia, served from one port.
+
+    They speak the same protocols as the real services, say what `script` says
+    (see `load_script`) and take as long as the latency distributions say:
+
+    - Deepgram (`/v1/listen`): detects speech by energy and, `endpointing` seconds
+      into the silence plus `stt_delay`, sends the caller's next line as the final
+      transcript. With `interim_every`, a word of it is revealed in an interim
+      transcript every `interim_every` seconds of speech.
+    - OpenAI (`/v1/chat/completions`): streams the turn's scripted response, tool
+      calls included, after `llm_ttfb` seconds and at `llm_tokens_per_second`.
+      Tool calls are only made if the request offers the tool.
+    - Cartesia (`/tts/websocket`, `/tts/bytes`): returns a tone as long as the
+      text would take to say, starting after `tts_ttfb` seconds and generated
+      `tts_speed` times faster than real time.
+    """
+
+    def __init__(
+        self,
+        script: dict = None,
+        stt_delay="0.05",
+        endpointing: float = 0.3,
+        interim_every: float = 0,
+        llm_ttfb="0.4",
+        llm_tokens_per_second="80",
+        tts_ttfb="0.1",
+        tts_speed="4",
+        seconds_per_character: float = 0.06,
+        seed: int = 0,
+    ):
+        self.script = script or load_script()
+        rng = random.Random(seed)
+        self.stt_delay = Distribution(stt_delay, rng)
+        self.endpointing = endpointing
+        self.interim_every = interim_every
+        self.llm_ttfb = Distribution(llm_ttfb, rng)
+        self.llm_tokens_per_second = Distribution(llm_tokens_per_second, rng)
+        self.tts_ttfb = Distribution(tts_ttfb, rng)
+        self.tts_speed = Distribution(tts_speed, rng)
+        self.seconds_per_character = seconds_per_character
+        self.requests = {"stt": 0, "llm": 0, "tts": 0}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/listen", self.deepgram)
+        app.router.add_post("/v1/chat/completions", self.openai)
+        app.router.add_get("/tts/websocket", self.cartesia)
+        app.router.add_post("/tts/bytes", self.cartesia_bytes)
+        return app
+
+    @staticmethod
+    def env(base_url: str) -> dict:
+        """Environment variables pointing the bot at the fake providers."""
+        ws_url = base_url.replace("http", "ws", 1)
+        return {
+            "DEEPGRAM_URL": base_url,
+            "DEEPGRAM_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"{base_url}/v1",
+            "OPENAI_API_KEY": "fake",
+            "CARTESIA_URL": f"{ws_url}/tts/websocket",
+            "CARTESIA_BASE_URL": base_url,
+            "CARTESIA_API_KEY": "fake",
+        }
+
+    ##### Deepgram #####
+
+    def _deepgram_result(self, transcript: str, start: float, duration: float, final):
+        return json.dumps(
+            {
+                "type": "Results",
+                "channel_index": [0, 1],
+                "duration": duration,
+                "start": start,
+                "is_final": final,
+                "speech_final": final,
+                "channel": {
+                    "alternatives": [
+                        {"transcript": transcript, "confidence": 0.99, "words": []}
+                    ]
+                },
+                "metadata": {
+                    "request_id": str(uuid.uuid4()),
+                    "model_uuid": "fake",
+                    "model_info": {"name": "fake", "version": "0", "arch": "fake"},
+                },
+            }
+        )
+
+    async def deepgram(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.requests["stt"] += 1
+        caller = self.script["caller"]
+        sample_rate = int(request.query.get("sample_rate", 16000))
+        line, position = 0, 0.0
+        speech_start, silence, revealed = None, 0.0, 0
+
+        async for message in ws:
+            if message.type != web.WSMsgType.BINARY:
+                continue  # KeepAlive, Finalize, CloseStream
+            duration = len(message.data) / 2 / sample_rate
+            position += duration
+            words = caller[line % len(caller)].split()
+            if rms(message.data) > 500:
+                if speech_start is None:
+                    speech_start = position - duration
+                silence = 0.0
+                spoken = position - speech_start
+                if self.interim_every and spoken >= (revealed + 1) * self.interim_every:
+                    revealed = min(revealed + 1, len(words))
+                    await ws.send_str(
+                        self._deepgram_result(
+                            " ".join(words[:revealed]), speech_start, spoken, False
+                        )
+                    )
+            elif speech_start is not None:
+                silence += duration
+                if silence >= self.endpointing:
+                    await asyncio.sleep(self.stt_delay.sample())
+                    await ws.send_str(
+                        self._deepgram_result(
+                            " ".join(words), speech_start, position - speech_start, True
+                        )
+                    )
+                    line += 1
+                    speech_start, silence, revealed = None, 0.0, 0
+        return ws
+
+    ##### OpenAI #####
+
+    def _response(self, body: dict) -> dict:
+        """The scripted response to a chat completion request."""
+        messages = body.get("messages", [])
+        if body.get("response_format", {}).get("type") == "json_object":
+            # Answer extraction: the scripted answers found in the transcript.
+            said = " ".join(
+                str(m.get("content")) for m in messages if m.get("role") == "user"
+            ).lower()
+            answers = {
+                key: answer
+                for key, answer in self.script["answers"].items()
+                if answer.lower() in said
+            }
+            return {"content": json.dumps(answers)}
+
+        # The turn is the number of caller messages, the step within the turn the
+        # number of LLM responses (e.g. tool calls) since the last one.
+        users = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        turn = len(users)
+        since = messages[users[-1] + 1 :] if users else messages
+        step = sum(m.get("role") == "assistant" for m in since)
+
+        agent = self.script["agent"]
+        responses = agent[min(turn, len(agent) - 1)]
+        if not isinstance(responses, list):
+            responses = [responses]
+        offered = {tool["function"]["name"] for tool in body.get("tools") or []}
+        responses = [
+            response if isinstance(response, dict) else {"content": response}
+            for response in responses
+        ]
+        responses = [
+            response
+            for response in responses
+            if all(call["name"] in offered for call in response.get("tool_calls", []))
+        ]
+        if step >= len(responses):
+            return {"content": ""}
+        return responses[step]
+
+    @staticmethod
+    def _tool_calls(response: dict) -> list[dict]:
+        return [
+            {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {
+                    "name": call["name"],
+                    "arguments": json.dumps(call.get("arguments", {})),
+                },
+            }
+            for call in response.get("tool_calls", [])
+        ]
+
+    def _chunk(self, model: str, delta: dict, finish_reason=None, usage=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": (
+                []
+                if usage
+                else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            ),
+            "usage": usage,
+        }
+
+    async def openai(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests["llm"] += 1
+        model = body.get("model", "fake")
+        response = self._response(body)
+        content = response.get("content") or ""
+        tool_calls = self._tool_calls(response)
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        tokens = [word + " " for word in content.split(" ")] if content else []
+        if tokens:
+            tokens[-1] = tokens[-1].rstrip()
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(tokens) + len(json.dumps(tool_calls)) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        await asyncio.sleep(self.llm_ttfb.sample())
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return web.json_response(
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": message, "finish_reason": finish_reason}
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        stream = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await stream.prepare(request)
+
+        async def send(chunk):
+            await stream.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        token_time = 1 / max(self.llm_tokens_per_second.sample(), 1e-3)
+        await send(self._chunk(model, {"role": "assistant", "content": ""}))
+        for token in tokens:
+            await send(self._chunk(model, {"content": token}))
+            await asyncio.sleep(token_time)
+        for index, call in enumerate(tool_calls):
+            await send(self._chunk(model, {"tool_calls": [{"index": index, **call}]}))
+            await asyncio.sleep(token_time)
+        await send(self._chunk(model, {}, finish_reason=finish_reason))
+        if body.get("stream_options", {}).get("include_usage"):
+            await send(self._chunk(model, {}, usage=usage))
+        await stream.write(b"data: [DONE]\n\n")
+        await stream.write_eof()
+        return stream
+
+    ##### Cartesia #####
+
+    def _speech(self, text: str, sample_rate: int) -> bytes:
+        return tone(len(text) * self.seconds_per_character, sample_rate)
+
+    async def cartesia(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        contexts = {}  # context id -> queue of messages, synthesized in order
+
+        async def synthesize(context_id, queue):
+            while (msg := await queue.get()) is not None:
+                if msg.get("transcript"):
+                    self.requests["tts"] += 1
+                    sample_rate = msg["output_format"]["sample_rate"]
+                    await asyncio.sleep(self.tts_ttfb.sample())
+                    audio = self._speech(msg["transcript"], sample_rate)
+                    speed = self.tts_speed.sample()
+                    step = sample_rate * 2 // 10  # 100 ms chunks
+                    for i in range(0, len(audio), step):
+                        if i and speed:
+                            await asyncio.sleep(0.1 / speed)
+                        chunk = base64.b64encode(audio[i : i + step]).decode()
+                        await ws.send_json(
+                            {
+                                "type": "chunk",
+                                "data": chunk,
+                                "context_id": context_id,
+                                "done": False,
+                            }
+                        )
+                    words = msg["transcript"].split()
+                    await ws.send_json(
+                        {
+                            "type": "timestamps",
+                            "context_id": context_id,
+                            "word_timestamps": {
+                                "words": words,
+                                "start": [0.0] * len(words),
+                                "end": [0.0] * len(words),
+                            },
+                        }
+                    )
+                if not msg.get("continue", True):
+                    await ws.send_json({"type": "done", "context_id": context_id})
+                    return
+
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            msg = json.loads(message.data)
+            context_id = msg.get("context_id")
+            if msg.get("cancel"):
+                if context_id in contexts:
+                    contexts.pop(context_id)[1].cancel()
+                continue
+            if context_id not in contexts:
+                queue = asyncio.Queue()
+                task = asyncio.create_task(synthesize(context_id, queue))
+                contexts[context_id] = (queue, task)
+            contexts[context_id][0].put_nowait(msg)
+
+        for _, task in contexts.values():
+            task.cancel()
+        return ws
+
+    async def cartesia_bytes(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests["tts"] += 1
+        await asyncio.sleep(self.tts_ttfb.sample())
+        sample_rate = body["output_format"]["sample_rate"]
+        return web.Response(body=self._speech(body["transcript"], sample_rate))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving in the running event loop, returns the base URL."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake providers listening on http://{host}:{port}")
+        return f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fake Deepgram, OpenAI and Cartesia. Latencies and throughputs "
+        "take a number or a distribution, e.g. 'lognormal:0.4,0.3'."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--script", default="data/fake_providers.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stt-delay", default="0.05", help="Seconds")
+    parser.add_argument("--endpointing", type=float, default=0.3, help="Seconds")
+    parser.add_argument(
+        "--interim-every", type=float, default=0, help="Seconds, 0 disables them"
+    )
+    parser.add_argument("--llm-ttfb", default="0.4", help="Seconds")
+    parser.add_argument("--llm-tps", default="80", help="Tokens per second")
+    parser.add_argument("--tts-ttfb", default="0.1", help="Seconds")
+    parser.add_argument(
+        "--tts-speed", default="4", help="Times real time, 0 is instant"
+    )
+    args = parser.parse_args()
+
+    async def serve():
+        fakes = FakeProviders(
+            script=load_script(args.script),
+            stt_delay=args.stt_delay,
+            endpointing=args.endpointing,
+            interim_every=args.interim_every,
+            llm_ttfb=args.llm_ttfb,
+            llm_tokens_per_second=args.llm_tps,
+            tts_ttfb=args.tts_ttfb,
+            tts_speed=args.tts_speed,
+            seed=args.seed,
+        )
+        base_url = await fakes.start(args.host, args.port)
+        print(f"FAKE_PROVIDERS_URL={base_url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
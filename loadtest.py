@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import shlex
+import time
+import uuid
+import wave
+import base64
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import numpy as np
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.exceptions import ConnectionClosedOK
+
+from fakes import load_script
+
+######## Audio ########
+
+SAMPLE_RATE = 8000  # Twilio Media Streams are 8 kHz mu-law
+FRAME = 0.02  # Twilio sends 20 ms of audio per media message
+FRAME_BYTES = int(SAMPLE_RATE * FRAME)
+SILENCE = b"\xff" * FRAME_BYTES
+
+# mu-law byte -> 16-bit sample
+_exponent = (~np.arange(256, dtype=np.uint8) >> 4) & 0x07
+_mantissa = ~np.arange(256, dtype=np.uint8) & 0x0F
+_magnitude = ((_mantissa.astype(np.int32) << 3) + 0x84) << _exponent
+ULAW_DECODE = np.where(
+    np.arange(256) & 0x80, _magnitude - 0x84, 0x84 - _magnitude
+).astype(np.int16)
+SEGMENT_ENDS = [0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """Encodes 16-bit samples as G.711 mu-law (same output as audioop.lin2ulaw)."""
+    samples = pcm.astype(np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + 0x21
+    segment = np.searchsorted(SEGMENT_ENDS, magnitude)
+    value = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    value = np.where(segment > 7, 0x7F, value)  # Clipped
+    return (value ^ mask).astype(np.uint8).tobytes()
+
+
+def energy(payload: bytes) -> float:
+    return float(np.abs(ULAW_DECODE[np.frombuffer(payload, dtype=np.uint8)]).mean())
+
+
+def load_wav(path: str) -> bytes:
+    """Loads a mono 16-bit WAV file as 8 kHz mu-law."""
+    with wave.open(path, "rb") as f:
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        rate = f.getframerate()
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(pcm), rate / SAMPLE_RATE)
+        pcm = np.interp(positions, np.arange(len(pcm)), pcm)
+    return ulaw_encode(pcm)
+
+
+def synthetic_utterance(text: str) -> bytes:
+    """Speech-like audio (a modulated tone) as long as the text would take to say."""
+    t = np.arange(int(len(text) * 0.06 * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return ulaw_encode(6000 * envelope * np.sin(2 * np.pi * 180 * t))
+
+
+######## Synthetic Calls ########
+
+
+class CallStats:
+    """What a synthetic caller measured during its call."""
+
+    def __init__(self):
+        self.latencies = []  # Caller stopped speaking -> first bot audio
+        self.unanswered = 0
+        self.dropped_frames = 0  # Underruns of the bot audio within a bot turn
+        self.late_frames = 0  # Caller frames we couldn't send on time
+        self.error = None
+
+
+class SyntheticCaller:
+    """Speaks the Twilio Media Streams protocol like a phone call would.
+
+    It streams 20 ms mu-law frames (silence or the current utterance) in real time,
+    waits for the bot to finish each turn, answers with the next utterance and
+    measures how long the bot takes to start speaking.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        utterances: list[bytes],
+        turns: int,
+        threshold: float = 500,
+        turn_end: float = 0.8,
+        turn_timeout: float = 15,
+    ):
+        self.url = url
+        self.utterances = utterances
+        self.turns = turns
+        self.threshold = threshold
+        self.turn_end = turn_end
+        self.turn_timeout = turn_timeout
+        self.stats = CallStats()
+        self._playing = b""
+        self._last_bot_audio = None
+        self._played_until = None  # When the bot audio received so far ends
+        self._bot_started_at = None
+        self._bot_started = asyncio.Event()
+
+    async def run(self) -> CallStats:
+        stream_sid, call_sid = f"MZ{uuid.uuid4().hex}", f"CA{uuid.uuid4().hex}"
+        try:
+            async with websocket_connect(self.url) as ws:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call"}))
+                await ws.send(
+                    json.dumps(
+                        {
+                            "event": "start",
+                            "sequenceNumber": "1",
+                            "start": {
+                                "streamSid": stream_sid,
+                                "callSid": call_sid,
+                                "accountSid": "ACfake",
+                                "tracks": ["inbound"],
+                                "customParameters": {},
+                                "mediaFormat": {
+                                    "encoding": "audio/x-mulaw",
+                                    "sampleRate": SAMPLE_RATE,
+                                    "channels": 1,
+                                },
+                            },
+                            "streamSid": stream_sid,
+                        }
+                    )
+                )
+                sender = asyncio.create_task(self._send_audio(ws, stream_sid))
+                receiver = asyncio.create_task(self._receive(ws))
+                try:
+                    await self._converse()
+                finally:
+                    sender.cancel()
+                    receiver.cancel()
+                try:
+                    await ws.send(
+                        json.dumps({"event": "stop", "streamSid": stream_sid})
+                    )
+                except ConnectionClosedOK:
+                    pass  # The bot hung up
+        except Exception as e:
+            self.stats.error = f"{type(e).__name__}: {e}"
+        return self.stats
+
+    async def _send_audio(self, ws, stream_sid: str):
+        start = time.monotonic()
+        sequence = 0
+        while True:
+            chunk, self._playing = (
+                self._playing[:FRAME_BYTES],
+                self._playing[FRAME_BYTES:],
+            )
+            payload = chunk.ljust(FRAME_BYTES, b"\xff") if chunk else SILENCE
+            await ws.send(
+                json.dumps(
+                    {
+                        "event": "media",
+                        "sequenceNumber": str(sequence + 2),
+                        "media": {
+                            "track": "inbound",
+                            "chunk": str(sequence),
+                            "timestamp": str(int(sequence * FRAME * 1000)),
+                            "payload": base64.b64encode(payload).decode(),
+                        },
+                        "streamSid": stream_sid,
+                    }
+                )
+            )
+            sequence += 1
+            delay = start + sequence * FRAME - time.monotonic()
+            if delay < -FRAME:
+                self.stats.late_frames += 1
+            await asyncio.sleep(max(0, delay))
+
+    async def _receive(self, ws):
+        async for message in ws:
+            data = json.loads(message)
+            if data.get("event") != "media":
+                continue  # mark, clear
+            payload = base64.b64decode(data["media"]["payload"])
+            now = time.monotonic()
+            # The bot sends audio in chunks of varying length, so compare arrivals
+            # with when the audio already received would have finished playing.
+            underrun = now - self._played_until if self._played_until else 0
+            if FRAME < underrun < self.turn_end:
+                self.stats.dropped_frames += int(underrun / FRAME)
+            self._played_until = max(now, self._played_until or 0) + (
+                len(payload) / SAMPLE_RATE
+            )
+            if energy(payload) < self.threshold:
+                continue
+            self._last_bot_audio = now
+            if not self._bot_started.is_set():
+                self._bot_started_at = now
+                self._bot_started.set()
+
+    async def _bot_turn(self) -> bool:
+        """Waits for the bot to speak and finish its turn, False on timeout."""
+        try:
+            await asyncio.wait_for(self._bot_started.wait(), self.turn_timeout)
+        except asyncio.TimeoutError:
+            return False
+        while time.monotonic() - self._last_bot_audio < self.turn_end:
+            await asyncio.sleep(0.05)
+        return True
+
+    async def _converse(self):
+        # The bot speaks first.
+        if not await self._bot_turn():
+            self.stats.unanswered += 1
+            return
+        for turn in range(self.turns):
+            utterance = self.utterances[turn % len(self.utterances)]
+            self._playing = utterance
+            await asyncio.sleep(len(utterance) / SAMPLE_RATE)
+            stopped = time.monotonic()
+            self._bot_started.clear()
+            if not await self._bot_turn():
+                self.stats.unanswered += 1
+                return
+            self.stats.latencies.append(self._bot_started_at - stopped)
+
+
+######## Resource Usage ########
+
+
+def process_tree(pid: int) -> list[int]:
+    """The process and all its descendants (Linux)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def resource_usage(pid: int) -> tuple[float, int]:
+    """CPU seconds and RSS bytes used by a process tree."""
+    cpu, rss = 0.0, 0
+    ticks, page = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{p}/statm") as f:
+                rss += int(f.read().split()[1]) * page
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples the CPU and memory of the bot while the load test runs."""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.start_cpu, self.base_rss = resource_usage(pid)
+        self.start_time = time.monotonic()
+        self.peak_rss = self.base_rss
+        self.cpu = self.start_cpu
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.cpu, rss = resource_usage(self.pid)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def report(self, calls: int) -> str:
+        elapsed = time.monotonic() - self.start_time
+        cpu = self.cpu - self.start_cpu
+        extra_rss = (self.peak_rss - self.base_rss) / 2**20
+        return (
+            f"    CPU:          {cpu / elapsed:.1%} of a core on average, "
+            f"{cpu / max(calls, 1):.2f} CPU-s per call\n"
+            f"    RSS:          {self.base_rss / 2**20:.0f} MB idle, "
+            f"{self.peak_rss / 2**20:.0f} MB peak, "
+            f"{extra_rss / max(calls, 1):.1f} MB per concurrent call"
+        )
+
+
+######## Load Test ########
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def wait_for_port(port: int, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.5)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def spawn_offline_bot(
+    bot_port: int, fakes_port: int, fakes_args: list[str] = ()
+) -> list[subprocess.Popen]:
+    """Starts the fake providers and `bot.py --transport twilio` pointed at them."""
+    fakes = subprocess.Popen(
+        [sys.executable, "fakes.py", "--port", str(fakes_port), *fakes_args],
+        stdout=subprocess.DEVNULL,
+    )
+    wait_for_port(fakes_port)
+    env = {
+        **os.environ,
+        "FAKE_PROVIDERS_URL": f"http://127.0.0.1:{fakes_port}",
+        "TWILIO_ACCOUNT_SID": "ACfake",
+        "TWILIO_AUTH_TOKEN": "fake",
+    }
+    with open("loadtest_bot.log", "w") as log:
+        bot = subprocess.Popen(
+            [
+                sys.executable,
+                "bot.py",
+                "--transport",
+                "twilio",
+                "--port",
+                str(bot_port),
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    wait_for_port(bot_port)
+    return [bot, fakes]
+
+
+async def load_test(url, pid, calls, ramp, turns, utterances):
+    sampler = ResourceSampler(pid) if pid else None
+    sampling = asyncio.create_task(sampler.run()) if sampler else None
+
+    async def call(i):
+        await asyncio.sleep(i * ramp / calls)
+        return await SyntheticCaller(url, utterances, turns).run()
+
+    start = time.monotonic()
+    results = await asyncio.gather(*(call(i) for i in range(calls)))
+    elapsed = time.monotonic() - start
+    if sampling:
+        sampling.cancel()
+
+    latencies = [l for r in results for l in r.latencies]
+    errors = [r.error for r in results if r.error]
+    print(f"Load test: {calls} calls ramped over {ramp:.0f}s, {turns} turns each")
+    print(f"    Duration:     {elapsed:.1f}s")
+    print(f"    Failed calls: {len(errors)}")
+    for error in sorted(set(errors)):
+        print(f"        {error}")
+    print(f"    Unanswered:   {sum(r.unanswered for r in results)} turns")
+    if latencies:
+        print(
+            f"    Turn latency: p50 {percentile(latencies, 0.5):.3f}s, "
+            f"p95 {percentile(latencies, 0.95):.3f}s, "
+            f"p99 {percentile(latencies, 0.99):.3f}s, "
+            f"mean {statistics.mean(latencies):.3f}s ({len(latencies)} turns)"
+        )
+    print(f"    Dropped bot frames:  {sum(r.dropped_frames for r in results)}")
+    print(f"    Late caller frames:  {sum(r.late_frames for r in results)}")
+    if sampler:
+        print(sampler.report(calls))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthetic Twilio callers against a local `bot.py --transport twilio`."
+    )
+    parser.add_argument("--calls", type=int, default=10, help="Concurrent calls")
+    parser.add_argument(
+        "--ramp", type=float, default=10, help="Seconds to reach --calls"
+    )
+    parser.add_argument("--turns", type=int, default=5, help="Caller turns per call")
+    parser.add_argument("--audio", nargs="*", help="Caller utterances (mono WAV)")
+    parser.add_argument("--url", default="ws://127.0.0.1:7860/ws")
+    parser.add_argument("--pid", type=int, help="Bot process to measure CPU/RSS of")
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Start the fake providers and the bot, fully offline",
+    )
+    parser.add_argument("--fakes-port", type=int, default=9000)
+    parser.add_argument(
+        "--fakes-args",
+        default="",
+        help="Options of fakes.py, e.g. '--llm-ttfb lognormal:0.4,0.3 --seed 1'",
+    )
+    args = parser.parse_args()
+
+    if args.audio:
+        utterances = [load_wav(path) for path in args.audio]
+    else:
+        utterances = [synthetic_utterance(line) for line in load_script()["caller"]]
+
+    processes = []
+    if args.offline:
+        port = int(args.url.rsplit(":", 1)[1].split("/")[0])
+        processes = spawn_offline_bot(
+            port, args.fakes_port, shlex.split(args.fakes_args)
+        )
+        args.pid = processes[0].pid
+    try:
+        asyncio.run(
+            load_test(args.url, args.pid, args.calls, args.ramp, args.turns, utterances)
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,576 @@
+import os
+import json
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import contextvars
+import yaml
+from functools import lru_cache, partial
+from loguru import logger
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import smtplib
+import aiohttp
+
+######## Notifiers ########
+
+
+class SMTPConnectionPool:
+    """Long-lived, logged-in SMTP connections shared by every email the process sends.
+
+    Connections are only opened (TLS handshake + login) when none is idle, and are
+    transparently re-opened when the server has closed them for inactivity.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        size: int = 2,
+        use_ssl: bool = True,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.handshakes = 0
+        self.messages = 0
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(self.host, self.port, timeout=self.timeout)
+        server.login(self.username, self.password)
+        with self._lock:
+            self.handshakes += 1
+        return server
+
+    def send_message(self, message):
+        with self._slots:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                logger.info(f"Connecting to SMTP server {self.host}:{self.port}...")
+                server = self._connect()
+
+            try:
+                server.send_message(message)
+            except (
+                smtplib.SMTPServerDisconnected,
+                smtplib.SMTPResponseException,
+                OSError,
+            ) as e:
+                # Most likely the server timed out the idle connection, try a fresh one.
+                logger.info(f"SMTP connection lost ({e}), reconnecting...")
+                self._close(server)
+                server = self._connect()
+                try:
+                    server.send_message(message)
+                except Exception:
+                    self._close(server)
+                    raise
+
+            with self._lock:
+                self.messages += 1
+            self._idle.put(server)
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def close(self):
+        """Closes every idle connection."""
+        while not self._idle.empty():
+            self._close(self._idle.get_nowait())
+
+    def metrics(self) -> dict:
+        """Returns throughput metrics since the pool was created."""
+        elapsed = time.monotonic() - self._started
+        return {
+            "messages": self.messages,
+            "handshakes": self.handshakes,
+            "messages_per_sec": self.messages / elapsed if elapsed else 0.0,
+            "messages_per_handshake": self.messages / max(self.handshakes, 1),
+        }
+
+
+@lru_cache
+def get_smtp_pool() -> SMTPConnectionPool | None:
+    """Returns the process-wide SMTP pool, or None if no credentials are configured."""
+    sender_email = os.getenv("SENDER_EMAIL")
+    sender_password = os.getenv("SENDER_PASSWORD")
+    if not all([sender_email, sender_password]):
+        return None
+    return SMTPConnectionPool(
+        host=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        port=int(os.getenv("SMTP_PORT", 465)),
+        username=sender_email,
+        password=sender_password,
+        size=int(os.getenv("SMTP_POOL_SIZE", 2)),
+        use_ssl=os.getenv("SMTP_USE_SSL", "true").lower() == "true",
+    )
+
+
+def build_email(claims: list[dict]) -> MIMEMultipart:
+    """Builds the email for one claim, or a digest if several claims are given."""
+    if len(claims) == 1:
+        subject = "Claim Information Collected"
+        body = "The following claim information has been collected:\n\n"
+        body += yaml.dump(claims[0])
+    else:
+        subject = f"Claim Information Collected ({len(claims)} claims)"
+        body = (
+            f"The following information has been collected for {len(claims)} claims:\n"
+        )
+        for i, data in enumerate(claims, 1):
+            body += f"\n--- Claim {i} ---\n" + yaml.dump(data)
+
+    message = MIMEMultipart()
+    message["From"] = os.getenv("SENDER_EMAIL")
+    message["To"] = os.getenv("RECIPIENT_EMAIL")
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def send_claims_email(claims: list[dict]):
+    """Sends the claims through the SMTP pool. Raises if the email could not be delivered."""
+    pool = get_smtp_pool()
+    if pool is None:
+        logger.error(
+            "SENDER_EMAIL or SENDER_PASSWORD environment variables not set. Cannot send email."
+        )
+        return
+
+    pool.send_message(build_email(claims))
+    logger.info(
+        f"Email with {len(claims)} claim(s) sent to {os.getenv('RECIPIENT_EMAIL')}"
+    )
+    logger.debug(f"SMTP pool metrics: {pool.metrics()}")
+
+
+def send_email(data):
+    """Sends an email with the collected data. Raises if the email could not be delivered."""
+    logger.info("Sending email with collected data...")
+    send_claims_email([data])
+
+
+class EmailBatcher:
+    """Email notifier that coalesces the claims completed within `window` seconds.
+
+    Each call waits until the digest containing its claim has been sent, and raises
+    if that digest failed, so retries still work per claim. The batch is collected
+    on the event loop; only sending the digest takes a worker thread.
+    """
+
+    def __init__(self, window: float, send=send_claims_email):
+        self.window = window
+        self.send = send
+        self._batch = None
+
+    async def __call__(self, data):
+        if self._batch is not None:
+            self._batch["claims"].append(data)
+            await asyncio.shield(self._batch["done"])
+            return
+
+        batch = {"claims": [data], "done": asyncio.get_running_loop().create_future()}
+        self._batch = batch
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._batch = None
+
+        logger.info(f"Sending digest with {len(batch['claims'])} claim(s)...")
+        try:
+            await asyncio.to_thread(self.send, batch["claims"])
+        except Exception as e:
+            batch["done"].set_exception(e)
+            # Retrieve it here too, so a batch without followers doesn't warn.
+            batch["done"].exception()
+            raise
+        batch["done"].set_result(None)
+
+
+def get_email_notifier():
+    """Returns the email notifier, batched if SMTP_BATCH_WINDOW (seconds) is set."""
+    window = float(os.getenv("SMTP_BATCH_WINDOW", 0))
+    return EmailBatcher(window) if window > 0 else send_email
+
+
+def load_webhooks(path: str = "data/webhooks.json") -> list[dict]:
+    """Loads the webhook destinations every completed claim is posted to."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+async def post_claim_info(url: str, data_to_send):
+    """Posts the claim information to a webhook. Raises on network or HTTP errors."""
+    logger.info(f"Posting info to webhook {url}...")
+    await get_http_client().post(url, data_to_send)
+
+
+class WebhookBatcher:
+    """Webhook notifier that posts the claims completed within `window` seconds as
+    a single JSON array, for endpoints that accept one.
+
+    Each call waits until the batch containing its claim has been posted, and raises
+    if that post failed, so retries still work per claim.
+    """
+
+    def __init__(self, url: str, window: float):
+        self.url = url
+        self.window = window
+        self._batch = None
+
+    async def __call__(self, data):
+        if self._batch is not None:
+            self._batch["claims"].append(data)
+            await asyncio.shield(self._batch["done"])
+            return
+
+        batch = {"claims": [data], "done": asyncio.get_running_loop().create_future()}
+        self._batch = batch
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._batch = None
+
+        logger.info(f"Posting {len(batch['claims'])} claim(s) to webhook {self.url}...")
+        try:
+            await get_http_client().post(self.url, batch["claims"])
+        except Exception as e:
+            batch["done"].set_exception(e)
+            # Retrieve it here too, so a batch without followers doesn't warn.
+            batch["done"].exception()
+            raise
+        batch["done"].set_result(None)
+
+
+def get_webhook_notifier(webhook: dict):
+    """Returns the notifier for a webhook destination from `data/webhooks.json`."""
+    if webhook.get("batch", False):
+        return WebhookBatcher(webhook["url"], float(webhook.get("batch_window", 1.0)))
+    return partial(post_claim_info, webhook["url"])
+
+
+def default_notifiers() -> dict:
+    """Returns the notifiers every completed claim is delivered to."""
+    notifiers = {"email": get_email_notifier()}
+    for webhook in load_webhooks():
+        notifiers[f"webhook:{webhook['name']}"] = get_webhook_notifier(webhook)
+    return notifiers
+
+
+######## HTTP Client ########
+
+
+class HTTPClient:
+    """Process-wide async HTTP client used for every outbound webhook.
+
+    A single aiohttp session keeps connections alive between requests, so only the
+    first post to a host pays for DNS, TCP and TLS. The number of simultaneous
+    connections and the time allowed per request are bounded.
+    """
+
+    def __init__(self, max_connections: int = 20, timeout: float = 10):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                raise_for_status=True,
+            )
+        return self._session
+
+    async def post(self, url: str, payload, headers: dict = None) -> bytes:
+        """Posts `payload` as JSON and returns the response body, raising on network
+        errors and non-2xx responses."""
+        async with self._get_session().post(
+            url, json=payload, headers=headers
+        ) as response:
+            return await response.read()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+@lru_cache
+def get_http_client() -> HTTPClient:
+    """Returns the process-wide HTTP client."""
+    return HTTPClient(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 20)),
+        timeout=float(os.getenv("HTTP_TIMEOUT", 10)),
+    )
+
+
+######## Outbox ########
+
+
+class NotificationOutbox:
+    """Durable queue of claim notifications delivered by a background worker.
+
+    Every item is written to `<directory>/pending/` before `enqueue` returns, so
+    notifications survive a crash and are picked up again by the next process.
+    Several processes can share the directory: an item is claimed by renaming it to
+    `<directory>/inflight/` before it's delivered, so only one of them sends it.
+    Failed deliveries are retried with exponential backoff; items that keep failing
+    are moved to `<directory>/dead_letter.jsonl`. `pending/` is scanned again every
+    `rescan_interval` seconds, for items other processes left behind (e.g. the
+    claims the supervisor released after a worker died).
+    """
+
+    def __init__(
+        self,
+        directory: str = "outbox",
+        notifiers: dict = None,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_concurrency: int = 8,
+        rescan_interval: float = 60.0,
+    ):
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, "pending")
+        self.inflight_dir = os.path.join(directory, "inflight")
+        self.dead_letter_path = os.path.join(directory, "dead_letter.jsonl")
+        self.notifiers = default_notifiers() if notifiers is None else notifiers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rescan_interval = rescan_interval
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._worker = None
+        self._deliveries = set()
+        # Items queued or waiting for a retry here, a rescan doesn't queue them again.
+        self._known = set()
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.inflight_dir, exist_ok=True)
+
+    def _item_path(self, item: dict) -> str:
+        return os.path.join(self.pending_dir, f"{item['id']}.json")
+
+    def _claimed_path(self, item: dict) -> str:
+        # The pid tells the supervisor whose claims to release when a worker dies.
+        return os.path.join(self.inflight_dir, f"{item['id']}.{os.getpid()}")
+
+    def _save(self, item: dict):
+        # Write to a temporary file first so a crash never leaves a half-written item.
+        path = self._item_path(item)
+        with open(path + ".tmp", "w") as f:
+            json.dump(item, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _load_pending(self) -> list[dict]:
+        items = []
+        for name in sorted(os.listdir(self.pending_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.pending_dir, name), "r") as f:
+                    items.append(json.load(f))
+            except FileNotFoundError:
+                continue  # Claimed by another process in the meantime.
+        return items
+
+    def _claim(self, item: dict) -> dict | None:
+        """Takes the item out of `pending/`, None if another process already has.
+
+        The claimed copy is returned, as it may have been retried since `item` was
+        queued here.
+        """
+        try:
+            os.rename(self._item_path(item), self._claimed_path(item))
+        except FileNotFoundError:
+            return None
+        with open(self._claimed_path(item), "r") as f:
+            return json.load(f)
+
+    def _unclaim(self, item: dict):
+        """Puts a claimed item back in `pending/` with its new state, for a retry."""
+        path = self._claimed_path(item)
+        with open(path + ".tmp", "w") as f:
+            json.dump(item, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        os.replace(path, self._item_path(item))
+
+    async def start(self):
+        """Starts the worker, re-queueing anything left pending by a previous run.
+
+        Call it when the process starts, so nothing waits for its first enqueue.
+        """
+        if self._worker is not None:
+            return
+        # It may be started during a call: not in its context, or every delivery
+        # would be logged with that call's id.
+        self._worker = asyncio.create_task(self._run(), context=contextvars.Context())
+        await self._rescan()
+
+    async def _rescan(self):
+        for item in await asyncio.to_thread(self._load_pending):
+            if item["id"] not in self._known:
+                logger.info(f"Re-queueing pending notification {item['id']}")
+                self._known.add(item["id"])
+                self._queue.put_nowait(item)
+
+    async def stop(self):
+        """Stops the worker. Undelivered items stay on disk for the next run."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        deliveries = list(self._deliveries)
+        for task in deliveries:
+            task.cancel()
+        await asyncio.gather(*deliveries, return_exceptions=True)
+        self._known.clear()
+
+    async def enqueue(self, data: dict):
+        """Persists a notification for every notifier and queues it for delivery."""
+        await self.start()
+        item = {
+            "id": f"{time.time_ns()}_{uuid.uuid4().hex[:8]}",
+            "data": data,
+            "channels": list(self.notifiers),
+            "attempts": 0,
+        }
+        await asyncio.to_thread(self._save, item)
+        self._known.add(item["id"])
+        self._queue.put_nowait(item)
+        logger.info(f"Queued notification {item['id']}")
+
+    async def _run(self):
+        # Items are delivered concurrently (up to `max_concurrency`) so a slow
+        # delivery doesn't hold up the rest, and batching notifiers see them together.
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), self.rescan_interval)
+            except asyncio.TimeoutError:
+                await self._rescan()
+                continue
+            await self._slots.acquire()
+            task = asyncio.create_task(self._deliver_item(item))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver_item(self, item: dict):
+        try:
+            await self._deliver(item)
+        except Exception as e:
+            logger.error(f"Unexpected error delivering {item['id']}: {e}")
+        finally:
+            self._slots.release()
+
+    async def _deliver(self, item: dict):
+        item_id = item["id"]
+        item = await asyncio.to_thread(self._claim, item)
+        if item is None:
+            logger.debug(f"Notification {item_id} is handled by another process")
+            self._known.discard(item_id)
+            return
+
+        try:
+            failed = await self._notify(item)
+        except asyncio.CancelledError:
+            # Stopped mid-delivery: leave it for the next run.
+            self._unclaim(item)
+            raise
+
+        if not failed:
+            await asyncio.to_thread(os.remove, self._claimed_path(item))
+            self._known.discard(item_id)
+            logger.info(f"Notification {item['id']} delivered")
+            return
+
+        item["channels"] = failed
+        item["attempts"] += 1
+        if item["attempts"] >= self.max_attempts:
+            await asyncio.to_thread(self._dead_letter, item)
+            self._known.discard(item_id)
+            return
+
+        await asyncio.to_thread(self._unclaim, item)
+        delay = min(self.base_delay * 2 ** (item["attempts"] - 1), self.max_delay)
+        logger.info(f"Retrying notification {item['id']} in {delay:.1f}s")
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, item)
+
+    async def _notify(self, item: dict) -> list[str]:
+        """Sends the item on its channels, returns the ones that failed."""
+        failed = []
+        for channel in item["channels"]:
+            try:
+                notifier = self.notifiers[channel]
+                if _is_async(notifier):
+                    await notifier(item["data"])
+                else:
+                    await asyncio.to_thread(notifier, item["data"])
+            except Exception as e:
+                logger.warning(f"Notification {item['id']} failed on {channel}: {e}")
+                failed.append(channel)
+        return failed
+
+    def _dead_letter(self, item: dict):
+        logger.error(
+            f"Giving up on notification {item['id']} after {item['attempts']} attempts"
+        )
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps(item) + "\n")
+        os.remove(self._claimed_path(item))
+
+
+def _is_async(notifier) -> bool:
+    return asyncio.iscoroutinefunction(notifier) or asyncio.iscoroutinefunction(
+        getattr(notifier, "__call__", None)
+    )
+
+
+def release_outbox_claims(directory: str = "outbox", pid: int | None = None):
+    """Puts the items claimed by a process that's gone (all of them if `pid` is None)
+    back in `pending/`, e.g. after a crash in the middle of a delivery.
+    """
+    inflight_dir = os.path.join(directory, "inflight")
+    if not os.path.isdir(inflight_dir):
+        return
+    for name in os.listdir(inflight_dir):
+        item_id, _, owner = name.partition(".")
+        if owner.endswith(".tmp") or (pid is not None and owner != str(pid)):
+            continue
+        logger.info(f"Releasing notification {item_id} claimed by process {owner}")
+        os.replace(
+            os.path.join(inflight_dir, name),
+            os.path.join(directory, "pending", f"{item_id}.json"),
+        )
+
+
+@lru_cache
+def get_outbox() -> NotificationOutbox:
+    """Returns the process-wide notification outbox."""
+    return NotificationOutbox()
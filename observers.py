@@ -0,0 +1,250 @@
+import os
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+from loguru import logger
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    LLMFullResponseStartFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+    VADUserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import (
+    LLMUsageMetricsData,
+    ProcessingMetricsData,
+    TTFBMetricsData,
+)
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+from pipecat.processors.frame_processor import FrameDirection
+
+from utils import JsonLinesWriter, LatencyHistogram
+
+######## Usage Observer ########
+
+
+class SeenFrames:
+    """The ids of the last `size` frames an observer has seen.
+
+    A frame is seen once per hop through the pipeline, and its hops follow each
+    other closely, so only the recent ids are needed to count it once.
+    """
+
+    def __init__(self, size: int = 256):
+        self._order = deque()
+        self._ids = set()
+        self.size = size
+
+    def add(self, frame_id: int) -> bool:
+        """Remembers the id, returns False if it had already been seen."""
+        if frame_id in self._ids:
+            return False
+        if len(self._order) >= self.size:
+            self._ids.discard(self._order.popleft())
+        self._order.append(frame_id)
+        self._ids.add(frame_id)
+        return True
+
+
+class UsageObserver(BaseObserver):
+    """Logs the LLM token usage of every generation, including cached prompt tokens.
+
+    pipecat's own usage log line only has prompt and completion tokens; this one is
+    parsed by `analyze_logs.py` to check how much of the prompt the provider cached.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._seen = SeenFrames()
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        if not isinstance(frame, MetricsFrame) or not self._seen.add(frame.id):
+            return
+
+        for metrics in frame.data:
+            if isinstance(metrics, LLMUsageMetricsData):
+                usage = metrics.value
+                logger.info(
+                    f"{metrics.processor} usage: prompt tokens: {usage.prompt_tokens}, "
+                    f"cached tokens: {usage.cache_read_input_tokens or 0}, "
+                    f"completion tokens: {usage.completion_tokens}"
+                )
+
+
+######## First Audio Observer ########
+
+
+class FirstAudioObserver(BaseObserver):
+    """Logs, for every turn, when the first TTS audio was produced.
+
+    The time is measured both from when the user stopped speaking and from when the
+    LLM started its response, so the effect of the TTS text aggregation can be
+    told apart from the LLM's own latency. `turn_kind`, if given, returns how the
+    current turn was produced (e.g. by the scripted dialog or the LLM), and the
+    time from the user is also kept per kind of turn.
+    """
+
+    def __init__(self, turn_kind=None):
+        super().__init__()
+        self.from_user = LatencyHistogram()
+        self.from_llm = LatencyHistogram()
+        self.by_kind = defaultdict(LatencyHistogram)
+        self._turn_kind = turn_kind or (lambda: "llm")
+        self._user_stopped = None
+        self._llm_started = None
+        self._seen = SeenFrames()
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        # A frame is seen once per hop through the pipeline, only the first counts.
+        if isinstance(frame, (UserStoppedSpeakingFrame, LLMFullResponseStartFrame)):
+            if not self._seen.add(frame.id):
+                return
+
+        if isinstance(frame, UserStoppedSpeakingFrame):
+            self._user_stopped = time.monotonic()
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._llm_started = time.monotonic()
+        elif isinstance(frame, TTSAudioRawFrame) and self._llm_started is not None:
+            now = time.monotonic()
+            message = f"First audio {now - self._llm_started:.4f}s after LLM start"
+            self.from_llm.record(now - self._llm_started)
+            if self._user_stopped is not None:
+                kind = self._turn_kind()
+                self.from_user.record(now - self._user_stopped)
+                self.by_kind[kind].record(now - self._user_stopped)
+                message += f", {now - self._user_stopped:.4f}s after user stopped"
+                message += f" ({kind} turn)"
+            logger.info(message)
+            self._user_stopped = None
+            self._llm_started = None
+
+    def report(self) -> str:
+        lines = [
+            f"First audio after LLM start: {self.from_llm.summary()}",
+            f"First audio after user stopped speaking: {self.from_user.summary()}",
+        ]
+        for kind, histogram in sorted(self.by_kind.items()):
+            lines.append(f"    {kind} turns: {histogram.summary()}")
+        return "\n".join(lines)
+
+
+######## Turn Timeline Observer ########
+
+
+class TurnTimelineObserver(BaseObserver):
+    """Writes a structured timeline of every turn of a call, as JSON Lines.
+
+    Instead of scraping pipecat's DEBUG log lines (which change between versions),
+    each record has the call id, the turn number, the wall clock time the call
+    started and the events of the turn, timed in seconds since the call started
+    on the monotonic clock:
+    `{"name": "end_of_turn", "t": 12.5}`, `{"name": "ttfb", "t": 13.1,
+    "processor": "OpenAILLMService#0", "value": 0.41}`, ...
+
+    A turn starts when the user starts speaking (or is transcribed) after the
+    bot's last answer (the first turn is the greeting) and is written when the next one starts, so the
+    tool calls and LLM requests made after the bot started speaking are included.
+    `analyze_logs.py` reads these files as well as the logs.
+    """
+
+    def __init__(self, call_id: str, writer: JsonLinesWriter):
+        super().__init__()
+        self.call_id = call_id
+        self._writer = writer
+        self._start = time.monotonic()
+        self._started_at = time.time()
+        self._turn = None
+        self._turns = 0
+        self._seen = SeenFrames()
+        self._new_turn()
+
+    def _new_turn(self):
+        if self._turn is not None:
+            self._writer.append(self._turn)
+            self._turns += 1
+        self._turn = {
+            "call_id": self.call_id,
+            "turn": self._turns,
+            "call_started_at": self._started_at,
+            "events": [],
+        }
+        self._names = set()
+
+    def _event(self, name: str, **fields):
+        self._names.add(name)
+        t = round(time.monotonic() - self._start, 4)
+        self._turn["events"].append({"name": name, "t": t, **fields})
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        # Frames pushed both ways (e.g. speaking, function calls) are two frames.
+        if data.direction == FrameDirection.UPSTREAM:
+            return
+        # Audio frames are only of interest until the first one of the turn.
+        if isinstance(frame, TTSAudioRawFrame):
+            if "first_audio" not in self._names:
+                self._event("first_audio")
+            return
+        # A frame is seen once per hop through the pipeline, only the first counts.
+        if not self._seen.add(frame.id):
+            return
+
+        # The user speaking again after the bot's answer starts the next turn.
+        if isinstance(frame, (UserStartedSpeakingFrame, TranscriptionFrame)):
+            if "bot_started" in self._names:
+                self._new_turn()
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            self._event("user_started")
+        elif isinstance(frame, VADUserStoppedSpeakingFrame):
+            self._event("vad_stopped")
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._event("end_of_turn")
+        elif isinstance(frame, TranscriptionFrame):
+            self._event("transcript", text=frame.text)
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._event("llm_request")
+        elif isinstance(frame, FunctionCallInProgressFrame):
+            self._event("tool_call", function=frame.function_name)
+        elif isinstance(frame, FunctionCallResultFrame):
+            self._event("tool_result", function=frame.function_name)
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            if "bot_started" not in self._names:
+                self._event("bot_started")
+        elif isinstance(frame, MetricsFrame):
+            for metrics in frame.data:
+                if isinstance(metrics, TTFBMetricsData):
+                    name = "ttfb"
+                elif isinstance(metrics, ProcessingMetricsData):
+                    name = "processing_time"
+                else:
+                    continue
+                # pipecat resets every metric to 0 when the pipeline starts.
+                if metrics.value != 0:
+                    self._event(name, processor=metrics.processor, value=metrics.value)
+
+    def finish(self):
+        """Writes the last turn, once the call is over."""
+        if self._turn["events"]:
+            self._new_turn()
+
+
+@lru_cache
+def get_timeline_writer() -> JsonLinesWriter | None:
+    """Returns the process-wide writer of TIMELINE_FILE, None if it isn't set."""
+    path = os.getenv("TIMELINE_FILE", "")
+    return JsonLinesWriter(path) if path else None
+
+
+def get_turn_timeline(call_id: str) -> TurnTimelineObserver | None:
+    """Returns the timeline observer of a call, None if timelines are disabled."""
+    writer = get_timeline_writer()
+    return TurnTimelineObserver(call_id, writer) if writer else None
@@ -50,7 +50,11 @@ def get_system_prompt() -> str:
     # Load and format the system prompt.
     with open("../data/system_prompt.txt", "r") as f:
         system_prompt = f.read().strip()
-    return system_prompt.format(claim_number=claim_number, claim_info=claim_info)
+    return system_prompt.format(
+        claim_number=claim_number,
+        claim_info=claim_info,
+        on_answer="register it, acknowledge it",
+    )
 
 
 ######## Log Answer Tool ########
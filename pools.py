@@ -0,0 +1,301 @@
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from loguru import logger
+
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADParams
+from pipecat.audio.turn.smart_turn.local_smart_turn_v3 import LocalSmartTurnAnalyzerV3
+from pipecat.services.cartesia.tts import CartesiaTTSService
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.protocol import State
+
+from utils import LatencyHistogram
+
+######## Model Pool ########
+
+
+class ModelPool:
+    """Pool of preloaded instances of a model-backed analyzer.
+
+    Loading the Silero VAD or Smart Turn models takes ~70-80 ms per instance, which
+    used to be paid on every incoming call. The pool loads `size` instances up front
+    and calls check them out and give them back. If every instance is in use a new
+    one is loaded (in a thread), up to `max_size`; after that calls wait.
+    """
+
+    def __init__(self, name: str, factory, size: int, max_size: int, reset=None):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self.max_size = max(size, max_size)
+        self.reset = reset
+        self.total = 0
+        self.wait_times = LatencyHistogram()
+        self._idle = []
+        self._available = None
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def in_use(self) -> int:
+        return self.total - len(self._idle)
+
+    def warm(self):
+        """Loads instances until the pool has `size` of them. Blocking, call at startup."""
+        while self.total < self.size:
+            start = time.perf_counter()
+            self._idle.append(self.factory())
+            self.total += 1
+            logger.info(
+                f"Loaded {self.name} #{self.total} in {time.perf_counter() - start:.3f}s"
+            )
+
+    async def acquire(self):
+        if self._available is None:
+            self._available = asyncio.Condition()
+        start = time.perf_counter()
+        async with self._available:
+            grow = not self._idle and self.total < self.max_size
+            if grow:
+                # Reserve the slot before loading so concurrent calls don't overshoot.
+                self.total += 1
+            else:
+                await self._available.wait_for(lambda: self._idle)
+                instance = self._idle.pop()
+
+        if grow:
+            try:
+                instance = await asyncio.to_thread(self.factory)
+            except Exception:
+                async with self._available:
+                    self.total -= 1
+                raise
+            logger.info(f"{self.name} pool grew to {self.total} instances")
+
+        self.wait_times.record(time.perf_counter() - start)
+        return instance
+
+    async def release(self, instance):
+        if self.reset is not None:
+            self.reset(instance)
+        async with self._available:
+            self._idle.append(instance)
+            self._available.notify()
+
+    @asynccontextmanager
+    async def checkout(self):
+        """Checks out an instance for the duration of a call."""
+        instance = await self.acquire()
+        try:
+            yield instance
+        finally:
+            await self.release(instance)
+
+    def metrics(self) -> dict:
+        return {
+            "total": self.total,
+            "idle": self.idle,
+            "in_use": self.in_use,
+            "wait": self.wait_times.summary(),
+        }
+
+
+def _reset_vad(analyzer: SileroVADAnalyzer):
+    # Forget the previous call: the model's recurrent state, the audio not analyzed
+    # yet, the smoothed volume and whether the user was speaking.
+    analyzer._model.reset_states()
+    analyzer._last_reset_time = 0
+    analyzer._vad_buffer = b""
+    analyzer._prev_volume = 0
+    if analyzer.sample_rate:
+        analyzer.set_params(analyzer.params)
+
+
+def _reset_turn(analyzer: LocalSmartTurnAnalyzerV3):
+    analyzer.clear()
+
+
+@lru_cache
+def get_vad_pool() -> ModelPool:
+    """Returns the process-wide pool of Silero VAD analyzers."""
+    return ModelPool(
+        "Silero VAD",
+        lambda: SileroVADAnalyzer(params=VADParams(stop_secs=0.3, start_secs=0.0)),
+        size=int(os.getenv("MODEL_POOL_SIZE", 2)),
+        max_size=int(os.getenv("MODEL_POOL_MAX_SIZE", 32)),
+        reset=_reset_vad,
+    )
+
+
+@lru_cache
+def get_turn_pool() -> ModelPool:
+    """Returns the process-wide pool of Smart Turn v3 analyzers."""
+    return ModelPool(
+        "Smart Turn v3",
+        LocalSmartTurnAnalyzerV3,
+        size=int(os.getenv("MODEL_POOL_SIZE", 2)),
+        max_size=int(os.getenv("MODEL_POOL_MAX_SIZE", 32)),
+        reset=_reset_turn,
+    )
+
+
+######## Connection Pool ########
+
+
+class ConnectionPool:
+    """Pool of already-open provider websockets that new calls can adopt instantly.
+
+    A background task keeps `size` connections open: it pings the idle ones, drops
+    those that are dead or older than `max_age` seconds (providers close idle
+    sockets), and opens replacements, so the handshake is off the call's critical path.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect,
+        size: int = 2,
+        max_age: float = 240,
+        check_interval: float = 15,
+        ping_timeout: float = 5,
+    ):
+        self.name = name
+        self.connect = connect
+        self.size = size
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.ping_timeout = ping_timeout
+        self.hits = 0
+        self.misses = 0
+        self.connect_times = LatencyHistogram()
+        self._idle = []  # (opened_at, websocket)
+        self._maintainer = None
+        self._replenish = None
+        self._closing = set()
+
+    def start(self):
+        """Starts the background maintenance task (idempotent)."""
+        if self._maintainer is None:
+            self._replenish = asyncio.Event()
+            # Shared by every call, so not in the context of the call starting it.
+            self._maintainer = asyncio.create_task(
+                self._maintain(), context=contextvars.Context()
+            )
+
+    async def stop(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            self._maintainer = None
+        for _, websocket in self._idle:
+            await websocket.close()
+        self._idle = []
+
+    def take(self):
+        """Returns an open websocket, or None if none is ready (the caller then connects)."""
+        self.start()
+        while self._idle:
+            opened_at, websocket = self._idle.pop()
+            if self._usable(opened_at, websocket):
+                self.hits += 1
+                self._replenish.set()
+                return websocket
+            self._close_later(websocket)
+        self.misses += 1
+        self._replenish.set()
+        return None
+
+    def _close_later(self, websocket):
+        task = asyncio.create_task(websocket.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _usable(self, opened_at: float, websocket) -> bool:
+        return (
+            websocket.state is State.OPEN
+            and time.monotonic() - opened_at < self.max_age
+        )
+
+    async def _open(self):
+        start = time.perf_counter()
+        try:
+            websocket = await self.connect()
+        except Exception as e:
+            logger.warning(f"{self.name} pool failed to connect: {e}")
+            return
+        self.connect_times.record(time.perf_counter() - start)
+        self._idle.append((time.monotonic(), websocket))
+
+    async def _healthy(self, websocket) -> bool:
+        try:
+            pong = await websocket.ping()
+            await asyncio.wait_for(pong, timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _maintain(self):
+        while True:
+            # Health-check the idle connections.
+            idle, self._idle = self._idle, []
+            for opened_at, websocket in idle:
+                if self._usable(opened_at, websocket) and await self._healthy(
+                    websocket
+                ):
+                    self._idle.append((opened_at, websocket))
+                else:
+                    # A dead peer would hold the close handshake for its timeout.
+                    self._close_later(websocket)
+
+            missing = self.size - len(self._idle)
+            if missing > 0:
+                await asyncio.gather(*(self._open() for _ in range(missing)))
+
+            self._replenish.clear()
+            try:
+                await asyncio.wait_for(self._replenish.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "connect": self.connect_times.summary(),
+        }
+
+
+@lru_cache
+def get_cartesia_pool(url: str, api_key: str, version: str) -> ConnectionPool:
+    """Returns the process-wide pool of Cartesia websockets for these settings."""
+    return ConnectionPool(
+        "Cartesia",
+        lambda: websocket_connect(
+            f"{url}?api_key={api_key}&cartesia_version={version}"
+        ),
+        size=int(os.getenv("TTS_POOL_SIZE", 2)),
+    )
+
+
+class PooledCartesiaTTSService(CartesiaTTSService):
+    """CartesiaTTSService that adopts an already-open websocket from the pool.
+
+    `CartesiaTTSService._connect_websocket` skips the handshake when it already has
+    an open websocket, so we only need to hand it one before it tries to connect.
+    """
+
+    async def _connect_websocket(self):
+        if self._websocket is None:
+            pool = get_cartesia_pool(self._url, self._api_key, self._cartesia_version)
+            self._websocket = pool.take()
+            if self._websocket is not None:
+                logger.debug(f"{self}: adopted a pre-connected Cartesia websocket")
+        await super()._connect_websocket()
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import wave
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from pipecat.audio.utils import create_stream_resampler
+from pipecat.frames.frames import Frame, InputAudioRawFrame, OutputAudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from utils import JsonLinesWriter
+
+######## Call Recording ########
+
+CALLER, BOT = 0, 1  # Channels of the recording
+QUIET_RMS = 300  # About -40 dBFS
+
+
+def rms(audio: bytes) -> float:
+    samples = np.frombuffer(audio, dtype=np.int16).astype(np.float64)
+    return float(np.sqrt(np.mean(samples**2))) if len(samples) else 0.0
+
+
+class RecordingTap(FrameProcessor):
+    """Passes every frame through, handing the audio frames to the recorder."""
+
+    def __init__(self, recorder: "CallRecorder", channel: int, frame_type: type):
+        super().__init__()
+        self._recorder = recorder
+        self._channel = channel
+        self._frame_type = frame_type
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, self._frame_type):
+            await self._recorder.write(self._channel, frame, time.monotonic())
+        await self.push_frame(frame, direction)
+
+
+class PcmWriter(JsonLinesWriter):
+    """Raw PCM file appended in the background, by the same writer task as the
+    journals: appends take audio bytes instead of records.
+    """
+
+    def _write_batch(self, batch: list[bytes]):
+        with open(self.path, "ab") as f:
+            f.write(b"".join(batch))
+
+
+class CallRecorder:
+    """Records a call on a stereo WAV, the caller on the left and the bot on the right.
+
+    The input tap goes right after `transport.input()` and the output tap right after
+    `transport.output()`, which passes each chunk on once it has been sent. Audio is
+    placed at the time it went through its tap instead of appended, so the silences
+    between turns are real and both channels stay aligned.
+
+    Each channel is streamed to its own raw PCM file next to the recording while
+    the call goes on, so a long call isn't kept in memory. `save` interleaves them
+    into the WAV, a block at a time, and removes them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: int = 16000,
+        max_jitter: float = 0.1,
+        block: int = 1 << 16,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_jitter = max_jitter
+        self.block = block  # Samples per channel interleaved at a time
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        base = os.path.splitext(path)[0]
+        self._channels = [PcmWriter(f"{base}.caller.pcm"), PcmWriter(f"{base}.bot.pcm")]
+        self._lengths = [0, 0]  # Bytes written to each channel
+        self._resamplers = [create_stream_resampler(), create_stream_resampler()]
+
+    def input_tap(self) -> RecordingTap:
+        return RecordingTap(self, CALLER, InputAudioRawFrame)
+
+    def output_tap(self) -> RecordingTap:
+        return RecordingTap(self, BOT, OutputAudioRawFrame)
+
+    async def write(self, channel: int, frame, at: float):
+        """Adds a frame that went through a tap at `at` (monotonic time)."""
+        audio = await self._resamplers[channel].resample(
+            frame.audio, frame.sample_rate, self.sample_rate
+        )
+        # The frame was received (or sent) by then, so it started a frame earlier.
+        duration = len(audio) / 2 / self.sample_rate
+        position = int((at - self._start - duration) * self.sample_rate) * 2
+        length = self._lengths[channel]
+        jitter = int(self.max_jitter * self.sample_rate) * 2
+        # Only gaps longer than the jitter are silences, otherwise every late frame
+        # would push the rest of the channel later.
+        if position - length > jitter:
+            self._append(channel, bytes(position - length))
+        # Frames that arrive in a burst (e.g. queued before the pipeline started)
+        # leave the channel ahead of time, it catches up by skipping quiet frames.
+        elif length - position > jitter and rms(audio) < QUIET_RMS:
+            return
+        self._append(channel, audio)
+
+    def _append(self, channel: int, audio: bytes):
+        self._channels[channel].append(audio)
+        self._lengths[channel] += len(audio)
+
+    def _save(self):
+        samples = max(self._lengths) // 2
+        files = [
+            open(c.path, "rb") if os.path.exists(c.path) else None
+            for c in self._channels
+        ]
+        try:
+            with wave.open(self.path, "wb") as f:
+                f.setnchannels(2)
+                f.setsampwidth(2)
+                f.setframerate(self.sample_rate)
+                for offset in range(0, samples, self.block):
+                    size = min(self.block, samples - offset)
+                    stereo = np.zeros((size, 2), dtype=np.int16)
+                    for channel, file in enumerate(files):
+                        if file is not None:
+                            audio = np.frombuffer(file.read(size * 2), dtype=np.int16)
+                            stereo[: len(audio), channel] = audio
+                    f.writeframes(stereo.tobytes())
+        finally:
+            for channel, file in zip(self._channels, files):
+                if file is not None:
+                    file.close()
+                    os.remove(channel.path)
+        # The wall clock time of the start, to match the recording with the logs.
+        with open(os.path.splitext(self.path)[0] + ".json", "w") as f:
+            json.dump({"started_at": self.started_at}, f)
+
+    async def save(self) -> str:
+        """Writes the recording (and its start time next to it), returns its path."""
+        for channel in self._channels:
+            await channel.close()
+        await asyncio.to_thread(self._save)
+        return self.path
+
+
+def get_call_recorder(
+    call_id: str, directory: str = "recordings"
+) -> CallRecorder | None:
+    """Returns a recorder for the call if RECORD_CALLS is set, otherwise None."""
+    if os.getenv("RECORD_CALLS", "false").lower() != "true":
+        return None
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return CallRecorder(os.path.join(directory, f"call_{timestamp}_{call_id}.wav"))
+
+
+######## Recording Analysis ########
+
+
+def speech_segments(
+    samples: np.ndarray,
+    sample_rate: int,
+    frame: float = 0.02,
+    min_pause: float = 0.5,
+    min_speech: float = 0.1,
+) -> list[tuple[float, float]]:
+    """Finds the (start, end) times of speech in one channel by frame energy.
+
+    The threshold adapts to the channel's noise floor. Pauses shorter than
+    `min_pause` are part of the same utterance and blips shorter than `min_speech`
+    are ignored.
+    """
+    size = int(sample_rate * frame)
+    count = len(samples) // size
+    if count == 0:
+        return []
+    frames = samples[: count * size].astype(np.float64).reshape(count, size)
+    level = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+    threshold = max(np.percentile(level, 10) + 15, 40)  # dB, 40 ~ -50 dBFS
+
+    segments = []
+    active = np.flatnonzero(level > threshold)
+    if len(active) == 0:
+        return segments
+    # Split wherever there's a pause long enough between active frames.
+    breaks = np.flatnonzero(np.diff(active) * frame > min_pause)
+    for first, last in zip(
+        np.concatenate(([active[0]], active[breaks + 1])),
+        np.concatenate((active[breaks], [active[-1]])),
+    ):
+        start, end = first * frame, (last + 1) * frame
+        if end - start >= min_speech:
+            segments.append((start, end))
+    return segments
+
+
+def analyze_recording(path: str) -> dict:
+    """Measures the real response gap of every turn of a recorded call.
+
+    A turn is the caller's last utterance before the bot starts speaking; its gap
+    is the silence between the caller stopping and the bot's first audio. The bot
+    starting while the caller is still speaking counts as an overlap instead.
+    """
+    with wave.open(path, "rb") as f:
+        sample_rate = f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    samples = samples.reshape(-1, 2)
+    caller = speech_segments(samples[:, CALLER], sample_rate)
+    bot = speech_segments(samples[:, BOT], sample_rate)
+
+    turns, overlaps = [], 0
+    bot_end = 0.0
+    for bot_start, end in bot:
+        spoken = [s for s in caller if bot_end <= s[1] and s[0] < bot_start]
+        if spoken and spoken[-1][1] > bot_start:
+            overlaps += 1
+        elif spoken:
+            caller_end = spoken[-1][1]
+            turns.append(
+                {
+                    "caller_stopped": caller_end,
+                    "bot_started": bot_start,
+                    "gap": bot_start - caller_end,
+                }
+            )
+        bot_end = end
+
+    started_at = None
+    sidecar = os.path.splitext(path)[0] + ".json"
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            started_at = json.load(f)["started_at"]
+
+    return {
+        "path": path,
+        "started_at": started_at,
+        "duration": len(samples) / sample_rate,
+        "greeting": bot[0][0] if bot else None,
+        "turns": turns,
+        "overlaps": overlaps,
+    }
+
+
+def match_log_blocks(report: dict, blocks: list[dict], tolerance: float = 1.0):
+    """Adds the block time of the log block ending when each turn's bot started."""
+    if report["started_at"] is None:
+        return
+    start = datetime.fromtimestamp(report["started_at"])
+    for turn in report["turns"]:
+        bot_started = start + timedelta(seconds=turn["bot_started"])
+        distances = [
+            (abs((b["end_time"] - bot_started).total_seconds()), b) for b in blocks
+        ]
+        distance, block = min(distances, key=lambda d: d[0], default=(None, None))
+        if block and distance < tolerance:
+            turn["block_time"] = block["duration"]
+
+
+def print_recording_report(report: dict):
+    print(f"\n🎙️ Recording Analysis: {report['path']} 🎙️")
+    print("=" * 50)
+    print(f"  Call duration:  {report['duration']:.1f}s")
+    if report["greeting"] is not None:
+        print(f"  First greeting: {report['greeting']:.2f}s into the call")
+    print(f"  Overlaps:       {report['overlaps']} (bot started over the caller)")
+
+    for i, turn in enumerate(report["turns"], 1):
+        line = (
+            f"  Turn #{i:<3} caller stopped at {turn['caller_stopped']:7.2f}s, "
+            f"response gap: {turn['gap']:.4f}s"
+        )
+        if "block_time" in turn:
+            line += f", block time: {turn['block_time']:.4f}s"
+        print(line)
+
+    gaps = [t["gap"] for t in report["turns"]]
+    if gaps:
+        print(
+            f"\n  Response gap:   avg {statistics.mean(gaps):.4f}s, "
+            f"median {statistics.median(gaps):.4f}s, min {min(gaps):.4f}s, "
+            f"max {max(gaps):.4f}s over {len(gaps)} turns"
+        )
+    matched = [t for t in report["turns"] if "block_time" in t]
+    if matched:
+        block_times = [t["block_time"] for t in matched]
+        outside = [t["gap"] - t["block_time"] for t in matched]
+        print(f"  Block time:     avg {statistics.mean(block_times):.4f}s")
+        print(f"  Outside blocks: avg {statistics.mean(outside):.4f}s per turn")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    from analyze_logs import parse_log_blocks, parse_timeline, timeline_blocks
+
+    parser = argparse.ArgumentParser(
+        description="Real response gaps of recorded calls (RECORD_CALLS=true)."
+    )
+    parser.add_argument("recordings", nargs="+", help="WAV files in recordings/")
+    parser.add_argument("--log", help="Bot log or timeline, for the block times")
+    args = parser.parse_args()
+
+    blocks = None
+    if args.log and args.log.endswith(".jsonl"):
+        blocks = timeline_blocks(parse_timeline(args.log) or [])
+    elif args.log:
+        blocks = parse_log_blocks(args.log)
+    for path in args.recordings:
+        report = analyze_recording(path)
+        if blocks:
+            match_log_blocks(report, blocks)
+        print_recording_report(report)
@@ -0,0 +1,110 @@
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from loguru import logger
+
+from pipecat.processors.aggregators.llm_context import LLMContext
+
+from utils import (
+    EventDispatcher,
+    create_claim_state,
+    get_claim_number,
+    get_system_prompt,
+)
+
+######## Call Sessions ########
+
+
+class CallLimitReached(Exception):
+    """Raised when a call arrives while the process is already at its call limit."""
+
+
+class CallSession:
+    """Everything that belongs to a single call.
+
+    Each call gets its own id, register, LLM context and event dispatcher, so
+    concurrent calls in the same process never share conversation state. The
+    models, pools and notification outbox stay process-wide.
+    """
+
+    def __init__(self, call_id: str):
+        self.call_id = call_id
+        self.started_at = time.monotonic()
+        self.claim_number = get_claim_number()
+        self.state = create_claim_state(call_id)
+        self.dispatcher = EventDispatcher(listener_timeout=10)
+        system_prompt = get_system_prompt(self.claim_number)
+        self.context = LLMContext([{"role": "system", "content": system_prompt}])
+
+
+class SessionManager:
+    """Keeps track of the calls in progress and admits at most `max_calls` at once.
+
+    Calls over the limit are rejected straight away, instead of degrading the
+    latency of every call already in progress.
+    """
+
+    def __init__(self, max_calls: int = 50):
+        self.max_calls = max_calls
+        self.sessions = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        return len(self.sessions)
+
+    @asynccontextmanager
+    async def session(self):
+        """Opens a session for a new call, or raises CallLimitReached."""
+        if self.active >= self.max_calls:
+            self.rejected += 1
+            raise CallLimitReached(f"{self.active}/{self.max_calls} calls in progress")
+
+        call_id = uuid.uuid4().hex
+        session = CallSession(call_id)
+        self.sessions[call_id] = session
+        self.admitted += 1
+        try:
+            # Every log line of the call (including pipecat's) carries its id.
+            with logger.contextualize(call_id=call_id):
+                logger.info(f"Call {call_id} started ({self.active} in progress)")
+                yield session
+        finally:
+            del self.sessions[call_id]
+            duration = time.monotonic() - session.started_at
+            logger.info(
+                f"Call {call_id} ended after {duration:.1f}s ({self.active} in progress)"
+            )
+
+    def metrics(self) -> dict:
+        return {
+            "active": self.active,
+            "max_calls": self.max_calls,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+@lru_cache
+def get_session_manager() -> SessionManager:
+    """Returns the process-wide call session manager."""
+    return SessionManager(max_calls=int(os.getenv("MAX_CONCURRENT_CALLS", 50)))
+
+
+def _tag_call_id(record):
+    call_id = record["extra"].get("call_id")
+    if call_id:
+        record["message"] = f"[{call_id}] {record['message']}"
+
+
+def tag_log_lines():
+    """Prefixes the log lines logged during a call with its id, `[<call id>] ...`.
+
+    The id is in every record's extra, but pipecat's runner resets the handlers to
+    the default format, which doesn't print it. A patcher survives that, and lets
+    `analyze_logs.py` split a log shared by concurrent calls into calls.
+    """
+    logger.configure(patcher=_tag_call_id)
@@ -0,0 +1,194 @@
+import json
+import time
+import asyncio
+from functools import partial
+from loguru import logger
+
+from pipecat.frames.frames import Frame, InterimTranscriptionFrame, TranscriptionFrame
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.openai.llm import OpenAILLMService
+
+from utils import LatencyHistogram
+
+######## Speculative LLM ########
+
+
+def _messages_key(messages: list[dict]) -> str:
+    """Key identifying a list of messages, ignoring whitespace differences."""
+    normalized = []
+    for message in messages:
+        message = dict(message)
+        if isinstance(message.get("content"), str):
+            message["content"] = " ".join(message["content"].split())
+        normalized.append(message)
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class Speculation:
+    """A chat completion started before the end of the user's turn.
+
+    Its chunks are buffered as they arrive, so if it's committed the LLM service
+    replays them immediately and then keeps streaming the rest.
+    """
+
+    def __init__(self, key: str, text: str):
+        self.key = key
+        self.text = text
+        self.started_at = time.monotonic()
+        self.first_chunk_at = None
+        self.chunks = 0
+        self.completion_tokens = None
+        self.task = None
+        self._queue = asyncio.Queue()
+
+    async def prefetch(self, request):
+        stream = None
+        try:
+            stream = await request()
+            async for chunk in stream:
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.monotonic()
+                self.chunks += 1
+                if getattr(chunk, "usage", None):
+                    self.completion_tokens = chunk.usage.completion_tokens
+                self._queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            if stream is not None:
+                await stream.close()
+            raise
+        except Exception as e:
+            self._queue.put_nowait(e)
+        finally:
+            self._queue.put_nowait(None)
+
+    async def replay(self):
+        while (chunk := await self._queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    @property
+    def wasted_tokens(self) -> int:
+        # Exact if the stream finished (usage is in the last chunk), otherwise
+        # roughly one token per chunk.
+        return self.completion_tokens or self.chunks
+
+
+class SpeculativeOpenAILLMService(OpenAILLMService):
+    """OpenAILLMService that can start generating before the turn is over.
+
+    `speculate` starts a request for the current context plus the user's text so
+    far, while the turn analyzer is still deciding. When the real request arrives,
+    it is served from the speculation if the messages match (a hit), otherwise the
+    speculation is cancelled and a new request is made (a miss). Speculations
+    replaced by a newer one for a longer transcription are counted apart, as
+    `replaced`: they only cost tokens.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.generations = 0
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0
+        self.wasted_tokens = 0
+        self.saved = LatencyHistogram()
+        self._speculation = None
+
+    def speculate(self, context: LLMContext, user_text: str):
+        """Starts (or restarts) a speculative request for the user's text so far."""
+        if self._speculation and self._speculation.text == user_text:
+            return
+
+        messages = context.get_messages() + [{"role": "user", "content": user_text}]
+        speculative_context = LLMContext(messages, context.tools)
+        params = self.get_llm_adapter().get_llm_invocation_params(speculative_context)
+
+        if self._discard_speculation():
+            self.replaced += 1
+        speculation = Speculation(_messages_key(params["messages"]), user_text)
+        speculation.task = asyncio.create_task(
+            speculation.prefetch(partial(self._request, params))
+        )
+        self._speculation = speculation
+
+    async def _request(self, params):
+        return await super().get_chat_completions(params)
+
+    def _discard_speculation(self) -> bool:
+        """Cancels the current speculation, returns False if there was none."""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return False
+        speculation.task.cancel()
+        self.wasted_tokens += speculation.wasted_tokens
+        return True
+
+    async def get_chat_completions(self, params_from_context):
+        self.generations += 1
+        speculation = self._speculation
+        if speculation and speculation.key == _messages_key(
+            params_from_context["messages"]
+        ):
+            self._speculation = None
+            self.hits += 1
+            # The wait we avoided: up to the first chunk, or until now if it
+            # hasn't arrived yet.
+            now = time.monotonic()
+            saved = min(speculation.first_chunk_at or now, now) - speculation.started_at
+            self.saved.record(saved)
+            logger.debug(f"{self}: speculation hit, {saved:.4f}s saved")
+            return speculation.replay()
+
+        if self._discard_speculation():
+            self.misses += 1
+            logger.debug(f"{self}: speculation miss for [{speculation.text}]")
+        return await super().get_chat_completions(params_from_context)
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (
+            f"Speculation: hits={self.hits} misses={self.misses} "
+            f"replaced={self.replaced} hit_rate={hit_rate:.1%} wasted_tokens={self.wasted_tokens} "
+            f"saved: {self.saved.summary()}"
+        )
+
+
+class SpeculationTrigger(FrameProcessor):
+    """Starts speculative generations from the user's transcriptions.
+
+    Sits between the STT and the user context aggregator and passes every frame
+    through. Final transcriptions of the turn so far trigger a speculation, and so
+    do interim transcriptions once they're stable (the same text twice in a row).
+    """
+
+    def __init__(self, llm: SpeculativeOpenAILLMService, context: LLMContext):
+        super().__init__()
+        self._llm = llm
+        self._context = context
+        self._finals = []
+        self._last_interim = None
+        self._generations = llm.generations
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, (TranscriptionFrame, InterimTranscriptionFrame)):
+            # The LLM ran since the last transcription: this is a new user turn.
+            if self._llm.generations != self._generations:
+                self._generations = self._llm.generations
+                self._finals = []
+                self._last_interim = None
+
+            if isinstance(frame, TranscriptionFrame):
+                self._finals.append(frame.text)
+                self._llm.speculate(self._context, " ".join(self._finals))
+            elif frame.text == self._last_interim:
+                text = " ".join(self._finals + [frame.text])
+                self._llm.speculate(self._context, text)
+            else:
+                self._last_interim = frame.text
+
+        await self.push_frame(frame, direction)
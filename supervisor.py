@@ -0,0 +1,317 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from loguru import logger
+
+from notifications import release_outbox_claims
+
+######## Worker ########
+
+
+def create_app(proxy: str):
+    """The Twilio routes of pipecat's development runner, served by every worker."""
+    from fastapi import FastAPI, WebSocket
+    from fastapi.responses import HTMLResponse
+    from pipecat.runner.types import WebSocketRunnerArguments
+
+    import bot
+
+    app = FastAPI()
+    twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Connect>
+    <Stream url="wss://{proxy}/ws"></Stream>
+  </Connect>
+  <Pause length="40"/>
+</Response>"""
+
+    @app.post("/")
+    async def start_call():
+        return HTMLResponse(content=twiml, media_type="application/xml")
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        await bot.bot(WebSocketRunnerArguments(websocket=websocket))
+
+    return app
+
+
+def listen(host: str, port: int) -> socket.socket:
+    """Opens a listening socket that every worker binds to the same port.
+
+    With SO_REUSEPORT the kernel spreads the incoming connections across the
+    workers, so there's no proxy process in the media path.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, host, port, proxy, heartbeat, calls, drain_timeout):
+    """Entry point of a worker process: warm models, then serve calls until drained."""
+    import uvicorn
+
+    from notifications import get_outbox
+    from pools import get_vad_pool
+    from sessions import get_session_manager
+
+    class WorkerServer(uvicorn.Server):
+        """uvicorn server that drains its calls on SIGTERM instead of dropping them."""
+
+        draining = False
+
+        def handle_exit(self, sig, frame):
+            if self.draining:
+                # Second signal: give up on the calls in progress.
+                return super().handle_exit(sig, frame)
+            logger.info(f"Worker {index} draining")
+            self.draining = True
+
+        async def monitor(self):
+            sessions = get_session_manager()
+            drain_started = None
+            while not self.should_exit:
+                heartbeat.value = time.time()
+                calls.value = sessions.active
+                if self.draining:
+                    if drain_started is None:
+                        # Stop accepting calls, the other workers take the new ones.
+                        drain_started = time.monotonic()
+                        for server in self.servers:
+                            server.close()
+                    elapsed = time.monotonic() - drain_started
+                    if sessions.active == 0 or elapsed > drain_timeout:
+                        self.should_exit = True
+                await asyncio.sleep(0.5)
+
+        async def serve_with_monitor(self, sockets):
+            # Delivers what's left in the outbox (e.g. by the worker this one replaces)
+            # now, instead of on the first claim this worker completes.
+            await get_outbox().start()
+            monitor = asyncio.create_task(self.monitor())
+            await self.serve(sockets=sockets)
+            monitor.cancel()
+
+    # Each worker has its own warm models (Twilio calls don't use the turn analyzer).
+    get_vad_pool().warm()
+    sock = listen(host, port)
+    config = uvicorn.Config(create_app(proxy), log_level="warning")
+    server = WorkerServer(config)
+    logger.info(f"Worker {index} (pid {os.getpid()}) listening on {host}:{port}")
+    asyncio.run(server.serve_with_monitor([sock]))
+    logger.info(f"Worker {index} stopped")
+
+
+######## Supervisor ########
+
+
+class Worker:
+    """A worker process, as seen by the supervisor."""
+
+    def __init__(self, index: int, process, heartbeat, calls):
+        self.index = index
+        self.process = process
+        self.heartbeat = heartbeat
+        self.calls = calls
+        self.started_at = time.time()
+        self.draining = False
+
+    def healthy(self, timeout: float) -> bool:
+        # Heartbeats are written by the worker's event loop, so a blocked loop
+        # stops them as well. Give it time to load the models first.
+        last = max(self.heartbeat.value, self.started_at)
+        return time.time() - last < timeout
+
+
+class Supervisor:
+    """Runs `workers` bot processes sharing one port and keeps them alive.
+
+    Dead or unresponsive workers are restarted. SIGTERM (or Ctrl+C) drains every
+    worker, letting the calls in progress finish before exiting; SIGHUP replaces
+    the workers one by one (e.g. on deploy), each new worker starting before the
+    old one drains.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        host: str,
+        port: int,
+        proxy: str,
+        health_timeout: float = 30,
+        drain_timeout: float = 600,
+    ):
+        self.size = workers
+        self.host = host
+        self.port = port
+        self.proxy = proxy
+        self.health_timeout = health_timeout
+        self.drain_timeout = drain_timeout
+        self.restarts = 0
+        self.workers = []
+        self._mp = multiprocessing.get_context("spawn")
+        self._signal = None
+        # Rolling restart in progress: the workers left to replace, and the old
+        # worker being replaced with the time its current step gives up.
+        self._to_replace = []
+        self._replaced = None
+        self._step_deadline = 0.0
+
+    def start_worker(self, index: int) -> Worker:
+        heartbeat = self._mp.Value("d", 0.0, lock=False)
+        calls = self._mp.Value("i", 0, lock=False)
+        process = self._mp.Process(
+            target=run_worker,
+            args=(
+                index,
+                self.host,
+                self.port,
+                self.proxy,
+                heartbeat,
+                calls,
+                self.drain_timeout,
+            ),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        return Worker(index, process, heartbeat, calls)
+
+    def release(self, worker: Worker):
+        """Cleans up after a worker that's gone: the notifications it was delivering go
+        back to the outbox for the others, and the registers of the calls it didn't
+        finish are saved from their journals.
+        """
+        from utils import recover_claim_journals
+
+        release_outbox_claims(pid=worker.process.pid)
+        recover_claim_journals(pid=worker.process.pid)
+
+    def drain(self, workers: list[Worker]):
+        """Drains the workers and waits for them, killing the ones that overrun."""
+        for worker in workers:
+            # A second SIGTERM would drop its calls.
+            if worker.process.is_alive() and not worker.draining:
+                worker.process.terminate()
+                worker.draining = True
+        deadline = time.monotonic() + self.drain_timeout + 5
+        for worker in workers:
+            worker.process.join(max(0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} did not drain, killing it")
+                worker.process.kill()
+                worker.process.join()
+            self.release(worker)
+
+    def rolling_restart(self):
+        """Starts replacing the workers one by one, see `step_rolling_restart`."""
+        if self._to_replace:
+            logger.info("Rolling restart already in progress")
+            return
+        self._to_replace = list(range(len(self.workers)))
+
+    def step_rolling_restart(self):
+        """Moves the rolling restart forward without blocking.
+
+        It's called on every tick of the supervisor loop, so crashes and signals are
+        still handled while a worker drains. For each worker: start its replacement,
+        wait until the replacement is serving, then drain the old one.
+        """
+        if not self._to_replace:
+            return
+        i = self._to_replace[0]
+        old, now = self._replaced, time.monotonic()
+        if old is None:
+            self._replaced = self.workers[i]
+            self.workers[i] = self.start_worker(self._replaced.index)
+            self._step_deadline = now + self.health_timeout
+        elif not old.draining:
+            if self.workers[i].heartbeat.value > 0 or now > self._step_deadline:
+                old.process.terminate()
+                old.draining = True
+                self._step_deadline = now + self.drain_timeout + 5
+        elif not old.process.is_alive() or now > self._step_deadline:
+            if old.process.is_alive():
+                logger.warning(f"Worker {old.index} did not drain, killing it")
+                old.process.kill()
+            old.process.join()
+            self.release(old)
+            self._replaced = None
+            self._to_replace.pop(0)
+            if not self._to_replace:
+                logger.info("Rolling restart done")
+
+    def check(self):
+        for i, worker in enumerate(self.workers):
+            if not worker.process.is_alive():
+                reason = f"exited with code {worker.process.exitcode}"
+            elif not worker.healthy(self.health_timeout):
+                reason = f"missed heartbeats for {self.health_timeout}s"
+                worker.process.kill()
+                worker.process.join()
+            else:
+                continue
+            logger.error(f"Worker {worker.index} {reason}, restarting it")
+            self.restarts += 1
+            self.release(worker)
+            self.workers[i] = self.start_worker(worker.index)
+
+    def status(self) -> str:
+        calls = ", ".join(f"{w.index}: {w.calls.value}" for w in self.workers)
+        return f"Calls per worker: {calls}, restarts: {self.restarts}"
+
+    def run(self):
+        from utils import recover_claim_journals
+
+        # Once, before any worker can start writing journals or claiming notifications.
+        recover_claim_journals()
+        release_outbox_claims()
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda sig, frame: setattr(self, "_signal", sig))
+
+        self.workers = [self.start_worker(i) for i in range(self.size)]
+        logger.info(f"Started {self.size} workers on {self.host}:{self.port}")
+        last_status = time.monotonic()
+        while True:
+            time.sleep(1)
+            sig, self._signal = self._signal, None
+            if sig == signal.SIGHUP:
+                self.rolling_restart()
+            elif sig is not None:
+                logger.info("Draining all workers")
+                replaced = [self._replaced] if self._replaced else []
+                self.drain(self.workers + replaced)
+                return
+            self.check()
+            self.step_rolling_restart()
+            if time.monotonic() - last_status > 60:
+                logger.info(self.status())
+                last_status = time.monotonic()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the Twilio bot on N workers.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--proxy", "-x", required=True, help="Public proxy host name")
+    parser.add_argument("--health-timeout", type=float, default=30)
+    parser.add_argument("--drain-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    Supervisor(
+        args.workers,
+        args.host,
+        args.port,
+        args.proxy,
+        health_timeout=args.health_timeout,
+        drain_timeout=args.drain_timeout,
+    ).run()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The bot's modules are flat files at the root of the repository.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # They read `data/` relative to the working directory.
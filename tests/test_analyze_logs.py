@@ -0,0 +1,172 @@
+import csv
+import gzip
+import os
+
+import pytest
+
+from analyze_logs import (
+    LogAnalyzer,
+    export_calls,
+    iter_log_files,
+    log_time,
+    metric_outliers,
+    metric_stats,
+    print_metrics_summary,
+)
+
+TURN_LOGGER = "pipecat.audio.turn.smart_turn.base_smart_turn:analyze_end_of_turn:165"
+OUTPUT_LOGGER = "pipecat.transports.base_output:_bot_started_speaking:605"
+METRICS_LOGGER = (
+    "pipecat.processors.metrics.frame_processor_metrics:stop_ttfb_metrics:131"
+)
+RUNNER_LOGGER = "pipecat.pipeline.runner:run:71"
+LINK_LOGGER = "pipecat.processors.frame_processor:link:530"
+
+
+def _line(seconds: float, logger: str, message: str, call_id: str = None) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    timestamp = f"2025-10-15 18:{int(minutes):02d}:{seconds:06.3f}"
+    tag = f"[{call_id}] " if call_id else ""
+    return f"{timestamp} | DEBUG    | {logger} - {tag}{message}\n"
+
+
+def _call(seconds: float, call_id: str, event: str) -> str:
+    return _line(seconds, "sessions:session:72", f"Call {call_id} {event}", call_id)
+
+
+def _turn(seconds: float, call_id: str = None) -> str:
+    message = "End of Turn result: EndOfTurnState.COMPLETE"
+    return _line(seconds, TURN_LOGGER, message, call_id)
+
+
+def _bot_started(seconds: float, call_id: str = None) -> str:
+    return _line(seconds, OUTPUT_LOGGER, "Bot started speaking", call_id)
+
+
+def _ttfb(seconds: float, service: str, value: float, call_id: str = None) -> str:
+    return _line(seconds, METRICS_LOGGER, f"{service} TTFB: {value}", call_id)
+
+
+def test_interleaved_calls_are_split_by_their_tags():
+    lines = [
+        _call(0.0, "aaa", "started"),
+        _call(0.5, "bbb", "started"),
+        _bot_started(1.0, "aaa"),  # Greetings.
+        _bot_started(1.5, "bbb"),
+        _turn(10.0, "aaa"),
+        _turn(10.2, "bbb"),
+        _bot_started(10.7, "bbb"),
+        _bot_started(11.0, "aaa"),
+        _turn(20.0, "bbb"),
+        _bot_started(20.25, "bbb"),
+        _call(30.0, "aaa", "ended"),
+        _call(31.0, "bbb", "ended"),
+    ]
+    analyzer = LogAnalyzer()
+    analyzer.feed(lines)
+
+    calls = {s["call_id"]: s for s in analyzer.sessions}
+    assert calls["aaa"]["block_times"] == [1.0]
+    assert calls["bbb"]["block_times"] == [0.5, 0.25]
+    assert (calls["aaa"]["greeting"], calls["bbb"]["greeting"]) == (1.0, 1.0)
+    assert (calls["aaa"]["duration"], calls["bbb"]["duration"]) == (30.0, 30.5)
+
+
+def test_untagged_metrics_go_to_the_task_of_their_service():
+    def links(task):
+        return [
+            _line(
+                0.0,
+                LINK_LOGGER,
+                f"Linking PipelineTask#{task}::Source -> Pipeline#{task}",
+            ),
+            _line(
+                0.0, LINK_LOGGER, f"Linking Pipeline#{task} -> OpenAILLMService#{task}"
+            ),
+        ]
+
+    def runner(seconds, event, task):
+        message = f"Runner PipelineRunner#{task} {event} running PipelineTask#{task}"
+        return _line(seconds, RUNNER_LOGGER, message)
+
+    lines = [
+        *links(1),
+        runner(0.0, "started", 1),
+        _turn(1.0),  # Only task 1 is running: it's its turn.
+        *links(0),
+        runner(1.1, "started", 0),
+        _ttfb(1.2, "OpenAILLMService#1", 0.3),
+        _ttfb(1.3, "OpenAILLMService#0", 0.4),
+        runner(1.4, "finished", 0),
+        _bot_started(2.0),
+        runner(3.0, "finished", 1),
+    ]
+    analyzer = LogAnalyzer(details=True)
+    analyzer.feed(lines)
+
+    [block] = analyzer.blocks
+    assert block["call_id"] == "PipelineTask#1"
+    assert block["metrics"] == [("TTFB", "OpenAILLMService#1", 0.3)]
+    calls = {s["call_id"]: s["block_times"] for s in analyzer.sessions}
+    assert calls == {"PipelineTask#1": [1.0], "PipelineTask#0": []}
+
+
+def test_export_calls(tmp_path):
+    analyzer = LogAnalyzer()
+    analyzer.feed(
+        [
+            _call(0.0, "aaa", "started"),
+            _turn(10.0, "aaa"),
+            _bot_started(11.5, "aaa"),
+            _call(30.0, "aaa", "ended"),
+        ]
+    )
+    export_calls(analyzer.sessions, tmp_path / "calls.csv")
+
+    with open(tmp_path / "calls.csv") as f:
+        [row] = list(csv.DictReader(f))
+    assert (row["call_id"], row["turns"], row["duration"]) == ("aaa", "1", "30.0")
+    assert (row["block_p50"], row["block_max"]) == ("1.5", "1.5")
+
+
+def test_logs_are_read_from_globs_directories_and_gz(tmp_path):
+    old = tmp_path / "logs" / "bot.log.1.gz"
+    new = tmp_path / "logs" / "bot.log"
+    old.parent.mkdir()
+    with gzip.open(old, "wt") as f:
+        f.write(_ttfb(1.0, "OpenAILLMService#0", 0.5))
+    new.write_text(_ttfb(2.0, "OpenAILLMService#0", 0.7))
+    os.utime(old, (1, 1))  # Rotated logs are older.
+
+    assert iter_log_files([str(tmp_path / "logs")]) == [str(old), str(new)]
+    assert iter_log_files([str(tmp_path / "logs" / "*.gz")]) == [str(old)]
+    analyzer = LogAnalyzer().feed_paths([str(tmp_path / "logs")])
+    series = analyzer.metrics["OpenAILLMService#0"]["TTFB"]
+    assert list(series.values) == [0.5, 0.7]
+    assert analyzer.lines == 2
+
+
+def test_negative_samples_are_counted_apart():
+    stats = metric_stats([0.2, -0.01, 0.4, -0.5])
+    assert (stats["count"], stats["negative"]) == (2, 2)
+    assert stats["min"] == 0.2 and stats["max"] == 0.4
+    assert stats["avg"] == pytest.approx(0.3)
+    assert metric_stats([-1.0]) == {"count": 0, "negative": 1}
+
+
+def test_outliers_are_the_largest_samples_beyond_the_fence(capsys):
+    analyzer = LogAnalyzer()
+    values = [0.30, 0.31, 0.29, 0.32, 0.30, 0.31, 2.5, 0.30, 4.0, -0.2]
+    analyzer.feed(
+        [_ttfb(i, "OpenAILLMService#0", value) for i, value in enumerate(values)]
+    )
+    series = analyzer.metrics["OpenAILLMService#0"]["TTFB"]
+    outliers = metric_outliers(series)
+    assert [value for _, value in outliers] == [4.0, 2.5]
+    assert outliers[0][0] == pytest.approx(log_time(_ttfb(8, "x#0", 0)))
+    assert len(metric_outliers(series, limit=1)) == 1
+
+    print_metrics_summary(analyzer.metrics, outliers=1)
+    output = capsys.readouterr().out
+    assert "Negative: 1" in output
+    assert output.count("Outlier:") == 1 and "Outlier: 4.0000s" in output
@@ -0,0 +1,22 @@
+from pipecat.processors.aggregators.llm_context import LLMContext
+
+from compaction import get_context_compactor
+from utils import ClaimState
+
+
+def test_compaction_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("CONTEXT_MAX_TOKENS", raising=False)
+    state = ClaimState(str(tmp_path / "claim.yaml"))
+    assert get_context_compactor(LLMContext(), state) is None
+
+    monkeypatch.setenv("CONTEXT_MAX_TOKENS", "3000")
+    assert get_context_compactor(LLMContext(), state).max_tokens == 3000
+
+
+def test_no_compaction_with_deferred_extraction(tmp_path, monkeypatch):
+    # The extractor reads the whole transcript after the call; a summary would hide it.
+    monkeypatch.setenv("CONTEXT_MAX_TOKENS", "3000")
+    monkeypatch.setenv("ANSWER_EXTRACTION", "deferred")
+    state = ClaimState(str(tmp_path / "claim.yaml"))
+    assert get_context_compactor(LLMContext(), state) is None
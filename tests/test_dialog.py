@@ -0,0 +1,129 @@
+import asyncio
+
+from pipecat.frames.frames import LLMContextFrame, LLMTextFrame
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection
+
+import utils
+from dialog import ScriptedDialog, get_script
+from utils import ClaimState, EventDispatcher
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.items = []
+
+    async def enqueue(self, data):
+        self.items.append(data)
+
+
+class StubExtractor:
+    """Returns the queued answers, one dict per interpreted turn."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.transcripts = []
+
+    async def extract(self, transcript):
+        self.transcripts.append(transcript)
+        return self.answers.pop(0)
+
+
+def make_dialog(tmp_path, extractor):
+    state = ClaimState(str(tmp_path / "claim.yaml"))
+    dispatcher = EventDispatcher()
+    hang_ups = []
+
+    @dispatcher.event_handler("hang_up")
+    async def on_hang_up():
+        hang_ups.append(True)
+
+    context = LLMContext()
+    dialog = ScriptedDialog(context, state, dispatcher, extractor, "R90E1")
+    pushed = []
+
+    async def push_frame(frame, direction=FrameDirection.DOWNSTREAM):
+        pushed.append(frame)
+
+    dialog.push_frame = push_frame
+    return dialog, context, state, pushed, hang_ups
+
+
+async def turn(dialog, context, pushed, user_text=None):
+    """Feeds one user turn, returns what was pushed downstream."""
+    if user_text:
+        context.add_message({"role": "user", "content": user_text})
+    pushed.clear()
+    await dialog.process_frame(LLMContextFrame(context), FrameDirection.DOWNSTREAM)
+    texts = [f.text for f in pushed if isinstance(f, LLMTextFrame)]
+    if texts:
+        context.add_message({"role": "assistant", "content": texts[0]})
+        return texts[0]
+    return pushed
+
+
+def test_scripted_dialog_walks_through_the_questions(tmp_path, monkeypatch):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(utils, "get_outbox", lambda: outbox)
+    questions = utils.get_questions()
+    script = get_script()
+    extractor = StubExtractor(*({q["key"]: "yes"} for q in questions))
+    dialog, context, state, pushed, hang_ups = make_dialog(tmp_path, extractor)
+
+    async def run():
+        assert await turn(dialog, context, pushed) == script["greeting"]
+        assert dialog.turn_kind == "scripted"
+        # Spaced out so it's read character by character.
+        assert "R 9 0 E 1" in await turn(dialog, context, pushed, "Hello")
+        first = await turn(dialog, context, pushed, "Go ahead")
+        assert first == questions[0]["question"]
+        assert dialog.turn_kind == "scripted"
+
+        for i in range(1, len(questions)):
+            text = await turn(dialog, context, pushed, "yes")
+            assert dialog.turn_kind == "interpreted"
+            assert text == f"{script['acknowledge']} {questions[i]['question']}"
+        text = await turn(dialog, context, pushed, "yes")
+        assert text == f"{script['acknowledge']} {script['goodbye']}"
+
+        # The user answers the goodbye: nothing is said, the call hangs up.
+        assert await turn(dialog, context, pushed, "Bye") == []
+        await state.journal.close()
+
+    asyncio.run(run())
+    assert state.is_complete() and outbox.items == [state.answers]
+    assert len(extractor.transcripts) == len(questions)
+    assert hang_ups == [True]
+
+
+def test_scripted_dialog_hands_off_to_the_llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "get_outbox", lambda: FakeOutbox())
+    questions = utils.get_questions()
+    script = get_script()
+    # Two unclear answers to the first question, then the second is answered.
+    extractor = StubExtractor({}, {}, {questions[1]["key"]: "yes"})
+    dialog, context, state, pushed, _ = make_dialog(tmp_path, extractor)
+
+    async def run():
+        for text in (None, "Hello", "Go ahead"):
+            await turn(dialog, context, pushed, text)
+
+        # The first unclear answer goes to the LLM, with the context frame.
+        frames = await turn(dialog, context, pushed, "What was that?")
+        assert dialog.turn_kind == "llm"
+        assert [type(f) for f in frames] == [LLMContextFrame]
+        context.add_message({"role": "assistant", "content": "Let me repeat."})
+
+        # The second one moves on to the next question.
+        text = await turn(dialog, context, pushed, "I don't know")
+        assert dialog.turn_kind == "interpreted"
+        assert text == f"{script['move_on']} {questions[1]['question']}"
+
+        # Attempts start over with each question.
+        text = await turn(dialog, context, pushed, "yes")
+        assert text == f"{script['acknowledge']} {questions[2]['question']}"
+        await state.journal.close()
+
+    asyncio.run(run())
+    assert questions[0]["key"] not in state.answers
+    assert state.answers[questions[1]["key"]] == "yes"
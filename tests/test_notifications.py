@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+from loguru import logger
+
+import notifications
+from benchmark import FakeSMTPHandler
+from notifications import (
+    EmailBatcher,
+    NotificationOutbox,
+    SMTPConnectionPool,
+    build_email,
+    release_outbox_claims,
+    send_claims_email,
+)
+
+
+class RecordingSMTPHandler(FakeSMTPHandler):
+    """The benchmark's fake SMTP server, counting the messages it accepted."""
+
+    handshake_delay = 0
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+        self.in_data = False
+
+    def reply(self, line):
+        if line.startswith("354"):
+            self.in_data = True
+        elif self.in_data:
+            self.in_data = False
+            self.server.messages += 1
+        super().reply(line)
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RecordingSMTPHandler)
+    server.daemon_threads = True
+    server.messages, server.connections = 0, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("SENDER_EMAIL", "bot@example.com")
+    monkeypatch.setenv("RECIPIENT_EMAIL", "claims@example.com")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _pool(server) -> SMTPConnectionPool:
+    host, port = server.server_address
+    return SMTPConnectionPool(host, port, "user", "password", use_ssl=False)
+
+
+def test_smtp_pool_reuses_connections(smtp_server):
+    pool = _pool(smtp_server)
+    for i in range(5):
+        pool.send_message(build_email([{"claim": i}]))
+    pool.close()
+    assert smtp_server.messages == 5
+    assert pool.handshakes == 1
+
+
+def test_smtp_pool_reconnects_when_the_server_hung_up(smtp_server):
+    pool = _pool(smtp_server)
+    pool.send_message(build_email([{"claim": 1}]))
+    # The server times out the idle connection.
+    for connection in smtp_server.connections:
+        connection.shutdown(socket.SHUT_RDWR)
+    pool.send_message(build_email([{"claim": 2}]))
+    pool.close()
+    assert smtp_server.messages == 2
+    assert pool.handshakes == 2
+
+
+def test_email_batcher_sends_one_digest(smtp_server, monkeypatch):
+    pool = _pool(smtp_server)
+    monkeypatch.setattr(notifications, "get_smtp_pool", lambda: pool)
+    batcher = EmailBatcher(window=0.2, send=send_claims_email)
+
+    async def run():
+        await asyncio.gather(*[batcher({"claim": i}) for i in range(3)])
+
+    asyncio.run(run())
+    pool.close()
+    assert smtp_server.messages == 1
+    assert pool.metrics()["messages"] == 1
+
+
+def test_email_batcher_doesnt_hold_worker_threads():
+    digests = []
+    batcher = EmailBatcher(window=0.3, send=digests.append)
+
+    async def run():
+        # More waiting claims than the default executor has threads.
+        claims = [asyncio.create_task(batcher({"claim": i})) for i in range(64)]
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        await asyncio.to_thread(lambda: None)
+        waited = time.monotonic() - start
+        await asyncio.gather(*claims)
+        return waited
+
+    assert asyncio.run(run()) < 0.1
+    assert [len(claims) for claims in digests] == [64]
+
+
+def test_email_batcher_fails_every_claim_of_a_failed_digest():
+    def send(claims):
+        raise ConnectionError("SMTP server unreachable")
+
+    batcher = EmailBatcher(window=0.1, send=send)
+
+    async def run():
+        return await asyncio.gather(
+            *[batcher({"claim": i}) for i in range(2)], return_exceptions=True
+        )
+
+    errors = asyncio.run(run())
+    assert [type(e) for e in errors] == [ConnectionError, ConnectionError]
+
+
+def test_outbox_shared_by_workers_sends_once(tmp_path):
+    sent = []
+
+    async def notifier(data):
+        await asyncio.sleep(0.05)
+        sent.append(data)
+
+    async def run():
+        first = NotificationOutbox(str(tmp_path), {"test": notifier})
+        await first.enqueue({"claim": 1})
+        # A second worker starting meanwhile re-queues what's pending.
+        second = NotificationOutbox(str(tmp_path), {"test": notifier})
+        await second.start()
+        await asyncio.sleep(0.3)
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(run())
+    assert sent == [{"claim": 1}]
+    assert os.listdir(tmp_path / "pending") == []
+    assert os.listdir(tmp_path / "inflight") == []
+
+
+def test_claims_of_a_dead_worker_are_released(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), {})
+    (tmp_path / "inflight" / "1_abc.4242").write_text("{}")
+    (tmp_path / "inflight" / "2_def.4343").write_text("{}")
+
+    release_outbox_claims(str(tmp_path), pid=4242)
+    assert os.listdir(outbox.pending_dir) == ["1_abc.json"]
+    assert os.listdir(outbox.inflight_dir) == ["2_def.4343"]
+
+
+def test_failed_delivery_is_retried(tmp_path):
+    calls = []
+
+    async def flaky(data):
+        calls.append(data)
+        if len(calls) == 1:
+            raise ConnectionError("down")
+
+    async def run():
+        outbox = NotificationOutbox(str(tmp_path), {"test": flaky}, base_delay=0.05)
+        await outbox.enqueue({"claim": 1})
+        await asyncio.sleep(0.3)
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert os.listdir(tmp_path / "pending") == []
+    assert os.listdir(tmp_path / "inflight") == []
+
+
+def test_failing_notification_is_dead_lettered(tmp_path):
+    async def down(data):
+        raise ConnectionError("down")
+
+    async def run():
+        outbox = NotificationOutbox(
+            str(tmp_path), {"test": down}, max_attempts=2, base_delay=0.01
+        )
+        await outbox.enqueue({"claim": 1})
+        await asyncio.sleep(0.2)
+        await outbox.stop()
+
+    asyncio.run(run())
+    dead = [json.loads(line) for line in open(tmp_path / "dead_letter.jsonl")]
+    assert [(d["data"], d["attempts"]) for d in dead] == [({"claim": 1}, 2)]
+    assert os.listdir(tmp_path / "pending") == []
+    assert os.listdir(tmp_path / "inflight") == []
+
+
+def test_undelivered_notification_is_sent_after_a_restart(tmp_path):
+    sent = []
+
+    async def hangs(data):
+        await asyncio.Event().wait()
+
+    async def notifier(data):
+        sent.append(data)
+
+    async def run():
+        outbox = NotificationOutbox(str(tmp_path), {"test": hangs})
+        await outbox.enqueue({"claim": 1})
+        await asyncio.sleep(0.05)
+        # Stopped in the middle of the delivery: the item goes back to pending.
+        await outbox.stop()
+        assert len(os.listdir(tmp_path / "pending")) == 1
+
+        restarted = NotificationOutbox(str(tmp_path), {"test": notifier})
+        await restarted.start()
+        await asyncio.sleep(0.05)
+        await restarted.stop()
+
+    asyncio.run(run())
+    assert sent == [{"claim": 1}]
+
+
+def test_running_outbox_picks_up_released_claims(tmp_path):
+    sent = []
+
+    async def notifier(data):
+        sent.append(data)
+
+    async def run():
+        outbox = NotificationOutbox(
+            str(tmp_path), {"test": notifier}, rescan_interval=0.05
+        )
+        await outbox.start()
+        # Claimed by a worker that died; the supervisor releases it.
+        item = {
+            "id": "1_abc",
+            "data": {"claim": 1},
+            "channels": ["test"],
+            "attempts": 0,
+        }
+        (tmp_path / "inflight" / "1_abc.4242").write_text(json.dumps(item))
+        release_outbox_claims(str(tmp_path), pid=4242)
+        await asyncio.sleep(0.2)
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert sent == [{"claim": 1}]
+
+
+def test_outbox_worker_is_not_tied_to_the_first_call(tmp_path):
+    call_ids = []
+
+    async def notifier(data):
+        record_call_id = lambda record: call_ids.append(record["extra"].get("call_id"))
+        logger.patch(record_call_id).info(f"Delivering {data}")
+
+    async def run():
+        outbox = NotificationOutbox(str(tmp_path), {"test": notifier})
+        with logger.contextualize(call_id="first"):
+            await outbox.enqueue({"claim": 1})
+        with logger.contextualize(call_id="second"):
+            await outbox.enqueue({"claim": 2})
+        await asyncio.sleep(0.2)
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert call_ids == [None, None]
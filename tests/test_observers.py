@@ -0,0 +1,43 @@
+import asyncio
+
+from pipecat.frames.frames import MetricsFrame
+from pipecat.observers.base_observer import FramePushed
+from pipecat.processors.frame_processor import FrameDirection
+
+from observers import SeenFrames, TurnTimelineObserver, get_timeline_writer
+
+
+def test_timelines_are_opt_in(monkeypatch):
+    monkeypatch.delenv("TIMELINE_FILE", raising=False)
+    get_timeline_writer.cache_clear()
+    assert get_timeline_writer() is None
+    get_timeline_writer.cache_clear()
+
+
+def test_seen_frames_are_bounded():
+    seen = SeenFrames(size=2)
+    assert seen.add(1) and not seen.add(1)
+    seen.add(2)
+    seen.add(3)
+    assert len(seen._ids) == 2
+    assert not seen.add(3) and seen.add(1)
+
+
+def test_frame_hops_are_counted_once():
+    class Writer:
+        records = []
+
+        def append(self, record):
+            self.records.append(record)
+
+    async def run():
+        observer = TurnTimelineObserver("call", Writer())
+        frame = MetricsFrame(data=[])
+        for _ in range(3):  # One push per processor the frame goes through.
+            await observer.on_push_frame(
+                FramePushed(None, None, frame, FrameDirection.DOWNSTREAM, 0)
+            )
+        return observer
+
+    observer = asyncio.run(run())
+    assert len(observer._seen._ids) == 1
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import numpy as np
+
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.asyncio.server import serve
+from websockets.protocol import State
+
+from pools import ConnectionPool, get_vad_pool
+
+VAD_ATTRIBUTES = [
+    "_vad_buffer",
+    "_prev_volume",
+    "_vad_state",
+    "_vad_starting_count",
+    "_vad_stopping_count",
+]
+
+
+def _speech(seconds: float, sample_rate: int = 16000) -> bytes:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.5 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+    return (tone * 16000).astype(np.int16).tobytes()
+
+
+def _state(analyzer) -> dict:
+    model = analyzer._model
+    return {
+        **{name: getattr(analyzer, name) for name in VAD_ATTRIBUTES},
+        "model": (model._state.tolist(), model._context.tolist(), model._last_sr),
+    }
+
+
+def test_pooled_vad_is_like_a_fresh_one(monkeypatch):
+    monkeypatch.setenv("MODEL_POOL_SIZE", "1")
+    monkeypatch.setenv("MODEL_POOL_MAX_SIZE", "1")
+    get_vad_pool.cache_clear()
+    pool = get_vad_pool()
+    pool.warm()
+    fresh = pool.factory()
+    fresh.set_sample_rate(16000)
+
+    async def run():
+        async with pool.checkout() as vad:
+            vad.set_sample_rate(16000)
+            # End the call mid-utterance, with audio left in the buffer.
+            await vad.analyze_audio(_speech(0.5) + b"\x00" * 300)
+            assert _state(vad) != _state(fresh)
+        async with pool.checkout() as again:
+            again.set_sample_rate(16000)
+            assert _state(again) == _state(fresh)
+            audio = _speech(0.3)
+            assert await again.analyze_audio(audio) == await fresh.analyze_audio(audio)
+            assert _state(again) == _state(fresh)
+
+    asyncio.run(run())
+    get_vad_pool.cache_clear()
+
+
+async def _serve():
+    connections = []
+
+    async def handler(websocket):
+        connections.append(websocket)
+        await websocket.wait_closed()
+
+    server = await serve(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, connections, lambda: websocket_connect(f"ws://127.0.0.1:{port}")
+
+
+async def _until(condition, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_connection_pool_refills_after_take():
+    async def run():
+        server, connections, connect = await _serve()
+        pool = ConnectionPool("Test", connect, size=2)
+        assert pool.take() is None  # Nothing open yet: the caller connects.
+        await _until(lambda: pool.metrics()["idle"] == 2)
+        websocket = pool.take()
+        assert websocket.state is State.OPEN
+        await _until(lambda: pool.metrics()["idle"] == 2)
+        assert len(connections) == 3
+        assert (pool.hits, pool.misses) == (1, 1)
+        await websocket.close()
+        await pool.stop()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_connection_pool_replaces_old_connections():
+    async def run():
+        server, connections, connect = await _serve()
+        pool = ConnectionPool("Test", connect, size=1, max_age=0.1, check_interval=0.05)
+        pool.start()
+        await _until(lambda: len(connections) >= 3)
+        # The expired ones were closed by the pool.
+        await _until(lambda: sum(c.state is State.OPEN for c in connections) == 1)
+        await pool.stop()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_connection_pool_drops_connections_that_dont_answer_pings():
+    async def run():
+        server, connections, connect = await _serve()
+        pool = ConnectionPool(
+            "Test", connect, size=1, check_interval=0.05, ping_timeout=0.1
+        )
+        pool.start()
+        await _until(lambda: len(connections) == 1)
+        # The server stops reading, so it never answers the pings.
+        connections[0].transport.pause_reading()
+        # The server sees the replacement before the pool has finished opening it.
+        await _until(lambda: len(connections) == 2 and pool.metrics()["idle"] == 1)
+        await pool.stop()
+        server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+import wave
+
+import numpy as np
+from pipecat.frames.frames import InputAudioRawFrame, OutputAudioRawFrame
+
+from recording import BOT, CALLER, CallRecorder
+
+
+def tone(seconds, value=3000, sample_rate=16000):
+    return np.full(int(seconds * sample_rate), value, dtype=np.int16).tobytes()
+
+
+def test_channels_are_streamed_to_disk_and_aligned(tmp_path):
+    path = str(tmp_path / "call.wav")
+    # A small block, so the WAV is interleaved over several of them.
+    recorder = CallRecorder(path, block=1000)
+    start = recorder._start
+
+    async def run():
+        # The caller speaks 20 ms frames for 0.5 s, the bot answers 1 s later.
+        for i in range(25):
+            frame = InputAudioRawFrame(tone(0.02), sample_rate=16000, num_channels=1)
+            await recorder.write(CALLER, frame, start + (i + 1) * 0.02)
+        frame = OutputAudioRawFrame(tone(0.3, 6000), sample_rate=16000, num_channels=1)
+        await recorder.write(BOT, frame, start + 1.8)
+        # Written in the background while the call goes on.
+        await asyncio.sleep(0.1)
+        assert os.path.getsize(str(tmp_path / "call.caller.pcm")) == 16000
+        return await recorder.save()
+
+    assert asyncio.run(run()) == path
+    with wave.open(path, "rb") as f:
+        assert (f.getnchannels(), f.getframerate()) == (2, 16000)
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    samples = samples.reshape(-1, 2)
+    assert len(samples) == int(1.8 * 16000)
+    assert (samples[:8000, CALLER] == 3000).all() and (
+        samples[8000:, CALLER] == 0
+    ).all()
+    assert (samples[:24000, BOT] == 0).all() and (samples[24000:, BOT] == 6000).all()
+
+    # Only the recording and its start time are left.
+    assert sorted(os.listdir(tmp_path)) == ["call.json", "call.wav"]
+    with open(tmp_path / "call.json") as f:
+        assert json.load(f)["started_at"] == recorder.started_at
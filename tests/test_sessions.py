@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import sessions
+from sessions import CallLimitReached, SessionManager
+from utils import create_claim_state
+
+
+@pytest.fixture(autouse=True)
+def registers(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        sessions,
+        "create_claim_state",
+        lambda call_id: create_claim_state(call_id, str(tmp_path)),
+    )
+
+
+def test_calls_over_the_limit_are_rejected():
+    manager = SessionManager(max_calls=1)
+
+    async def run():
+        async with manager.session() as session:
+            assert manager.sessions == {session.call_id: session}
+            with pytest.raises(CallLimitReached):
+                async with manager.session():
+                    pass
+        # The slot is free again once the call ends.
+        async with manager.session():
+            assert manager.active == 1
+
+    asyncio.run(run())
+    assert manager.metrics() == {
+        "active": 0,
+        "max_calls": 1,
+        "admitted": 2,
+        "rejected": 1,
+    }
+
+
+def test_slot_is_released_when_the_call_fails():
+    manager = SessionManager(max_calls=1)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            async with manager.session():
+                raise RuntimeError("pipeline failed")
+        assert manager.active == 0
+        async with manager.session() as session:
+            assert manager.sessions == {session.call_id: session}
+
+    asyncio.run(run())
+    assert manager.admitted == 2 and manager.rejected == 0
+
+
+def test_sessions_dont_share_state():
+    manager = SessionManager(max_calls=2)
+
+    async def run():
+        async with manager.session() as first, manager.session() as second:
+            assert first.call_id != second.call_id
+            assert first.state.filename != second.state.filename
+            assert first.context is not second.context
+            assert first.dispatcher is not second.dispatcher
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+import asyncio
+
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.services.openai.llm import OpenAILLMService
+
+from speculation import SpeculativeOpenAILLMService
+
+SYSTEM = {"role": "system", "content": "You are an insurance agent."}
+
+
+class Chunk:
+    usage = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Stream:
+    def __init__(self, text):
+        self._chunks = [Chunk(word) for word in text.split()]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+    async def close(self):
+        pass
+
+
+def _params(llm, user_text):
+    context = LLMContext([SYSTEM, {"role": "user", "content": user_text}])
+    return llm.get_llm_adapter().get_llm_invocation_params(context)
+
+
+def test_hits_misses_and_replaced_speculations(monkeypatch):
+    requests = []
+
+    async def stub_request(self, params):
+        requests.append(params["messages"][-1]["content"])
+        return Stream("Reply to " + params["messages"][-1]["content"])
+
+    monkeypatch.setattr(OpenAILLMService, "get_chat_completions", stub_request)
+
+    async def run():
+        llm = SpeculativeOpenAILLMService(api_key="test", model="gpt-4.1")
+        context = LLMContext([SYSTEM])
+
+        # The user keeps talking: the first speculation is replaced, not a miss.
+        llm.speculate(context, "The claim")
+        llm.speculate(context, "The claim is open")
+        await asyncio.sleep(0.01)
+        stream = await llm.get_chat_completions(_params(llm, "The claim is open"))
+        hit = [chunk.text async for chunk in stream]
+
+        # The real request differs from the speculation.
+        llm.speculate(context, "It was")
+        await asyncio.sleep(0.01)
+        stream = await llm.get_chat_completions(_params(llm, "It was approved"))
+        miss = [chunk.text async for chunk in stream]
+        return llm, hit, miss
+
+    llm, hit, miss = asyncio.run(run())
+    assert hit == ["Reply", "to", "The", "claim", "is", "open"]
+    assert miss == ["Reply", "to", "It", "was", "approved"]
+    assert (llm.hits, llm.misses, llm.replaced) == (1, 1, 1)
+    assert "hit_rate=50.0%" in llm.report()
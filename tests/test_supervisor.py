@@ -0,0 +1,92 @@
+import time
+from types import SimpleNamespace
+
+import yaml
+
+from supervisor import Supervisor, Worker
+
+
+class FakeProcess:
+    pid = 0
+    exitcode = None
+
+    def __init__(self):
+        self.alive = True
+        self.terminated = False
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.terminated = True
+
+    def kill(self):
+        self.alive = False
+
+    def join(self, timeout=None):
+        pass
+
+
+def test_rolling_restart_is_driven_by_the_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    supervisor = Supervisor(2, "localhost", 0, "proxy", drain_timeout=600)
+
+    def start_worker(index):
+        heartbeat, calls = SimpleNamespace(value=0.0), SimpleNamespace(value=0)
+        return Worker(index, FakeProcess(), heartbeat, calls)
+
+    supervisor.start_worker = start_worker
+    supervisor.workers = [start_worker(0), start_worker(1)]
+    old = list(supervisor.workers)
+
+    supervisor.rolling_restart()
+    supervisor.step_rolling_restart()
+    new = supervisor.workers[0]
+    assert new is not old[0] and not old[0].process.terminated
+
+    # The old worker only drains once its replacement is serving.
+    supervisor.step_rolling_restart()
+    assert not old[0].process.terminated
+    new.heartbeat.value = 1.0
+    supervisor.step_rolling_restart()
+    assert old[0].process.terminated
+
+    # Each step returns straight away while it drains, so the loop can go on
+    # checking crashes and signals.
+    supervisor.step_rolling_restart()
+    assert supervisor.workers[1] is old[1]
+    old[0].process.alive = False
+    supervisor.step_rolling_restart()
+    supervisor.step_rolling_restart()
+    assert supervisor.workers[1] is not old[1]
+
+
+def test_dead_worker_registers_are_recovered(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    supervisor = Supervisor(1, "localhost", 0, "proxy")
+
+    def start_worker(index):
+        heartbeat, calls = SimpleNamespace(value=time.time()), SimpleNamespace(value=0)
+        return Worker(index, FakeProcess(), heartbeat, calls)
+
+    supervisor.start_worker = start_worker
+    supervisor.workers = [start_worker(0)]
+    dead = supervisor.workers[0].process
+    dead.pid = 1234
+
+    # A call of the worker that dies, and one of a worker still serving.
+    registers = tmp_path / "registers"
+    registers.mkdir()
+    for call_id, pid in (("dead", 1234), ("alive", 5678)):
+        (registers / f"claim_20250101_000000_{call_id}.yaml.journal").write_text(
+            f'{{"pid": {pid}}}\n{{"key": "status", "answer": "open"}}\n'
+        )
+
+    dead.alive = False
+    supervisor.check()
+    assert supervisor.restarts == 1
+    with open(registers / "claim_20250101_000000_dead.yaml") as f:
+        assert yaml.safe_load(f) == {"status": "open"}
+    assert not (registers / "claim_20250101_000000_dead.yaml.journal").exists()
+    assert (registers / "claim_20250101_000000_alive.yaml.journal").exists()
+    assert not (registers / "claim_20250101_000000_alive.yaml").exists()
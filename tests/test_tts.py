@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+from pipecat.frames.frames import (
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    TextFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.aggregators.llm_response_universal import (
+    LLMContextAggregatorPair,
+)
+from pipecat.services.cartesia.tts import CartesiaTTSService
+from pipecat.tests.utils import SleepFrame, run_test
+
+from tts import CachedCartesiaTTSService, ClauseTextAggregator, PhraseCache
+
+VOICE_ID = "test-voice"
+SAMPLE_RATE = 16000
+
+
+async def _noop(self, *args, **kwargs):
+    pass
+
+
+def _cached_tts(tmp_path, monkeypatch, phrases):
+    # No Cartesia websocket and no warming: every phrase is already cached.
+    monkeypatch.setattr(CartesiaTTSService, "_connect", _noop)
+    monkeypatch.setattr(CartesiaTTSService, "_disconnect", _noop)
+    monkeypatch.setattr(CachedCartesiaTTSService, "_warm", _noop)
+    cache = PhraseCache(directory=str(tmp_path / "tts_cache"))
+    for phrase in phrases:
+        cache.put(VOICE_ID, SAMPLE_RATE, phrase, b"\x01\x00" * 1600)
+    return CachedCartesiaTTSService(
+        phrase_cache=cache,
+        api_key="test",
+        voice_id=VOICE_ID,
+        sample_rate=SAMPLE_RATE,
+    )
+
+
+def test_cached_response_is_committed_to_context(tmp_path, monkeypatch):
+    greeting = "Hello, good morning!"
+    tts = _cached_tts(tmp_path, monkeypatch, [greeting])
+    context = LLMContext([{"role": "system", "content": "You are a test."}])
+    assistant = LLMContextAggregatorPair(context).assistant()
+
+    asyncio.run(
+        run_test(
+            Pipeline([tts, assistant]),
+            frames_to_send=[
+                LLMFullResponseStartFrame(),
+                TextFrame(greeting),
+                LLMFullResponseEndFrame(),
+                SleepFrame(0.5),
+            ],
+        )
+    )
+
+    assert tts._phrase_cache.hits == 1
+    assert context.get_messages()[-1] == {"role": "assistant", "content": greeting}
+
+
+def test_cached_chunk_after_remote_chunk_goes_to_cartesia(tmp_path, monkeypatch):
+    sent = []
+
+    async def remote_run_tts(self, text):
+        sent.append(text)
+        yield None
+
+    tts = _cached_tts(tmp_path, monkeypatch, ["Thank you."])
+    monkeypatch.setattr(CartesiaTTSService, "run_tts", remote_run_tts)
+    # Cartesia is synthesizing the first clause of this context.
+    tts._context_id, tts._remote_context = "context", True
+
+    async def run():
+        return [frame async for frame in tts.run_tts("Thank you.")]
+
+    asyncio.run(run())
+    assert sent == ["Thank you."]
+    assert tts._phrase_cache.hits == 0
+
+
+def test_phrase_cache_shared_by_two_processes(tmp_path):
+    directory = str(tmp_path / "tts_cache")
+    clip = b"\x01\x00" * 100
+    first = PhraseCache(directory, max_bytes=len(clip))
+    first.put(VOICE_ID, SAMPLE_RATE, "Hello.", clip)
+    second = PhraseCache(directory, max_bytes=len(clip))
+    third = PhraseCache(directory, max_bytes=len(clip))
+    assert second.assemble(VOICE_ID, SAMPLE_RATE, "Hello.") == clip
+
+    # The first process evicts the clip the second one still has in its index.
+    first.put(VOICE_ID, SAMPLE_RATE, "Goodbye.", clip)
+    assert second.assemble(VOICE_ID, SAMPLE_RATE, "Hello.") is None
+    assert second.metrics()["misses"] == 1
+    assert second.metrics()["entries"] == 0
+
+    # Evicting a clip the other process already removed, without temporary files.
+    third.put(VOICE_ID, SAMPLE_RATE, "Bye.", clip)
+    assert all(name.endswith(".pcm") for name in os.listdir(directory))
+
+
+def test_clause_aggregator_flushes_the_first_clause_early():
+    aggregator = ClauseTextAggregator(first_min_chars=10, min_chars=20)
+
+    async def feed(chunks):
+        return [c for c in [await aggregator.aggregate(t) for t in chunks] if c]
+
+    async def run():
+        clauses = await feed(["Thank you, that ", "helps a lot. The ", "claim is "])
+        # Later clauses wait for the end of a sentence.
+        clauses += await feed(["open, approved on 1.5 ", "days. Next"])
+        remaining = aggregator.text
+        await aggregator.reset()
+        return clauses, remaining
+
+    clauses, remaining = asyncio.run(run())
+    assert clauses == [
+        "Thank you,",
+        " that helps a lot. The claim is open, approved on 1.5 days.",
+    ]
+    assert remaining == " Next"
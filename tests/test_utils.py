@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import yaml
+
+import utils
+from utils import ClaimState, notify_if_complete, register_answers
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.items = []
+
+    async def enqueue(self, data):
+        self.items.append(data)
+
+
+def test_complete_register_is_notified_once(tmp_path, monkeypatch):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(utils, "get_outbox", lambda: outbox)
+    state = ClaimState(str(tmp_path / "claim.yaml"))
+    answers = {q["key"]: "yes" for q in utils.get_questions()}
+
+    async def run():
+        register_answers(state, answers)
+        await notify_if_complete(state)
+        # A correction, or another extraction of the same turn, after completion.
+        register_answers(state, answers)
+        await notify_if_complete(state)
+        await state.journal.close()
+
+    asyncio.run(run())
+    assert outbox.items == [answers]
+
+
+def test_prompt_only_mentions_registering_with_the_tool(monkeypatch):
+    template = utils.PromptTemplate()
+    monkeypatch.setenv("ANSWER_EXTRACTION", "live")
+    assert "register it" in template.render("R90E1")
+    for mode in ("deferred", "parallel"):
+        monkeypatch.setenv("ANSWER_EXTRACTION", mode)
+        prompt = template.render("R90E1")
+        assert "register" not in prompt and "acknowledge it" in prompt
+
+
+def test_prompt_is_reloaded_when_the_template_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("ANSWER_EXTRACTION", "live")
+    path = tmp_path / "system_prompt.txt"
+    path.write_text("Claim {claim_number}: {claim_info}. {on_answer}.")
+    template = utils.PromptTemplate(str(path))
+    first = template.render("R90E1")
+    assert first.startswith("Claim R90E1: [") and first.endswith("acknowledge it.")
+    # Compiled once: rendering again doesn't read the file.
+    parts = template._parts
+    assert template.render("X12") == first.replace("R90E1", "X12")
+    assert template._parts is parts
+
+    path.write_text("Ask about {claim_number}, then {on_answer}. {claim_info}")
+    # Bump the mtime, in case both writes land within the filesystem's resolution.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = template.render("R90E1")
+    assert second.startswith("Ask about R90E1, then register it, acknowledge it.")
+    assert template.render("X12") == second.replace("R90E1", "X12")
+
+
+class StubCompletions:
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_deferred_extraction_registers_the_answers(tmp_path, monkeypatch):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(utils, "get_outbox", lambda: outbox)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    extractor = utils.AnswerExtractor()
+    # An unknown key and an empty answer are left out.
+    completions = StubCompletions(
+        '{"status": "approved", "claim_number": "", "color": "blue"}'
+    )
+    extractor._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    state = ClaimState(str(tmp_path / "claim.yaml"))
+    messages = [
+        {"role": "system", "content": "prompt"},
+        {"role": "assistant", "content": "What is the status?"},
+        {"role": "user", "content": "It was approved."},
+    ]
+
+    async def run():
+        extractor.submit(messages, state)
+        await asyncio.gather(*extractor._tasks)
+
+    asyncio.run(run())
+    transcript = completions.requests[0]["messages"][1]["content"]
+    assert transcript == "Agent: What is the status?\nService center: It was approved."
+    with open(state.filename) as f:
+        assert yaml.safe_load(f) == {"status": "approved"}
+    assert outbox.items == []  # Not every question was answered.
+
+
+def test_unfinished_journal_is_recovered(tmp_path):
+    # A call that crashed mid-write: the last line is truncated.
+    journal = tmp_path / "claim_20250101_000000_abc.yaml.journal"
+    journal.write_text(
+        '{"key": "status", "answer": "open"}\n'
+        '{"key": "status", "answer": "approved"}\n'
+        '{"key": "claim_numb'
+    )
+    utils.recover_claim_journals(str(tmp_path))
+
+    assert not journal.exists()
+    with open(tmp_path / "claim_20250101_000000_abc.yaml") as f:
+        assert yaml.safe_load(f) == {"status": "approved"}
+
+
+def test_claim_state_resumes_and_finalizes_its_journal(tmp_path):
+    filename = str(tmp_path / "claim.yaml")
+
+    async def first_run():
+        state = ClaimState(filename)
+        state.register("status", "open")
+        await state.journal.close()  # The process dies before finalize.
+
+    async def second_run():
+        state = ClaimState(filename)
+        assert state.answers == {"status": "open"}
+        state.register("submission_date", "2025-01-01")
+        await state.finalize()
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert not os.path.exists(filename + ".journal")
+    with open(filename) as f:
+        assert yaml.safe_load(f) == {"status": "open", "submission_date": "2025-01-01"}
+
+
+def test_journal_records_its_owner(tmp_path):
+    filename = str(tmp_path / "claim.yaml")
+
+    async def run():
+        state = ClaimState(filename)
+        state.register("status", "open")
+        state.register("status", "approved")
+        await state.journal.close()
+
+    asyncio.run(run())
+    assert utils.ClaimJournal.owner(filename + ".journal") == os.getpid()
+    assert utils.ClaimJournal.replay(filename + ".journal") == {"status": "approved"}
+
+    # Only the journals of the given process are recovered.
+    utils.recover_claim_journals(str(tmp_path), pid=os.getpid() + 1)
+    assert not os.path.exists(filename)
+    utils.recover_claim_journals(str(tmp_path), pid=os.getpid())
+    with open(filename) as f:
+        assert yaml.safe_load(f) == {"status": "approved"}
+
+
+def test_dispatcher_isolates_slow_and_failing_listeners():
+    dispatcher = utils.EventDispatcher(listener_timeout=0.1)
+    ran = []
+
+    @dispatcher.event_handler("call_ended")
+    async def hangs(context):
+        await asyncio.Event().wait()
+
+    @dispatcher.event_handler("call_ended")
+    async def fails(context):
+        raise RuntimeError("listener bug")
+
+    @dispatcher.event_handler("call_ended")
+    async def works(context):
+        await asyncio.sleep(0.01)
+        ran.append(context)
+
+    async def run():
+        start = time.monotonic()
+        await dispatcher.dispatch("call_ended", "context")
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert ran == ["context"]
+    assert elapsed < 0.5
+    assert len(dispatcher.latencies) == 3
+    assert "call_ended -> test_dispatcher" in dispatcher.latency_report()
@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import uuid
+import string
+import asyncio
+import hashlib
+import contextvars
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+from loguru import logger
+
+from pipecat.frames.frames import StartFrame, TTSAudioRawFrame, TTSStartedFrame
+from pipecat.utils.text.base_text_aggregator import BaseTextAggregator
+
+from notifications import get_http_client
+from pools import PooledCartesiaTTSService
+from utils import get_questions
+
+######## Text Aggregation ########
+
+
+class ClauseTextAggregator(BaseTextAggregator):
+    """Aggregates the streamed LLM text into clauses for the TTS.
+
+    pipecat's default aggregator waits for a full sentence before synthesizing
+    anything. This one flushes the first clause of every response as soon as it
+    ends in any of `first_punctuation` and is at least `first_min_chars` long, so
+    audio can start while the LLM is still generating. After that, it flushes on
+    `punctuation` (sentence ends by default), which keeps the prosody natural.
+
+    A delimiter only counts once the next character has arrived and is whitespace,
+    so numbers like "1.5" are never split.
+    """
+
+    def __init__(
+        self,
+        first_min_chars: int = 10,
+        min_chars: int = 20,
+        first_punctuation: str = ",;:.!?",
+        punctuation: str = ".!?",
+    ):
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.first_punctuation = first_punctuation
+        self.punctuation = punctuation
+        self._text = ""
+        self._flushed = False
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def aggregate(self, text: str) -> Optional[str]:
+        self._text += text
+
+        if self._flushed:
+            punctuation, min_chars = self.punctuation, self.min_chars
+        else:
+            punctuation, min_chars = self.first_punctuation, self.first_min_chars
+
+        for i in range(len(self._text) - 1):
+            if (
+                self._text[i] in punctuation
+                and self._text[i + 1].isspace()
+                and len(self._text[: i + 1].strip()) >= min_chars
+            ):
+                clause, self._text = self._text[: i + 1], self._text[i + 1 :]
+                self._flushed = True
+                return clause
+        return None
+
+    async def handle_interruption(self):
+        await self.reset()
+
+    async def reset(self):
+        # Called at the end of every LLM response: the next one starts a new turn.
+        self._text = ""
+        self._flushed = False
+
+
+def get_text_aggregator() -> ClauseTextAggregator:
+    """Returns a new clause aggregator for a call, configured from the environment."""
+    return ClauseTextAggregator(
+        first_min_chars=int(os.getenv("TTS_FIRST_CLAUSE_MIN_CHARS", 10)),
+        min_chars=int(os.getenv("TTS_CLAUSE_MIN_CHARS", 20)),
+        first_punctuation=os.getenv("TTS_FIRST_CLAUSE_PUNCTUATION", ",;:.!?"),
+        punctuation=os.getenv("TTS_CLAUSE_PUNCTUATION", ".!?"),
+    )
+
+
+######## Phrase Cache ########
+
+
+class PhraseCache:
+    """On-disk cache of synthesized audio, keyed by voice id, sample rate and text.
+
+    Files are raw 16-bit mono PCM in `directory`. An in-memory LRU index keeps the
+    total size under `max_bytes`, evicting the least recently used clips first.
+    Several processes can share the directory: clips are written atomically, and a
+    clip another process evicted is a miss.
+    Spelled-out sequences (e.g. claim numbers like "R 9 0 E 1") are assembled from
+    per-character clips, so they don't need to have been synthesized before.
+    """
+
+    SPELLED_PATTERN = re.compile(r"((?:\b[A-Z0-9]\b ){3,}\b[A-Z0-9]\b)")
+    CHARACTERS = string.ascii_uppercase + string.digits
+
+    def __init__(self, directory: str = "tts_cache", max_bytes: int = 50 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+
+        # Rebuild the index from disk, oldest access first.
+        clips = []
+        for name in os.listdir(directory):
+            if not name.endswith(".pcm"):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue  # Evicted by another process in the meantime.
+            clips.append((stat.st_atime, name.removesuffix(".pcm"), stat.st_size))
+        for _, key, size in sorted(clips):
+            self._index[key] = size
+            self._size += size
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def key(self, voice_id: str, sample_rate: int, text: str) -> str:
+        raw = f"{voice_id}|{sample_rate}|{self.normalize(text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def get(self, voice_id: str, sample_rate: int, text: str) -> Optional[bytes]:
+        key = self.key(voice_id, sample_rate, text)
+        if key not in self._index:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory.
+            self._size -= self._index.pop(key)
+            return None
+        self._index.move_to_end(key)
+        return audio
+
+    def put(self, voice_id: str, sample_rate: int, text: str, audio: bytes):
+        key = self.key(voice_id, sample_rate, text)
+        # Other processes may be reading the clip: never let them see half of it.
+        tmp_path = f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, self._path(key))
+        self._size += len(audio) - self._index.pop(key, 0)
+        self._index[key] = len(audio)
+
+        while self._size > self.max_bytes and len(self._index) > 1:
+            old_key, size = self._index.popitem(last=False)
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass  # Already evicted by another process.
+            self._size -= size
+
+    def assemble(self, voice_id: str, sample_rate: int, text: str) -> Optional[bytes]:
+        """Returns the audio for `text` from cached clips, or None if any is missing."""
+        audio = self._assemble(voice_id, sample_rate, text)
+        if audio is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return audio
+
+    def _assemble(self, voice_id: str, sample_rate: int, text: str):
+        audio = self.get(voice_id, sample_rate, text)
+        if audio is not None or not self.SPELLED_PATTERN.search(text):
+            return audio
+
+        # A short pause between spelled characters, 16-bit samples.
+        gap = b"\x00\x00" * int(sample_rate * 0.08)
+        parts = []
+        for i, segment in enumerate(self.SPELLED_PATTERN.split(text)):
+            if i % 2:
+                clips = [self.get(voice_id, sample_rate, c) for c in segment.split()]
+                if None in clips:
+                    return None
+                parts.append(gap.join(clips))
+            elif segment.strip(" ."):
+                clip = self.get(voice_id, sample_rate, segment)
+                if clip is None:
+                    return None
+                parts.append(clip)
+        return gap.join(parts)
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+@lru_cache
+def get_phrase_cache() -> PhraseCache:
+    """Returns the process-wide TTS phrase cache."""
+    return PhraseCache(max_bytes=int(float(os.getenv("TTS_CACHE_MAX_MB", 50)) * 2**20))
+
+
+def get_cached_phrases() -> list[str]:
+    """Returns the predictable utterances the cache is warmed with."""
+    with open("data/tts_phrases.json", "r") as f:
+        phrases = json.load(f)
+    return phrases + [question["question"] for question in get_questions()]
+
+
+class CachedCartesiaTTSService(PooledCartesiaTTSService):
+    """Cartesia TTS that serves predictable utterances from the phrase cache.
+
+    When a text chunk can be assembled from cached clips it goes straight into the
+    current audio context, without a request to Cartesia. Otherwise Cartesia is
+    used as usual. Missing phrases and characters are synthesized in the
+    background (through Cartesia's HTTP API) when the service starts.
+    """
+
+    # Voices and sample rates already warmed by this process.
+    _warmed = set()
+
+    def __init__(self, *, phrase_cache: PhraseCache, **kwargs):
+        super().__init__(**kwargs)
+        self._phrase_cache = phrase_cache
+        # Whether Cartesia knows about the current audio context.
+        self._remote_context = False
+        self._warm_task = None
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        warm_key = (self._voice_id, self.sample_rate)
+        if warm_key not in self._warmed:
+            self._warmed.add(warm_key)
+            # Warms the cache of the whole process, not just of this call.
+            self._warm_task = asyncio.create_task(
+                self._warm(), context=contextvars.Context()
+            )
+
+    async def _warm(self):
+        cache = self._phrase_cache
+        texts = get_cached_phrases() + list(PhraseCache.CHARACTERS)
+        missing = [
+            t for t in texts if cache.get(self._voice_id, self.sample_rate, t) is None
+        ]
+        if missing:
+            logger.info(f"{self}: warming the phrase cache with {len(missing)} phrases")
+        for text in missing:
+            try:
+                audio = await self._synthesize(text)
+            except Exception as e:
+                logger.warning(f"{self}: could not synthesize [{text}]: {e}")
+                continue
+            cache.put(self._voice_id, self.sample_rate, text, audio)
+
+    async def _synthesize(self, text: str) -> bytes:
+        return await get_http_client().post(
+            f"{os.getenv('CARTESIA_BASE_URL', 'https://api.cartesia.ai')}/tts/bytes",
+            {
+                "model_id": self.model_name,
+                "transcript": text,
+                "voice": {"mode": "id", "id": self._voice_id},
+                "output_format": {
+                    "container": "raw",
+                    "encoding": "pcm_s16le",
+                    "sample_rate": self.sample_rate,
+                },
+                "language": "en",
+            },
+            headers={
+                "X-API-Key": self._api_key,
+                "Cartesia-Version": self._cartesia_version,
+            },
+        )
+
+    async def run_tts(self, text: str):
+        # Once Cartesia has part of a context, the rest goes through it too: cached
+        # audio would be played before the audio Cartesia hasn't sent yet.
+        audio = None
+        if not (self._context_id and self._remote_context):
+            audio = self._phrase_cache.assemble(self._voice_id, self.sample_rate, text)
+        if audio is None:
+            self._remote_context = True
+            async for frame in super().run_tts(text):
+                yield frame
+            return
+
+        logger.debug(f"{self}: serving [{text}] from the phrase cache")
+        # Same audio context handling as CartesiaTTSService, so cached and
+        # synthesized chunks of a response are played in order.
+        if not self._context_id:
+            yield TTSStartedFrame()
+            self._context_id = str(uuid.uuid4())
+            self._remote_context = False
+            await self.create_audio_context(self._context_id)
+        await self.append_to_audio_context(
+            self._context_id, TTSAudioRawFrame(audio, self.sample_rate, 1)
+        )
+        self.start_word_timestamps()
+        await self.add_word_timestamps([(word, 0) for word in text.split()])
+        yield None
+
+    async def flush_audio(self):
+        if self._context_id and not self._remote_context:
+            # Cartesia never saw this context, so it won't send the "done" message
+            # that closes it; close it ourselves, with the same stop and end of
+            # response the receive loop adds (so the aggregator commits the turn).
+            await self.add_word_timestamps([("TTSStoppedFrame", 0), ("Reset", 0)])
+            await self.remove_audio_context(self._context_id)
+            self._context_id = None
+            return
+        await super().flush_audio()
@@ -1,4 +1,9 @@
 import os
+import glob
+import time
+import bisect
+import asyncio
+import contextvars
 import random
 import string
 import json
@@ -7,21 +12,61 @@ from datetime import datetime
 from pipecat.services.llm_service import FunctionCallParams
 from pipecat.adapters.schemas.function_schema import FunctionSchema
 from pipecat.services.openai.llm import OpenAILLMService
+from pipecat.frames.frames import Frame, TranscriptionFrame
+from pipecat.processors.aggregators.llm_context import LLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from functools import lru_cache
 from loguru import logger
 from collections import defaultdict
+from openai import AsyncOpenAI
 
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
-import requests
+from notifications import get_outbox
 
 ######## Event Dispatcher ########
 
 
-class EventDispatcher:
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations, cheap enough to update on every event."""
+
+    # Upper bounds of the buckets, in seconds.
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+
     def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self) -> str:
+        buckets = ", ".join(
+            f"<={bound * 1000:g}ms: {n}"
+            for bound, n in zip(self.BUCKETS, self.counts)
+            if n
+        )
+        avg = self.total / self.count if self.count else 0.0
+        return f"count={self.count} avg={avg * 1000:.1f}ms max={self.max * 1000:.1f}ms [{buckets}]"
+
+
+class EventDispatcher:
+    """Dispatches events to their listeners concurrently.
+
+    Each listener runs with its own timeout (`listener_timeout`, in seconds) and its
+    errors are logged instead of propagated, so a slow or failing listener never
+    delays or breaks the others. Listener latencies are recorded per event name and
+    listener in `latencies`.
+    """
+
+    def __init__(self, listener_timeout: float | None = None):
         self._listeners = defaultdict(list)
+        self.listener_timeout = listener_timeout
+        self.latencies = defaultdict(LatencyHistogram)
+        self._background_tasks = set()
 
     def event_handler(self, event_name: str):
         """Decorator to register a listener for an event."""
@@ -32,10 +77,44 @@ class EventDispatcher:
 
         return decorator
 
+    async def _run_listener(self, event_name: str, listener, args, kwargs):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(listener(*args, **kwargs), self.listener_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Listener {listener.__qualname__} for '{event_name}' timed out"
+            )
+        except Exception as e:
+            logger.exception(
+                f"Listener {listener.__qualname__} for '{event_name}' failed: {e}"
+            )
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latencies[(event_name, listener.__qualname__)].record(elapsed)
+
     async def dispatch(self, event_name: str, *args, **kwargs):
-        if event_name in self._listeners:
-            for listener in self._listeners[event_name]:
-                await listener(*args, **kwargs)
+        """Runs every listener of the event concurrently and waits for all of them."""
+        await asyncio.gather(
+            *(
+                self._run_listener(event_name, listener, args, kwargs)
+                for listener in self._listeners.get(event_name, [])
+            )
+        )
+
+    def dispatch_nowait(self, event_name: str, *args, **kwargs):
+        """Starts the listeners of the event in the background and returns immediately."""
+        task = asyncio.create_task(self.dispatch(event_name, *args, **kwargs))
+        # Keep a reference so the task isn't garbage collected before it finishes.
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def latency_report(self) -> str:
+        """Returns the latency histogram of every event listener, one per line."""
+        return "\n".join(
+            f"{event_name} -> {listener}: {histogram.summary()}"
+            for (event_name, listener), histogram in sorted(self.latencies.items())
+        )
 
 
 ######## System Prompt ########
@@ -65,99 +144,426 @@ def get_questions():
         return json.load(f)
 
 
-def get_system_prompt() -> str:
-    """Constructs the full system prompt by loading a template and formatting it."""
-    # Get a new claim number and the list of questions.
-    claim_number = get_claim_number()
-    claim_info = get_questions()
+class PromptTemplate:
+    """The system prompt template, compiled once and reloaded when the file changes.
 
-    # Load and format the system prompt.
-    with open("data/system_prompt.txt", "r") as f:
-        system_prompt = f.read().strip()
-    return system_prompt.format(claim_number=claim_number, claim_info=claim_info)
+    The template is formatted with the questions up front and split around
+    `{claim_number}`, so rendering a prompt is just joining the pieces with the
+    claim number. The file's mtime is checked on every render, so edits are picked
+    up without restarting the bot. `{on_answer}` depends on the extraction mode:
+    the LLM is only told to register answers when it has the `register_answer` tool.
 
+    Per-call data must stay at the end of the template: everything before it is
+    byte-identical across calls and turns, which is what lets OpenAI's prompt
+    caching reuse it.
+    """
 
-######## Log Answer Tool ########
+    def __init__(self, path: str = "data/system_prompt.txt"):
+        self.path = path
+        self._version = None
+        self._parts = None
 
+    def _compile(self, mode: str):
+        with open(self.path, "r") as f:
+            template = f.read().strip()
+        claim_info = json.dumps(get_questions())
+        on_answer = (
+            "register it, acknowledge it" if mode == "live" else "acknowledge it"
+        )
+        # Keep the placeholder for the claim number, fill in everything else.
+        compiled = template.format(
+            claim_number="{claim_number}", claim_info=claim_info, on_answer=on_answer
+        )
+        self._parts = compiled.split("{claim_number}")
 
-def send_email(data):
-    """Sends an email using SMTP."""
+    def render(self, claim_number: str) -> str:
+        version = (os.stat(self.path).st_mtime_ns, get_extraction_mode())
+        if version != self._version:
+            if self._version is not None:
+                logger.info(f"{self.path} changed, reloading the system prompt")
+            self._compile(version[1])
+            self._version = version
+        return claim_number.join(self._parts)
 
-    logger.info("Sending email with collected data...")
 
-    # Format the data nicely for the email body
-    subject = "Claim Information Collected"
-    body = "The following claim information has been collected:\n\n"
-    body += yaml.dump(data)
+@lru_cache
+def get_prompt_template() -> PromptTemplate:
+    """Returns the process-wide system prompt template."""
+    return PromptTemplate()
+
+
+def get_system_prompt(claim_number: str | None = None) -> str:
+    """Constructs the full system prompt for a call, with a new claim number by default."""
+    return get_prompt_template().render(claim_number or get_claim_number())
+
+
+######## Claim State ########
+
+
+class JsonLinesWriter:
+    """Append-only JSON Lines file, written in the background.
+
+    Appends never touch the disk on the calling coroutine: records are queued and a
+    writer task flushes whatever has accumulated in one write and a single fsync.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = asyncio.Queue()
+        self._writer = None
+
+    def append(self, record: dict):
+        """Queues a record to be written to the journal."""
+        self._queue.put_nowait(record)
+        if self._writer is None:
+            # A writer can be shared by every call (e.g. the timelines), so it
+            # doesn't run in the context (and log with the id) of the first one.
+            self._writer = asyncio.create_task(
+                self._run(), context=contextvars.Context()
+            )
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Failed to write to {self.path}: {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch: list[dict]):
+        with open(self.path, "a") as f:
+            for record in batch:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def close(self):
+        """Waits until every queued record is on disk and stops the writer."""
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        self._writer = None
+
+
+class ClaimJournal(JsonLinesWriter):
+    """Append-only journal of the answers registered during a call.
+
+    Before its first answer, each process writing to the journal records its pid,
+    so the journals of a worker that died can be told apart from those of the
+    calls still in progress (see `recover_claim_journals`).
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._owned = False
+
+    def append(self, record: dict):
+        if not self._owned:
+            self._owned = True
+            super().append({"pid": os.getpid()})
+        super().append(record)
+
+    @staticmethod
+    def _records(path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt journal line in {path}")
+
+    @staticmethod
+    def replay(path: str) -> dict:
+        """Rebuilds the answers from a journal, ignoring a truncated last line."""
+        data = {}
+        for record in ClaimJournal._records(path):
+            if "key" in record:
+                data[record["key"]] = record["answer"]
+        return data
+
+    @staticmethod
+    def owner(path: str) -> int | None:
+        """The pid of the last process that wrote to the journal."""
+        pid = None
+        for record in ClaimJournal._records(path):
+            pid = record.get("pid", pid)
+        return pid
+
+
+class ClaimState:
+    """In-memory answers of a single call, persisted through a ClaimJournal.
+
+    The register YAML is only written once, when the call ends (see `finalize`).
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.journal = ClaimJournal(filename + ".journal")
+        # If a previous run crashed mid-call, pick up from its journal.
+        self.answers = ClaimJournal.replay(self.journal.path)
+        # Set once the completed register has been queued for notification.
+        self.notified = False
+
+    def register(self, key: str, answer: str):
+        """Stores an answer in memory and queues it for the journal."""
+        self.answers[key] = answer
+        self.journal.append({"key": key, "answer": answer})
+
+    def is_complete(self) -> bool:
+        return len(self.answers) >= len(get_questions())
+
+    async def finalize(self):
+        """Flushes the journal and compacts it into the final register YAML."""
+        await self.journal.close()
+        await asyncio.to_thread(compact_journal, self.journal.path, self.filename)
+
+
+def compact_journal(journal_path: str, filename: str):
+    """Writes the answers of a journal to `filename` and removes the journal."""
+    data = ClaimJournal.replay(journal_path)
+    with open(filename, "w") as f:
+        yaml.dump(data, f, indent=2)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    logger.info(f"Register saved to {filename}")
+
+
+def recover_claim_journals(directory: str = "registers", pid: int | None = None):
+    """Compacts journals left behind by calls that never finished (e.g. after a crash).
+
+    With `pid`, only those of the calls of that (dead) process, otherwise all of them.
+    """
+    for journal_path in glob.glob(os.path.join(directory, "*.yaml.journal")):
+        if pid is not None and ClaimJournal.owner(journal_path) != pid:
+            continue
+        logger.warning(f"Recovering unfinished register from {journal_path}")
+        compact_journal(journal_path, journal_path.removesuffix(".journal"))
+
+
+def create_claim_state(call_id: str, directory: str = "registers") -> ClaimState:
+    """Creates the claim state of a new call, with its own register file.
+
+    The call id is part of the file name, since several calls can start within the
+    same second.
+    """
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return ClaimState(os.path.join(directory, f"claim_{timestamp}_{call_id}.yaml"))
+
+
+######## Answer Extraction ########
+
+
+def get_extraction_mode() -> str:
+    """Returns how answers are registered, from ANSWER_EXTRACTION: 'live' (tool calls
+    during the call), 'parallel' (a side-channel LLM listening to the call) or
+    'deferred' (extracted from the transcript after the call).
+    """
+    return os.getenv("ANSWER_EXTRACTION", "live")
+
+
+def format_transcript(messages: list[dict]) -> str:
+    """Formats the conversation of an LLM context as a plain-text transcript."""
+    speakers = {"assistant": "Agent", "user": "Service center"}
+    lines = []
+    for message in messages:
+        speaker = speakers.get(message.get("role"))
+        content = message.get("content")
+        if speaker and isinstance(content, str) and content:
+            lines.append(f"{speaker}: {content}")
+    return "\n".join(lines)
+
+
+class AnswerExtractor:
+    """Extracts every answer of a finished call from its transcript in one LLM call.
+
+    Extractions run as background tasks after the call has ended, at most
+    `max_concurrency` at a time, so they stay off the live calls' critical path.
+    """
+
+    def __init__(self, model: str = "gpt-4.1", max_concurrency: int = 4):
+        self.model = model
+        self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+
+    def spawn(self, coro):
+        """Runs a coroutine in the background, keeping a reference until it's done."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def submit(self, messages: list[dict], state: ClaimState):
+        """Schedules the extraction of a finished call's answers into `state`."""
+        self.spawn(self._run(format_transcript(messages), state))
+
+    async def _run(self, transcript: str, state: ClaimState):
+        async with self._slots:
+            try:
+                answers = await self.extract(transcript)
+            except Exception as e:
+                logger.error(f"Failed to extract answers for {state.filename}: {e}")
+                answers = {}
+
+        register_answers(state, answers)
+        await state.finalize()
+        await notify_if_complete(state)
+
+    async def extract(self, transcript: str) -> dict:
+        """Returns the answers found in the transcript, keyed by question key."""
+        questions = get_questions()
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            response_format={"type": "json_object"},
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You extract answers from the transcript of a call between an "
+                        "insurance agent and a service center. Reply with a JSON object "
+                        "mapping each question key to the answer given by the service "
+                        "center. Leave out the questions that were not answered.\n\n"
+                        f"Questions:\n{json.dumps(questions)}"
+                    ),
+                },
+                {"role": "user", "content": transcript},
+            ],
+        )
+        answers = json.loads(response.choices[0].message.content or "{}")
+        keys = {question["key"] for question in questions}
+        return {k: str(v) for k, v in answers.items() if k in keys and v}
 
-    recipient_email = os.getenv("RECIPIENT_EMAIL")
-    sender_email = os.getenv("SENDER_EMAIL")
-    sender_password = os.getenv("SENDER_PASSWORD")
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 465))
 
-    if not all([sender_email, sender_password]):
-        logger.error(
-            "SENDER_EMAIL or SENDER_PASSWORD environment variables not set. Cannot send email."
-        )
-        return
+@lru_cache
+def get_answer_extractor() -> AnswerExtractor:
+    """Returns the process-wide answer extractor."""
+    return AnswerExtractor(
+        model=os.getenv("EXTRACTION_MODEL", "gpt-4.1"),
+        max_concurrency=int(os.getenv("EXTRACTION_CONCURRENCY", 4)),
+    )
 
-    # Create the email message
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = recipient_email
-    message["Subject"] = subject
-    message.attach(MIMEText(body, "plain"))
 
-    try:
-        # Connect to the server and send the email
+class AnswerListener(FrameProcessor):
+    """Side-channel processor that extracts answers while the conversation goes on.
+
+    It sits before the user context aggregator and passes every frame through
+    untouched. Each final user transcription, with the latest turns of the
+    conversation for context, is sent to the extractor's LLM in the background and
+    the answers are written to the register, so the speaking LLM never has to make
+    a `register_answer` tool call (and its extra round trip) before replying.
+    """
+
+    def __init__(
+        self,
+        context: LLMContext,
+        state: ClaimState,
+        dispatcher: EventDispatcher,
+        extractor: AnswerExtractor,
+        history: int = 4,
+    ):
+        super().__init__()
+        self._context = context
+        self._state = state
+        self._extractor = extractor
+        self._history = history
+        self._pending = set()
+        self.latencies = LatencyHistogram()
+
+        @dispatcher.event_handler("call_ended")
+        async def on_call_ended(context):
+            # Finish in the background, the last extractions may still be running.
+            extractor.spawn(self._finish())
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TranscriptionFrame) and frame.text.strip():
+            messages = self._context.get_messages()[-self._history :]
+            messages = messages + [{"role": "user", "content": frame.text}]
+            task = self._extractor.spawn(self._extract(format_transcript(messages)))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+        await self.push_frame(frame, direction)
+
+    async def _extract(self, transcript: str):
+        start = time.perf_counter()
+        try:
+            answers = await self._extractor.extract(transcript)
+        except Exception as e:
+            logger.error(f"Side-channel extraction failed: {e}")
+            return
+        elapsed = time.perf_counter() - start
+        self.latencies.record(elapsed)
         logger.info(
-            f"Connecting to SMTP server {smtp_server}:{smtp_port} to send email..."
+            f"Side-channel extraction took {elapsed:.4f}s, off the speaking path"
         )
-        with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(message)
-            logger.info(f"Email sent successfully to {recipient_email}")
-    except Exception as e:
-        logger.error(f"Failed to send email: {e}")
+        if answers:
+            register_answers(self._state, answers)
+            await notify_if_complete(self._state)
+
+    async def _finish(self):
+        if self._pending:
+            await asyncio.wait(self._pending)
+        await self._state.finalize()
+        logger.info(
+            f"Block time removed by side-channel extraction: {self.latencies.summary()}"
+        )
+
 
+def get_answer_listener(
+    context: LLMContext, state: ClaimState, dispatcher: EventDispatcher
+) -> AnswerListener | None:
+    """Returns the side-channel answer listener in 'parallel' mode, None otherwise."""
+    if get_extraction_mode() != "parallel":
+        return None
+    return AnswerListener(context, state, dispatcher, get_answer_extractor())
 
-def post_claim_info(data_to_send):
-    logger.info("Posting info to webhook...")
-    url = "https://ntfy.sh/prosper"
 
-    try:
-        requests.post(url, json=data_to_send)
-    except requests.exceptions.RequestException as e:
-        logger.info(f"An error occurred trying to post the claim information: {e}")
+######## Log Answer Tool ########
+
 
+def register_answers(state: ClaimState, answers: dict):
+    """Registers several answers at once in the call's claim state."""
+    for key, answer in answers.items():
+        logger.info(f"Logging answer to {state.filename}: {key} = {answer}")
+        state.register(key, answer)
 
-def register_answer_func(filename: str):
-    """Returns a closure that registers an answer to a specific YAML file."""
 
-    if not os.path.exists(filename):
-        with open(filename, "w") as f:
-            yaml.dump({}, f)
-    num_questions = len(get_questions())
+async def notify_if_complete(state: ClaimState):
+    """Queues the notifications once every question has an answer.
+
+    Only the first time: answers corrected after that don't send the register again.
+    I will get the registers on my email as well. The outbox delivers them in the
+    background, we only wait until the notification is safely queued.
+    """
+    if state.is_complete() and not state.notified:
+        state.notified = True
+        await get_outbox().enqueue(dict(state.answers))
+
+
+def register_answer_func(state: ClaimState):
+    """Returns a closure that registers an answer in the call's claim state."""
 
     async def inner(params: FunctionCallParams):
         """The actual tool handler that logs the key/answer pair."""
         # Extract arguments from the function call.
         key = params.arguments["key"]
         answer = params.arguments["answer"]
-        logger.info(f"Logging answer to {filename}: {key} = {answer}")
+        logger.info(f"Logging answer to {state.filename}: {key} = {answer}")
 
-        # Read the existing data, update it, and write it back to the YAML file.
-        with open(filename, "r") as f:
-            data = yaml.safe_load(f) or {}
-        data[key] = answer
-        with open(filename, "w") as f:
-            yaml.dump(data, f, indent=2)
+        # Update the in-memory state, the journal is written in the background.
+        state.register(key, answer)
 
-        # I will get the registers on my email as well
-        if len(data) >= num_questions:
-            send_email(data)
-            post_claim_info(data)
+        await notify_if_complete(state)
 
         # Send a result back to the LLM.
         await params.result_callback(f"{key} registered")
@@ -176,37 +582,53 @@ def hang_up_func(dispatcher: EventDispatcher):
 
 
 def get_tools(
-    llm: OpenAILLMService, dispatcher: EventDispatcher
+    llm: OpenAILLMService, dispatcher: EventDispatcher, state: ClaimState
 ) -> list[FunctionSchema]:
-    """Creates and registers the 'register_answer' and 'hang_up' tools with the LLM."""
+    """Creates and registers the 'register_answer' and 'hang_up' tools with the LLM.
+
+    The 'register_answer' tool only exists in the 'live' extraction mode; in the
+    other modes the answers are extracted by a separate LLM.
+    """
+    tools = []
 
     ##### Register answer tool #####
 
-    # Create a YAML filename store the answers and register the function.
-    os.makedirs("registers", exist_ok=True)
-    filename = f"registers/claim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.yaml"
-    llm.register_function("register_answer", register_answer_func(filename))
-
-    # Get the list of possible keys for the 'key' argument from the questions file.
-    possible_keys = [question["key"] for question in get_questions()]
-
-    # Define the schema for the 'register_answer' tool.
-    register_answer_tool = FunctionSchema(
-        name="register_answer",
-        description="Registers the extracted answer for a given question key",
-        properties={
-            "key": {
-                "type": "string",
-                "enum": possible_keys,
-                "description": "The key for the question that was answered, e.g. 'submission_date'.",
+    mode = get_extraction_mode()
+    if mode == "deferred":
+
+        @dispatcher.event_handler("call_ended")
+        async def on_call_ended(context):
+            get_answer_extractor().submit(context.get_messages(), state)
+
+    elif mode == "live":
+        llm.register_function("register_answer", register_answer_func(state))
+
+        # Compact the journal into the final register once the call is over.
+        @dispatcher.event_handler("call_ended")
+        async def on_call_ended(context):
+            await state.finalize()
+
+        # Get the list of possible keys for the 'key' argument from the questions file.
+        possible_keys = [question["key"] for question in get_questions()]
+
+        # Define the schema for the 'register_answer' tool.
+        register_answer_tool = FunctionSchema(
+            name="register_answer",
+            description="Registers the extracted answer for a given question key",
+            properties={
+                "key": {
+                    "type": "string",
+                    "enum": possible_keys,
+                    "description": "The key for the question that was answered, e.g. 'submission_date'.",
+                },
+                "answer": {
+                    "type": "string",
+                    "description": "The answer extracted from the user's response.",
+                },
             },
-            "answer": {
-                "type": "string",
-                "description": "The answer extracted from the user's response.",
-            },
-        },
-        required=["key", "answer"],
-    )
+            required=["key", "answer"],
+        )
+        tools.append(register_answer_tool)
 
     ##### Hang up tool #####
     llm.register_function("hang_up", hang_up_func(dispatcher))
@@ -217,7 +639,9 @@ def get_tools(
         required=[],
     )
 
-    return [register_answer_tool, hang_up_tool]
+    tools.append(hang_up_tool)
+
+    return tools
 
 
 """